@@ -1,11 +1,28 @@
-import logging
 from flask import Flask
 from flask_talisman import Talisman
+from app.json_provider import json_codec
+from app.logs import request_logging
+from app.metrics import metrics, metrics_bp
+from app.auth import key_store
 from app.limiter import limiter
+from app.budget import token_budget
+from app.cache import response_cache
+from app.near_duplicates import near_duplicates
+from app.singleflight import single_flight
+from app.clients import openai_clients
+from app.breaker import upstream_guard
+from app.hedging import hedger
+from app.corpus import corpus
 from app.proxy import proxy_bp
-from app.health import health_bp
+from app.health import health_bp, health_monitor
 from app.main import main_bp
 from app.keywords import keywords_bp
+from app.jobs import jobs_bp, job_queue
+from app.extractors import extractors
+from app.chunking import long_documents
+from app.preprocess import preprocessor
+from app.routing import engine_router
+from app.cli import keywords_cli
 from app.config import config
 
 
@@ -15,14 +32,48 @@ def create_app(config_name="default"):
     # Load configuration
     app.config.from_object(config[config_name])
 
-    # Setup logging
-    logging.basicConfig(
-        level=getattr(logging, app.config["LOG_LEVEL"]),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
+    # Setup logging (written by a background thread) and request IDs
+    request_logging.init_app(app)
+
+    # Encode and decode JSON with orjson when it's installed
+    json_codec.init_app(app)
+
+    # Collect request metrics (first, so request timings include the other hooks)
+    metrics.init_app(app)
+
+    # Load the API keys clients authenticate with
+    key_store.init_app(app)
 
     # Initialize rate limiting with the app
     limiter.init_app(app)
+    token_budget.init_app(app)
+
+    # Initialize the keyword response cache and request coalescing
+    response_cache.init_app(app)
+    near_duplicates.init_app(app)
+    single_flight.init_app(app)
+
+    # Configure the pooled OpenAI client (built lazily on first use) and the
+    # circuit breaker, concurrency limit and hedging around its calls
+    openai_clients.init_app(app)
+    upstream_guard.init_app(app)
+    hedger.init_app(app)
+
+    # Load the corpus statistics used for IDF weighting
+    corpus.init_app(app)
+
+    # Configure text preprocessing, the keyword extraction engines,
+    # long-document chunking and the routing between engines
+    preprocessor.init_app(app)
+    extractors.init_app(app)
+    long_documents.init_app(app)
+    engine_router.init_app(app)
+
+    # Probe dependencies in the background for the health endpoints
+    health_monitor.init_app(app)
+
+    # Run queued keyword jobs in background workers
+    job_queue.init_app(app)
 
     # Setup security headers (only in production)
     if config_name == "production":
@@ -35,6 +86,11 @@ def create_app(config_name="default"):
     app.register_blueprint(proxy_bp)
     app.register_blueprint(health_bp)
     app.register_blueprint(keywords_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(metrics_bp)
+
+    # Register CLI commands (flask keywords ...)
+    app.cli.add_command(keywords_cli)
 
     # Register error handlers
     from app.errors import register_error_handlers
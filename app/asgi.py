@@ -0,0 +1,155 @@
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+from app.deadline import request_deadline
+from app.keywords import (
+    KeywordsRequest,
+    admit_keywords_request,
+    cached_extract_async,
+    keywords_answered,
+    keywords_failed,
+)
+
+
+def build_environ(scope, body, max_bytes=None):
+    """WSGI environ for an ASGI HTTP request whose body has been read
+
+    body is None for one over max_bytes, which Flask then refuses with a 413
+    going by its length.
+    """
+    if body is None:
+        body, content_length = b"", str(max_bytes + 1)
+    else:
+        content_length = str(len(body))
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "SERVER_NAME": (scope.get("server") or ("localhost", 80))[0],
+        "SERVER_PORT": str((scope.get("server") or ("localhost", 80))[1]),
+        "REMOTE_ADDR": (scope.get("client") or ("127.0.0.1", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_LENGTH", "CONTENT_TYPE"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    # The body has been read whole, whether or not the client sent a length
+    environ["CONTENT_LENGTH"] = content_length
+    return environ
+
+
+class KeywordsASGIApp:
+    """ASGI app that serves POST /keywords natively async and everything else through Flask
+
+    A sync worker is blocked for the whole upstream call; here the upstream
+    request is awaited, so one process can keep hundreds of extractions in
+    flight. Routes other than POST /keywords run unchanged in Flask via a
+    WSGI-to-ASGI adapter.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == "/keywords" and scope["method"] == "POST":
+            await self.keywords(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def keywords(self, scope, receive, send):
+        """Serve POST /keywords through Flask's request handling, awaiting the extraction
+
+        The request goes through the app's before and after request hooks and
+        error handlers (request IDs and logging, metrics, security headers and
+        HTTPS redirects) and the same checks as the Flask view; only the
+        extraction itself runs on the event loop instead of the Flask view.
+        """
+        app = self.flask_app
+        max_bytes = app.config.get("MAX_CONTENT_LENGTH")
+        content_length = dict(scope["headers"]).get(b"content-length", b"").decode("latin-1")
+        body = await self.read_body(receive, content_length, max_bytes)
+        with app.request_context(build_environ(scope, body, max_bytes)):
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    response = await self.extract()
+            except Exception as exc:
+                response = app.handle_user_exception(exc)
+            response = app.finalize_request(response)
+            await self.send_response(send, response)
+
+    @staticmethod
+    async def extract():
+        """Async counterpart of the Flask /keywords view"""
+        prepared = admit_keywords_request()
+        if not isinstance(prepared, KeywordsRequest):
+            return prepared
+        try:
+            with request_deadline(prepared.deadline):
+                outcome = await cached_extract_async(
+                    prepared.text, prepared.use_cache, prepared.engine
+                )
+        except Exception as exc:
+            return keywords_failed(prepared, exc)
+        return keywords_answered(prepared, *outcome)
+
+    @staticmethod
+    async def read_body(receive, content_length=None, max_bytes=None):
+        """Read the request body, or return None once it exceeds max_bytes"""
+        if max_bytes and content_length and content_length.isdigit():
+            if int(content_length) > max_bytes:
+                return None
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def send_response(send, response):
+        headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in response.headers.items()
+        ]
+        await send(
+            {"type": "http.response.start", "status": response.status_code, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": response.get_data()})
+        response.close()
+
+
+def create_asgi_app(config_name="default"):
+    """Create the Flask app and wrap it for async serving"""
+    return KeywordsASGIApp(create_app(config_name))
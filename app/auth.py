@@ -1,69 +1,209 @@
+import hashlib
+import hmac
+import json
+import logging
 import os
+import threading
+import time
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, g
+from limits import parse_many
+from app.metrics import metrics
 
+logger = logging.getLogger(__name__)
 
-def require_bearer_token(f):
-    """Decorator to require valid bearer token authentication"""
 
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Get the Authorization header
-        auth_header = request.headers.get("Authorization")
-
-        if not auth_header:
-            return (
-                jsonify(
-                    {
-                        "error": "Authentication required",
-                        "message": "Bearer token is required in Authorization header",
-                    }
-                ),
-                401,
-            )
+def expected_api_key(config):
+    """Get the expected API key from config or environment"""
+    return config.get("API_KEY") or os.environ.get("API_KEY")
+
+
+def hash_key(token):
+    """SHA-256 hex digest of an API key, the form keys are stored and looked up in"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def caller_identity(auth_header):
+    """Stable, non-reversible id for the API key in an Authorization header"""
+    return hash_key((auth_header or "").removeprefix("Bearer "))[:16]
+
+
+def parse_bearer_token(auth_header):
+    """Extract the token from an Authorization header, returning (token, error)
+
+    error is an (error_body, status) pair, or None when the header is well formed.
+    """
+    if not auth_header:
+        return None, (
+            {
+                "error": "Authentication required",
+                "message": "Bearer token is required in Authorization header",
+            },
+            401,
+        )
+
+    # Check if it's a Bearer token
+    if not auth_header.startswith("Bearer "):
+        return None, (
+            {
+                "error": "Invalid authentication format",
+                "message": "Authorization header must start with 'Bearer '",
+            },
+            401,
+        )
+
+    # Extract the token
+    parts = auth_header.split(" ")
+    if len(parts) != 2 or not parts[1]:
+        return None, ({"error": "Invalid token", "message": "Bearer token is invalid"}, 401)
+
+    return parts[1], None
+
+
+class ApiKey:
+    """A client's API key, stored by digest, with the limits that apply to it"""
+
+    def __init__(
+        self, digest, name=None, tier=None, rate_limit=None, token_budget=None, engines=None
+    ):
+        self.digest = digest
+        # Same id as caller_identity() gives for the plain key
+        self.id = digest[:16]
+        self.name = name or self.id
+        self.tier = tier or "default"
+        self.rate_limit = rate_limit or None
+        self.token_budget = parse_many(token_budget) if token_budget else None
+        self.engines = frozenset(engines) if engines is not None else None
+
+    def allows_engine(self, engine):
+        return self.engines is None or engine in self.engines
 
-        # Check if it's a Bearer token
-        if not auth_header.startswith("Bearer "):
-            return (
-                jsonify(
-                    {
-                        "error": "Invalid authentication format",
-                        "message": "Authorization header must start with 'Bearer '",
-                    }
-                ),
-                401,
-            )
 
-        # Extract the token
-        parts = auth_header.split(" ")
-        if len(parts) != 2 or not parts[1]:
-            return jsonify({"error": "Invalid token", "message": "Bearer token is invalid"}), 401
-
-        token = parts[1]
-
-        # Get the expected API key from config or environment
-        try:
-            expected_token = current_app.config.get("API_KEY") or os.environ.get("API_KEY")
-        except RuntimeError:
-            # Handle case where app context is not available
-            expected_token = os.environ.get("API_KEY")
-
-        if not expected_token:
-            return (
-                jsonify(
-                    {
-                        "error": "Server configuration error",
-                        "message": "API key not configured on server",
-                    }
-                ),
+def file_state(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class KeyStore:
+    """API keys indexed by SHA-256 digest, loaded once and reloaded when the key file changes
+
+    A lookup hashes the presented token and finds the digest in a dict, so
+    authentication costs the same with one key or a hundred thousand. The
+    stored digest is then checked with hmac.compare_digest. API_KEYS_FILE is a
+    JSON file of keys and tiers; the single API_KEY setting is also accepted.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.reload_interval = 5.0
+        self.default_key = None
+        self._keys = {}
+        self._file_state = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.path = config.get("API_KEYS_FILE") or None
+        self.reload_interval = config.get("API_KEYS_RELOAD_INTERVAL", 5.0)
+        self.default_key = expected_api_key(config)
+        self.load()
+
+    def load(self):
+        """Read every key and swap them in at once"""
+        keys = {}
+        if self.default_key:
+            key = ApiKey(hash_key(self.default_key), name="default")
+            keys[key.digest] = key
+        state = None
+        if self.path:
+            state = file_state(self.path)
+            with open(self.path) as f:
+                data = json.load(f)
+            tiers = data.get("tiers", {})
+            for entry in data.get("keys", []):
+                # Key settings override those of its tier
+                settings = {**tiers.get(entry.get("tier"), {}), **entry}
+                key = ApiKey(
+                    settings["sha256"].lower(),
+                    name=settings.get("name"),
+                    tier=settings.get("tier"),
+                    rate_limit=settings.get("rate_limit"),
+                    token_budget=settings.get("token_budget"),
+                    engines=settings.get("engines"),
+                )
+                keys[key.digest] = key
+            logger.info("Loaded %d API keys from %s", len(keys), self.path)
+        self._keys = keys
+        self._file_state = state
+        self._checked_at = time.monotonic()
+
+    def maybe_reload(self):
+        """Reload the key file if it changed, checking at most every reload_interval seconds"""
+        if not self.path or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                if file_state(self.path) != self._file_state:
+                    self.load()
+            except (OSError, ValueError, KeyError) as exc:
+                # A half-written or broken file must not lock every client out
+                logger.error("Keeping current API keys, reloading %s failed: %s", self.path, exc)
+
+    def lookup(self, token):
+        """The ApiKey for a token, or None"""
+        digest = hash_key(token)
+        key = self._keys.get(digest)
+        if key is not None and hmac.compare_digest(key.digest, digest):
+            return key
+        return None
+
+    def authenticate(self, auth_header):
+        """Validate an Authorization header, returning (api_key, None) or (None, error)"""
+        token, error = parse_bearer_token(auth_header)
+        if error is not None:
+            return None, error
+
+        self.maybe_reload()
+        if not self._keys:
+            return None, (
+                {
+                    "error": "Server configuration error",
+                    "message": "API key not configured on server",
+                },
                 500,
             )
 
         # Validate the token
-        if token != expected_token:
-            return jsonify({"error": "Invalid token", "message": "Bearer token is invalid"}), 401
+        key = self.lookup(token)
+        if key is None:
+            return None, ({"error": "Invalid token", "message": "Bearer token is invalid"}, 401)
+        return key, None
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# Global API key store
+key_store = KeyStore()
+
+
+def require_bearer_token(f):
+    """Decorator to require valid bearer token authentication"""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with metrics.stage("auth"):
+            api_key, error = key_store.authenticate(request.headers.get("Authorization"))
+        if error is not None:
+            body, status = error
+            return jsonify(body), status
 
         # Token is valid, proceed with the request
+        g.api_key = api_key
         return f(*args, **kwargs)
 
     return decorated_function
@@ -0,0 +1,301 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from app.clients import retryable_errors
+from app.deadline import DeadlineExceeded
+from app.metrics import CIRCUIT_STATE, CONCURRENCY_LIMIT, INFLIGHT, UPSTREAM_REJECTED, metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream call was shed because the upstream is failing or saturated"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class CircuitBreaker:
+    """Stops calling the upstream while most recent calls fail or are slow
+
+    Outcomes of the calls in the last ``window`` seconds are kept. Once there
+    are at least ``min_calls`` of them and the share of failures or of calls
+    slower than ``slow_call`` seconds reaches its threshold, the circuit opens
+    and calls are refused for ``open_seconds``. It then lets ``half_open_calls``
+    trial calls through: if they all succeed it closes, otherwise it opens again.
+    """
+
+    def __init__(
+        self,
+        window=30.0,
+        min_calls=20,
+        error_rate=0.5,
+        slow_call=10.0,
+        slow_rate=0.5,
+        open_seconds=30.0,
+        half_open_calls=3,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.trips = 0
+        self._lock = threading.Lock()
+        self._close()
+
+    def _close(self):
+        self.state = CLOSED
+        self.opened_at = None
+        self._outcomes = deque()
+        self._failures = 0
+        self._slow = 0
+        self._trials = 0
+        self._successes = 0
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+
+    def _prune(self, now):
+        outcomes = self._outcomes
+        while outcomes and outcomes[0][0] <= now - self.window:
+            _, failed, slow = outcomes.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def before_call(self):
+        """Admit a call, or return the seconds until the circuit may let calls through"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - now
+                if remaining > 0:
+                    return remaining
+                self.state = HALF_OPEN
+                self._trials = 0
+                self._successes = 0
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    # Wait for the trial calls in progress
+                    return 1
+                self._trials += 1
+        return None
+
+    def cancel(self):
+        """Give back an admitted call that was never made"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record(self, seconds, failed):
+        """Record the outcome of an admitted call"""
+        now = time.monotonic()
+        slow = seconds is not None and seconds >= self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._successes += 1
+                    if self._successes >= self.half_open_calls:
+                        self._close()
+                return
+            if self.state == OPEN:
+                # Admitted before the circuit opened
+                return
+            self._outcomes.append((now, failed, slow))
+            self._failures += failed
+            self._slow += slow
+            self._prune(now)
+            calls = len(self._outcomes)
+            if calls >= self.min_calls and (
+                self._failures >= self.error_rate * calls or self._slow >= self.slow_rate * calls
+            ):
+                self._open(now)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = len(self._outcomes)
+            stats = {
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(self._failures / calls, 3) if calls else 0.0,
+                "slow_rate": round(self._slow / calls, 3) if calls else 0.0,
+                "trips": self.trips,
+            }
+            if self.state == OPEN:
+                stats["retry_after"] = round(max(self.opened_at + self.open_seconds - now, 0), 3)
+        return stats
+
+
+class AdaptiveConcurrencyLimit:
+    """AIMD limit on concurrent upstream calls
+
+    Each call that succeeds within ``latency_target`` seconds while the limit
+    is in use raises the limit by 1/limit (about one per limit's worth of
+    calls); a failure or a slower call multiplies it by ``backoff``. Calls over
+    the limit are refused at once instead of queueing behind a slow upstream.
+    """
+
+    def __init__(self, initial=50, min_limit=2, max_limit=500, latency_target=5.0, backoff=0.9):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(initial)
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot for a call, or return False when the limit is reached"""
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, seconds, failed):
+        """Free a call's slot and adjust the limit by its outcome (None: no signal)"""
+        with self._lock:
+            busy = self.inflight >= self.limit / 2
+            self.inflight -= 1
+            if failed or (seconds is not None and seconds > self.latency_target):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif seconds is not None and busy:
+                # Only grow a limit that's actually being used
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self):
+        with self._lock:
+            return {"limit": round(self.limit, 2), "inflight": self.inflight}
+
+
+class UpstreamGuard:
+    """Circuit breaker and adaptive concurrency limit around upstream calls
+
+    Both are per worker process. A refused call raises UpstreamUnavailable,
+    which the endpoints answer with 503 and Retry-After, or which lets a
+    configured fallback engine answer instead.
+    """
+
+    def __init__(self):
+        self.breaker_enabled = True
+        self.concurrency_enabled = True
+        self._settings = {}
+        self._after_fork()
+
+    def init_app(self, app):
+        config = app.config
+        self.breaker_enabled = config.get("UPSTREAM_BREAKER_ENABLED", True)
+        self.concurrency_enabled = config.get("UPSTREAM_CONCURRENCY_ENABLED", True)
+        self._settings = {
+            "breaker": {
+                "window": config.get("UPSTREAM_BREAKER_WINDOW", 30.0),
+                "min_calls": config.get("UPSTREAM_BREAKER_MIN_CALLS", 20),
+                "error_rate": config.get("UPSTREAM_BREAKER_ERROR_RATE", 0.5),
+                "slow_call": config.get("UPSTREAM_BREAKER_SLOW_CALL", 10.0),
+                "slow_rate": config.get("UPSTREAM_BREAKER_SLOW_RATE", 0.5),
+                "open_seconds": config.get("UPSTREAM_BREAKER_OPEN_SECONDS", 30.0),
+                "half_open_calls": config.get("UPSTREAM_BREAKER_HALF_OPEN_CALLS", 3),
+            },
+            "concurrency": {
+                "initial": config.get("UPSTREAM_CONCURRENCY_INITIAL", 50),
+                "min_limit": config.get("UPSTREAM_CONCURRENCY_MIN", 2),
+                "max_limit": config.get("UPSTREAM_CONCURRENCY_MAX", 500),
+                "latency_target": config.get("UPSTREAM_CONCURRENCY_LATENCY_TARGET", 5.0),
+                "backoff": config.get("UPSTREAM_CONCURRENCY_BACKOFF", 0.9),
+            },
+        }
+        self._after_fork()
+        self._export()
+
+    def _after_fork(self):
+        # Each worker judges the upstream by its own calls
+        self.breaker = CircuitBreaker(**self._settings.get("breaker", {}))
+        self.concurrency = AdaptiveConcurrencyLimit(**self._settings.get("concurrency", {}))
+
+    def _export(self):
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            metrics.set(CIRCUIT_STATE, int(self.breaker.state == state), state=state)
+        metrics.set(CONCURRENCY_LIMIT, round(self.concurrency.limit, 2))
+        metrics.set(INFLIGHT, self.concurrency.inflight)
+
+    def _reject(self, reason, message, retry_after):
+        metrics.inc(UPSTREAM_REJECTED, reason=reason)
+        self._export()
+        raise UpstreamUnavailable(message, retry_after)
+
+    @contextmanager
+    def call(self, timed=True):
+        """Guard the enclosed upstream call
+
+        With timed=False (streams, whose duration says little about the
+        upstream's health) only the outcome counts, not the latency.
+        """
+        breaker = self.breaker if self.breaker_enabled else None
+        concurrency = self.concurrency if self.concurrency_enabled else None
+        if breaker is not None:
+            retry_after = breaker.before_call()
+            if retry_after is not None:
+                self._reject("circuit_open", "Upstream circuit breaker is open", retry_after)
+        if concurrency is not None and not concurrency.acquire():
+            if breaker is not None:
+                breaker.cancel()
+            self._reject("concurrency", "Too many concurrent upstream calls", 1)
+        self._export()
+
+        started = time.perf_counter()
+        failed = False
+        answered = False
+        try:
+            yield
+            answered = True
+        except DeadlineExceeded:
+            # Cut short by the client's deadline, which says nothing about the upstream
+            raise
+        except retryable_errors():
+            failed = True
+            raise
+        except Exception:
+            # Any other error means the upstream answered (e.g. 400)
+            answered = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started if timed else None
+            if breaker is not None:
+                if answered or failed:
+                    breaker.record(seconds, failed)
+                else:
+                    breaker.cancel()
+            if concurrency is not None:
+                concurrency.release(seconds if answered else None, failed)
+            self._export()
+
+    def stats(self):
+        """Breaker and concurrency state for the health report"""
+        stats = {}
+        if self.breaker_enabled:
+            stats["circuit"] = self.breaker.stats()
+        if self.concurrency_enabled:
+            stats["concurrency"] = self.concurrency.stats()
+        return stats
+
+
+# Global upstream guard
+upstream_guard = UpstreamGuard()
+
+# Each gunicorn worker starts with a closed circuit and the initial limit
+os.register_at_fork(after_in_child=upstream_guard._after_fork)
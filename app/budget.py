@@ -0,0 +1,114 @@
+import math
+import time
+
+from limits import parse_many
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from app.limiter import limiter
+
+# Rough average for English text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Estimate the number of input tokens in text without calling a tokenizer"""
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+class TokenBudget:
+    """Per-caller budgets of estimated upstream input tokens
+
+    Budgets are limit strings counted in tokens instead of requests, e.g.
+    "20000 per minute; 200000 per hour", and are charged against the same
+    storage as the request rate limits.
+    """
+
+    def __init__(self):
+        self.limits = []
+
+    def init_app(self, app):
+        value = app.config.get("KEYWORDS_TOKEN_BUDGET")
+        self.limits = parse_many(value) if value else []
+
+    @property
+    def enabled(self):
+        return bool(self.limits)
+
+    def charge(self, caller, tokens, limits=None):
+        """Charge tokens to a caller's budgets
+
+        Returns (allowed, headers); nothing is charged unless every budget has
+        room for the request. ``limits`` replaces the configured budgets, for
+        callers whose API key has its own.
+        """
+        limits = self.limits if limits is None else limits
+        strategy = limiter.limiter
+        allowed = tokens == 0 or all(
+            strategy.test(limit, "tokens", caller, cost=tokens) for limit in limits
+        )
+        if allowed and tokens:
+            allowed = all(strategy.hit(limit, "tokens", caller, cost=tokens) for limit in limits)
+        return allowed, self.headers(caller, tokens, allowed, limits)
+
+    def windows(self, caller, limits=None):
+        """When each of the caller's budget windows ends, to refund against later
+
+        None stands for a budget whose charges can't be refunded, under the
+        moving-window strategy.
+        """
+        return [
+            self._window_end(limit, caller) for limit in (self.limits if limits is None else limits)
+        ]
+
+    def refund(self, caller, tokens, windows, limits=None):
+        """Give back tokens charged for upstream calls that weren't made or failed
+
+        ``windows`` is what windows() returned when the tokens were charged;
+        budgets whose window has rolled over since keep the charge, as the
+        tokens were never counted in the current one. Refunds go through the
+        storage's own counters, so they work with any limits storage.
+        """
+        strategy = limiter.limiter
+        storage = strategy.storage
+        for limit, charged in zip(self.limits if limits is None else limits, windows):
+            expiry = limit.get_expiry()
+            if charged is None or abs(self._window_end(limit, caller) - charged) > expiry / 2:
+                continue
+            key = limit.key_for("tokens", caller)
+            if isinstance(strategy, SlidingWindowCounterRateLimiter):
+                storage.acquire_sliding_window_entry(key, limit.amount, expiry, -tokens)
+            else:
+                storage.incr(key, expiry, amount=-tokens)
+
+    def _window_end(self, limit, caller):
+        strategy = limiter.limiter
+        key = limit.key_for("tokens", caller)
+        if isinstance(strategy, SlidingWindowCounterRateLimiter):
+            # The current window's counter outlives it by one expiry either way
+            return time.time() + strategy.storage.get_sliding_window(key, limit.get_expiry())[3]
+        if isinstance(strategy, FixedWindowRateLimiter):
+            return strategy.storage.get_expiry(key)
+        return None
+
+    def headers(self, caller, tokens, allowed=True, limits=None):
+        """Remaining-budget headers for the caller's most constrained budget"""
+        limit, stats = min(
+            (
+                (limit, limiter.limiter.get_window_stats(limit, "tokens", caller))
+                for limit in (self.limits if limits is None else limits)
+            ),
+            key=lambda item: item[1].remaining,
+        )
+        headers = {
+            "X-TokenBudget-Limit": str(limit.amount),
+            "X-TokenBudget-Remaining": str(stats.remaining),
+            "X-TokenBudget-Reset": str(int(stats.reset_time)),
+            "X-TokenBudget-Cost": str(tokens),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(stats.reset_time - time.time())))
+        return headers
+
+
+# Global token budget
+token_budget = TokenBudget()
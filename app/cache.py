@@ -0,0 +1,230 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app.json_provider import json_codec
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different re-posts share a cache entry"""
+    return " ".join(text.split())
+
+
+def make_cache_key(text, model, system_prompt):
+    """Build a content-addressed cache key from the text, model and system prompt"""
+    digest = hashlib.sha256()
+    for part in (model, system_prompt, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class MemoryCacheBackend:
+    """Bounded in-process LRU cache with a per-entry TTL"""
+
+    name = "memory"
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Cache stored in a SQLite file so every worker on the host shares one copy"""
+
+    name = "sqlite"
+
+    def __init__(self, path, max_entries=10000, ttl=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS keyword_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS keyword_cache_accessed "
+                "ON keyword_cache (accessed_at)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS keyword_inflight ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # SQLite connections can't be shared between threads, so keep one per thread,
+        # and not with a forked worker either (a preloaded app opens them in the master)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM keyword_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM keyword_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE keyword_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json_codec.loads(value)
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO keyword_cache (key, value, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, json_codec.dumps(value), now + self.ttl, now),
+        )
+        conn.execute(
+            "DELETE FROM keyword_cache WHERE key IN ("
+            "SELECT key FROM keyword_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        self._connect().execute("DELETE FROM keyword_cache")
+
+    def claim(self, key, owner, ttl):
+        """Mark key as being computed by owner, unless another live owner holds it"""
+        now = time.time()
+        row = (
+            self._connect()
+            .execute(
+                "INSERT INTO keyword_inflight (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE keyword_inflight.expires_at <= ? RETURNING owner",
+                (key, owner, now + ttl, now),
+            )
+            .fetchone()
+        )
+        return row is not None
+
+    def release(self, key, owner):
+        self._connect().execute(
+            "DELETE FROM keyword_inflight WHERE key = ? AND owner = ?", (key, owner)
+        )
+
+    def ping(self):
+        """Read from the cache file, raising if it can't be reached"""
+        self._connect().execute("SELECT 1 FROM keyword_cache LIMIT 1").fetchall()
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM keyword_cache").fetchone()[0]
+
+
+def backend_from_uri(uri, max_entries, ttl):
+    """Create a shared cache backend from a URI, or None for in-process only"""
+    if not uri or uri == "memory://":
+        return None
+    if uri.startswith("sqlite:///"):
+        return SQLiteCacheBackend(uri.removeprefix("sqlite:///"), max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unsupported cache URI: {uri}")
+
+
+class ResponseCache:
+    """Two-tier keyword response cache: in-process LRU in front of an optional shared backend"""
+
+    def __init__(self):
+        self.enabled = False
+        self.local = MemoryCacheBackend()
+        self.shared = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("CACHE_ENABLED", True)
+        ttl = config.get("CACHE_TTL", 3600)
+        max_entries = config.get("CACHE_MAX_ENTRIES", 1024)
+        self.local = MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+        self.shared = backend_from_uri(
+            config.get("CACHE_URI", "memory://"),
+            max_entries=config.get("CACHE_SHARED_MAX_ENTRIES", max_entries),
+            ttl=ttl,
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Look up a cached response, counting the hit or miss"""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        """Hit/miss counters for this worker process"""
+        return {
+            "enabled": self.enabled,
+            "backend": self.shared.name if self.shared is not None else self.local.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.local),
+        }
+
+
+# Global cache instance
+response_cache = ResponseCache()
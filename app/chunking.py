@@ -0,0 +1,125 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from app.budget import CHARS_PER_TOKEN, estimate_tokens
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# Split after sentence-ending punctuation followed by whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _pieces(text, max_tokens):
+    """Paragraphs, split further into sentences and then hard-wrapped until each fits"""
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+            width = max_tokens * CHARS_PER_TOKEN
+            for start in range(0, len(sentence), width):
+                end = start + width
+                yield sentence[start:end]
+
+
+def split_chunks(text, max_tokens):
+    """Pack paragraphs (or sentences) into chunks of at most max_tokens estimated tokens"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in _pieces(text, max_tokens):
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def merge_keywords(chunk_results, max_keywords):
+    """Merge per-chunk keyword lists into one ranked, de-duplicated list
+
+    Each occurrence scores by its rank within the chunk, and chunks nearer the
+    start of the document count more, so keywords that recur across the
+    document or lead its opening sections rank first. Keywords are compared
+    case-insensitively and keep the spelling they were first seen with.
+    """
+    scores = {}
+    spelling = {}
+    total = len(chunk_results)
+    for position, result in enumerate(chunk_results):
+        position_weight = 1.0 - 0.5 * position / total
+        for rank, keyword in enumerate(result.get("keywords", [])):
+            key = " ".join(keyword.casefold().split())
+            if not key:
+                continue
+            spelling.setdefault(key, keyword.strip())
+            scores[key] = scores.get(key, 0.0) + position_weight / (rank + 1)
+    # Python's sort is stable, so ties keep first-seen order
+    ranked = sorted(scores, key=lambda key: -scores[key])
+    return {"keywords": [spelling[key] for key in ranked[:max_keywords]]}
+
+
+class LongDocuments:
+    """Map-reduce extraction for documents too large to send upstream in one call"""
+
+    def __init__(self):
+        self.threshold = 6000
+        self.chunk_tokens = 2000
+        self.concurrency = 4
+        self.max_keywords = 20
+
+    def init_app(self, app):
+        config = app.config
+        self.threshold = config.get("LONG_DOCUMENT_TOKENS", 6000)
+        self.chunk_tokens = config.get("CHUNK_TOKENS", 2000)
+        self.concurrency = config.get("CHUNK_CONCURRENCY", 4)
+        self.max_keywords = config.get("CHUNK_MAX_KEYWORDS", 20)
+
+    def is_long(self, extractor, text):
+        """Whether the text is over the threshold for an engine that is metered by tokens"""
+        return extractor.input_tokens(text) > self.threshold
+
+    def extract(self, extractor, text):
+        """Extract keywords from each chunk in parallel and merge them"""
+        chunks = split_chunks(text, self.chunk_tokens)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(chunks))) as executor:
+            # Submitted with the caller's context, so chunks share the request's deadline
+            futures = [
+                executor.submit(copy_context().run, extractor.extract, chunk) for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+        return merge_keywords(results, self.max_keywords)
+
+    async def extract_async(self, extractor, text):
+        chunks = split_chunks(text, self.chunk_tokens)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(chunk):
+            async with semaphore:
+                return await extractor.extract_async(chunk)
+
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        return merge_keywords(results, self.max_keywords)
+
+    def stream(self, extractor, text):
+        """Stream events for a long document once its chunks have been merged"""
+        result = self.extract(extractor, text)
+        for keyword in result["keywords"]:
+            yield "keyword", keyword
+        yield "done", result
+
+
+# Global long-document settings
+long_documents = LongDocuments()
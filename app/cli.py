@@ -0,0 +1,261 @@
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.extractors import extractors
+from app.jobs import job_queue
+from app.json_provider import json_codec
+from app.keywords import cached_extract, extraction_error, prepare_text
+
+keywords_cli = AppGroup("keywords", help="Keyword extraction commands.")
+
+FORMATS = ("auto", "jsonl", "csv", "text")
+EXTENSIONS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}
+
+
+def input_format_of(source, input_format):
+    """Format to read source as: the one asked for, or going by its extension"""
+    if input_format != "auto":
+        return input_format
+    if source == "-":
+        return "jsonl"
+    return EXTENSIONS.get(os.path.splitext(source)[1].lower(), "text")
+
+
+def open_input(source, binary):
+    if source == "-":
+        return nullcontext(sys.stdin.buffer if binary else sys.stdin)
+    if binary:
+        return open(source, "rb")
+    return open(source, encoding="utf-8", newline="")
+
+
+def jsonl_records(stream, source):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        record_id = f"{source}:{number}"
+        try:
+            record = json_codec.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            yield record_id, None, {
+                "error": "Invalid record",
+                "message": "Lines must be JSON objects.",
+            }
+            continue
+        if record.get("id") is not None:
+            record_id = record["id"]
+        yield record_id, record.get("text") or record.get("content"), None
+
+
+def csv_records(stream, source):
+    # Rows may hold documents as long as a request body may be
+    csv.field_size_limit(max(current_app.config["MAX_CONTENT_LENGTH"], 128 * 1024))
+    reader = csv.DictReader(stream)
+    if not {"text", "content"} & set(reader.fieldnames or ()):
+        raise click.ClickException(f"{source} has no 'text' or 'content' column")
+    for row in reader:
+        record_id = row.get("id") or f"{source}:{reader.line_num}"
+        yield record_id, row.get("text") or row.get("content"), None
+
+
+def text_records(stream, source):
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            yield f"{source}:{number}", line.rstrip("\r\n"), None
+
+
+READERS = {"jsonl": jsonl_records, "csv": csv_records, "text": text_records}
+
+
+def read_records(inputs, input_format):
+    """Yield (id, text, error_body) for each record of the inputs, one at a time
+
+    JSONL lines and CSV rows give their document in "text" or "content" and
+    may set an "id"; plain text has one document per line. Records without
+    an id are named after their file and line.
+    """
+    for source in inputs:
+        reader = READERS[input_format_of(source, input_format)]
+        with open_input(source, binary=reader is jsonl_records) as stream:
+            yield from reader(stream, source)
+
+
+def extract_record(record, engine, use_cache):
+    """Output line for one record, preprocessed and extracted as POST /keywords does
+
+    Returns (line, succeeded).
+    """
+    record_id, text, error = record
+    if error is None and (not isinstance(text, str) or not text.strip()):
+        error = {"error": "No text provided"}
+    if error is None:
+        text, _, error = prepare_text(text)
+    if error is None:
+        try:
+            result, _, _ = cached_extract(text, use_cache, engine)
+            return json_codec.dumps({"id": record_id, **result}) + b"\n", True
+        except Exception as exc:
+            error = extraction_error(exc)
+    return json_codec.dumps({"id": record_id, **error}) + b"\n", False
+
+
+def load_checkpoint(path, inputs):
+    """(records, output_bytes) an earlier run over the same inputs got through"""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["inputs"] != list(inputs):
+        raise click.ClickException(
+            f"{path} was written for other inputs; pass --restart to start over"
+        )
+    return checkpoint["records"], checkpoint["output_bytes"]
+
+
+def save_checkpoint(path, inputs, records, output_bytes):
+    # Replace the file in one step so an interrupted write can't leave half of it
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"inputs": list(inputs), "records": records, "output_bytes": output_bytes}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def open_output(output, resume_at):
+    if output == "-":
+        return nullcontext(sys.stdout.buffer)
+    if not resume_at:
+        return open(output, "wb")
+    if not os.path.exists(output):
+        raise click.ClickException(f"{output} is missing; pass --restart to start over")
+    stream = open(output, "r+b")
+    # Drop anything written after the last checkpoint, it's extracted again
+    stream.truncate(resume_at)
+    stream.seek(resume_at)
+    return stream
+
+
+def worker_pool(workers, processes):
+    if processes:
+        # Forked workers inherit the configured app instead of building their own
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+    return ThreadPoolExecutor(workers, thread_name_prefix="keywords-extract")
+
+
+@keywords_cli.command("extract")
+@click.argument("inputs", nargs=-1, type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option(
+    "-o",
+    "--output",
+    default="-",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="JSONL file to write results to (default: stdout).",
+)
+@click.option(
+    "-f",
+    "--format",
+    "input_format",
+    type=click.Choice(FORMATS),
+    default="auto",
+    help="Input format; auto goes by file extension and reads stdin as JSONL.",
+)
+@click.option("--engine", help="Extraction engine (default: KEYWORDS_ENGINE).")
+@click.option("--workers", type=click.IntRange(1), default=8, show_default=True)
+@click.option("--processes", is_flag=True, help="Extract in worker processes instead of threads.")
+@click.option("--no-cache", is_flag=True, help="Skip the response cache.")
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="Progress file to resume from (default: OUTPUT.checkpoint).",
+)
+@click.option(
+    "--checkpoint-every",
+    type=click.IntRange(1),
+    default=1000,
+    show_default=True,
+    help="Records between checkpoints.",
+)
+@click.option("--restart", is_flag=True, help="Ignore an existing checkpoint.")
+def extract(
+    inputs,
+    output,
+    input_format,
+    engine,
+    workers,
+    processes,
+    no_cache,
+    checkpoint,
+    checkpoint_every,
+    restart,
+):
+    """Extract keywords from JSONL, CSV or plain-text INPUTS (or stdin) into JSONL
+
+    Records are read, extracted by a pool of workers and written one by one,
+    in input order, so memory use doesn't grow with the input. Every
+    --checkpoint-every records the progress is saved, and running the same
+    command again after an interruption carries on from there.
+    """
+    inputs = inputs or ("-",)
+    if engine is not None and engine not in extractors:
+        raise click.BadParameter(
+            f"must be one of: {', '.join(extractors.names())}", param_hint="--engine"
+        )
+    if checkpoint is None and output != "-":
+        checkpoint = f"{output}.checkpoint"
+    if checkpoint is not None and output == "-":
+        raise click.UsageError("--checkpoint needs an --output file")
+    done, output_bytes = (0, 0)
+    if checkpoint is not None and not restart:
+        done, output_bytes = load_checkpoint(checkpoint, inputs)
+    # Queued jobs are left to the servers
+    job_queue.stop()
+
+    use_cache = not no_cache
+    resumed_at, failed = done, 0
+    started = time.perf_counter()
+    records = itertools.islice(read_records(inputs, input_format), done, None)
+    with open_output(output, output_bytes) as stream:
+
+        def write(future):
+            nonlocal done, failed
+            line, succeeded = future.result()
+            stream.write(line)
+            done += 1
+            failed += not succeeded
+            if checkpoint is not None and done % checkpoint_every == 0:
+                stream.flush()
+                save_checkpoint(checkpoint, inputs, done, stream.tell())
+
+        pool = worker_pool(workers, processes)
+        pending = deque()
+        try:
+            for record in records:
+                pending.append(pool.submit(extract_record, record, engine, use_cache))
+                # Bound the records in flight, and with them memory use
+                if len(pending) >= workers * 4:
+                    write(pending.popleft())
+            while pending:
+                write(pending.popleft())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            stream.flush()
+            if checkpoint is not None:
+                save_checkpoint(checkpoint, inputs, done, stream.tell())
+
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"Extracted {done - resumed_at} records ({failed} failed) in {elapsed:.1f}s",
+        err=True,
+    )
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+from app import deadline
+
+
+def retryable_errors():
+    """Upstream failures that are worth retrying; anything else is returned to the caller
+
+    openai takes longer to import than the rest of the app together, so it's
+    only imported once an upstream call is made (an ``except`` clause is only
+    evaluated when an exception reaches it).
+    """
+    import openai
+
+    return (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class OpenAIClientManager:
+    """Lazily built, per-process OpenAI client with a keep-alive connection pool"""
+
+    def __init__(self):
+        self.settings = {
+            "api_key": None,
+            "base_url": None,
+            "timeout": 30.0,
+            "connect_timeout": 5.0,
+            "max_connections": 20,
+            "max_keepalive_connections": 10,
+            "keepalive_expiry": 30.0,
+            "max_retries": 2,
+            "retry_backoff": 0.5,
+            "retry_max_backoff": 8.0,
+            "async_clients": 1,
+        }
+        self._client = None
+        self._pid = None
+        self._async_clients = []
+        self._async_loop = None
+        self._async_next = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.settings = {
+            "api_key": config.get("OPENAI_API_KEY"),
+            "base_url": config.get("OPENAI_BASE_URL"),
+            "timeout": config.get("OPENAI_TIMEOUT", 30.0),
+            "connect_timeout": config.get("OPENAI_CONNECT_TIMEOUT", 5.0),
+            "max_connections": config.get("OPENAI_MAX_CONNECTIONS", 20),
+            "max_keepalive_connections": config.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10),
+            "keepalive_expiry": config.get("OPENAI_KEEPALIVE_EXPIRY", 30.0),
+            "max_retries": config.get("OPENAI_MAX_RETRIES", 2),
+            "retry_backoff": config.get("OPENAI_RETRY_BACKOFF", 0.5),
+            "retry_max_backoff": config.get("OPENAI_RETRY_MAX_BACKOFF", 8.0),
+            "async_clients": config.get("OPENAI_ASYNC_CLIENTS", 1),
+        }
+        self.reset()
+
+    @property
+    def configured(self):
+        """Whether an API key is available to build a client with"""
+        return bool(self.settings["api_key"] or os.environ.get("OPENAI_API_KEY"))
+
+    def get(self):
+        """Return this process's client, building it on first use or after a fork"""
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self._build()
+                self._pid = os.getpid()
+            return self._client
+
+    def get_async(self):
+        """Return an async client bound to the running event loop
+
+        httpcore scans its whole pool on every request, so one very large pool
+        burns CPU under high concurrency. Spreading requests round-robin over
+        several clients with smaller pools keeps that scan short.
+        """
+        loop = asyncio.get_running_loop()
+        if not self._async_clients or self._async_loop is not loop:
+            self._async_clients = [
+                self._build(asynchronous=True) for _ in range(self.settings["async_clients"])
+            ]
+            self._async_loop = loop
+        self._async_next = (self._async_next + 1) % len(self._async_clients)
+        return self._async_clients[self._async_next]
+
+    def _build(self, asynchronous=False):
+        settings = self.settings
+        api_key = settings["api_key"] or os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable is required")
+        import httpx
+        from openai import AsyncOpenAI, OpenAI
+
+        http_client_class = httpx.AsyncClient if asynchronous else httpx.Client
+        client_class = AsyncOpenAI if asynchronous else OpenAI
+        http_client = http_client_class(
+            limits=httpx.Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_keepalive_connections"],
+                keepalive_expiry=settings["keepalive_expiry"],
+            ),
+            timeout=httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+        )
+        # Retries are handled by call_with_retries so the backoff follows our config
+        return client_class(
+            api_key=api_key,
+            base_url=settings["base_url"] or os.environ.get("OPENAI_BASE_URL"),
+            http_client=http_client,
+            max_retries=0,
+        )
+
+    def warmup(self):
+        """Import the client library and build a client once, then drop it
+
+        Run in the gunicorn master before it forks, so workers inherit the
+        loaded modules; each worker still builds its own client and pool.
+        """
+        import openai.resources.responses  # noqa: F401
+
+        if self.configured:
+            self.reset()
+            self.get().responses
+            self.reset()
+
+    def reset(self):
+        """Close and drop the client so the next call builds a fresh one"""
+        with self._lock:
+            client, pid = self._client, self._pid
+            self._client = None
+            self._pid = None
+            self._async_clients = []
+            self._async_loop = None
+        if client is not None and pid == os.getpid():
+            client.close()
+
+    def _after_fork(self):
+        # The parent's sockets and lock state must never be used from a child
+        # worker, so forget them without closing the parent's connections
+        self._client = None
+        self._pid = None
+        self._async_clients = []
+        self._async_loop = None
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt):
+        """Seconds to wait before retry number ``attempt`` (exponential with jitter)"""
+        delay = min(
+            self.settings["retry_backoff"] * (2**attempt), self.settings["retry_max_backoff"]
+        )
+        return delay * (1 - 0.25 * random.random())
+
+    def _attempt_kwargs(self, kwargs):
+        # Each attempt gets only the time left before the request's deadline
+        if deadline.remaining() is None:
+            return kwargs
+        return {**kwargs, "timeout": deadline.upstream_timeout(self.settings["timeout"])}
+
+    def _retry_delay(self, attempt, exc):
+        """Seconds to wait before retrying after exc, or None to give up"""
+        if deadline.expired():
+            raise deadline.DeadlineExceeded("Deadline passed waiting for the upstream") from exc
+        if attempt >= self.settings["max_retries"]:
+            return None
+        delay = self.backoff(attempt)
+        left = deadline.remaining()
+        return None if left is not None and left <= delay else delay
+
+    def call_with_retries(self, func, *args, **kwargs):
+        """Call an upstream function, retrying transient failures with backoff"""
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **self._attempt_kwargs(kwargs))
+            except retryable_errors() as exc:
+                delay = self._retry_delay(attempt, exc)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def async_call_with_retries(self, func, *args, **kwargs):
+        """Await an upstream coroutine function, retrying transient failures with backoff"""
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **self._attempt_kwargs(kwargs))
+            except retryable_errors() as exc:
+                delay = self._retry_delay(attempt, exc)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+# Global client manager instance
+openai_clients = OpenAIClientManager()
+
+# Gunicorn forks workers from the master; rebuild the client in each child
+os.register_at_fork(after_in_child=openai_clients._after_fork)
+
+
+def get_openai_client():
+    """Get the shared OpenAI client for this process"""
+    return openai_clients.get()
+
+
+def get_async_openai_client():
+    """Get the shared async OpenAI client for the running event loop"""
+    return openai_clients.get_async()
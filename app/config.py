@@ -14,7 +14,205 @@ class Config:
     DEBUG = False
     TESTING = False
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    # Log records are written to stderr by a background thread, as JSON lines (with
+    # the X-Request-ID of the request they were logged for) or "text"; when
+    # LOG_QUEUE_SIZE records are waiting, more are dropped rather than waited on.
+    # A warning or error repeating the same message is written at most once per
+    # LOG_DEDUP_INTERVAL seconds (0 writes every one)
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+    LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+    LOG_DEDUP_INTERVAL = float(os.environ.get("LOG_DEDUP_INTERVAL", "10"))
+    # Share of requests written to the access log, with per-endpoint overrides
+    # ("endpoint=rate", comma-separated); server errors are always written
+    LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+    LOG_SAMPLE_RATES = os.environ.get(
+        "LOG_SAMPLE_RATES",
+        "/health=0.01,/health/live=0.01,/health/ready=0.01,/metrics=0.01",
+    )
     API_KEY = os.environ.get("API_KEY") or "dev-api-key-change-in-production"
+    # Optional JSON file of hashed client keys with per-key tiers, budgets and
+    # engines; it's re-read within API_KEYS_RELOAD_INTERVAL seconds of changing
+    API_KEYS_FILE = os.environ.get("API_KEYS_FILE", "")
+    API_KEYS_RELOAD_INTERVAL = float(os.environ.get("API_KEYS_RELOAD_INTERVAL", "5"))
+    APP_VERSION = os.environ.get("APP_VERSION", "1.0.0")
+
+    # OpenAI client: one keep-alive connection pool per worker process
+    OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
+    OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "30"))
+    OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "20"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "30"))
+    OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+    OPENAI_RETRY_BACKOFF = float(os.environ.get("OPENAI_RETRY_BACKOFF", "0.5"))
+    OPENAI_RETRY_MAX_BACKOFF = float(os.environ.get("OPENAI_RETRY_MAX_BACKOFF", "8"))
+    # Async serving mode: independent clients (each with the pool above) used round-robin
+    OPENAI_ASYNC_CLIENTS = int(os.environ.get("OPENAI_ASYNC_CLIENTS", "1"))
+
+    # Upstream circuit breaker: opens for UPSTREAM_BREAKER_OPEN_SECONDS once at least
+    # UPSTREAM_BREAKER_MIN_CALLS calls in the last UPSTREAM_BREAKER_WINDOW seconds have
+    # UPSTREAM_BREAKER_ERROR_RATE failures, or UPSTREAM_BREAKER_SLOW_RATE calls slower
+    # than UPSTREAM_BREAKER_SLOW_CALL seconds; half-open trial calls then decide
+    UPSTREAM_BREAKER_ENABLED = os.environ.get("UPSTREAM_BREAKER_ENABLED", "true").lower() == "true"
+    UPSTREAM_BREAKER_WINDOW = float(os.environ.get("UPSTREAM_BREAKER_WINDOW", "30"))
+    UPSTREAM_BREAKER_MIN_CALLS = int(os.environ.get("UPSTREAM_BREAKER_MIN_CALLS", "20"))
+    UPSTREAM_BREAKER_ERROR_RATE = float(os.environ.get("UPSTREAM_BREAKER_ERROR_RATE", "0.5"))
+    UPSTREAM_BREAKER_SLOW_CALL = float(os.environ.get("UPSTREAM_BREAKER_SLOW_CALL", "10"))
+    UPSTREAM_BREAKER_SLOW_RATE = float(os.environ.get("UPSTREAM_BREAKER_SLOW_RATE", "0.5"))
+    UPSTREAM_BREAKER_OPEN_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_OPEN_SECONDS", "30"))
+    UPSTREAM_BREAKER_HALF_OPEN_CALLS = int(os.environ.get("UPSTREAM_BREAKER_HALF_OPEN_CALLS", "3"))
+    # Adaptive (AIMD) limit on concurrent upstream calls per worker: it grows while
+    # calls succeed within UPSTREAM_CONCURRENCY_LATENCY_TARGET seconds and shrinks by
+    # UPSTREAM_CONCURRENCY_BACKOFF on failures or slow calls; calls over it get 503
+    UPSTREAM_CONCURRENCY_ENABLED = (
+        os.environ.get("UPSTREAM_CONCURRENCY_ENABLED", "true").lower() == "true"
+    )
+    UPSTREAM_CONCURRENCY_INITIAL = int(os.environ.get("UPSTREAM_CONCURRENCY_INITIAL", "50"))
+    UPSTREAM_CONCURRENCY_MIN = int(os.environ.get("UPSTREAM_CONCURRENCY_MIN", "2"))
+    UPSTREAM_CONCURRENCY_MAX = int(os.environ.get("UPSTREAM_CONCURRENCY_MAX", "500"))
+    UPSTREAM_CONCURRENCY_LATENCY_TARGET = float(
+        os.environ.get("UPSTREAM_CONCURRENCY_LATENCY_TARGET", "5")
+    )
+    UPSTREAM_CONCURRENCY_BACKOFF = float(os.environ.get("UPSTREAM_CONCURRENCY_BACKOFF", "0.9"))
+
+    # Hedging: an upstream call still running after the UPSTREAM_HEDGE_PERCENTILE latency
+    # of recent calls (at least UPSTREAM_HEDGE_MIN_DELAY seconds) is sent again and the
+    # first answer wins. Each call earns UPSTREAM_HEDGE_BUDGET hedges, banking at most
+    # UPSTREAM_HEDGE_BURST, which caps the extra upstream spend
+    UPSTREAM_HEDGE_ENABLED = os.environ.get("UPSTREAM_HEDGE_ENABLED", "true").lower() == "true"
+    UPSTREAM_HEDGE_PERCENTILE = float(os.environ.get("UPSTREAM_HEDGE_PERCENTILE", "95"))
+    UPSTREAM_HEDGE_MIN_DELAY = float(os.environ.get("UPSTREAM_HEDGE_MIN_DELAY", "0.1"))
+    UPSTREAM_HEDGE_MIN_SAMPLES = int(os.environ.get("UPSTREAM_HEDGE_MIN_SAMPLES", "20"))
+    UPSTREAM_HEDGE_BUDGET = float(os.environ.get("UPSTREAM_HEDGE_BUDGET", "0.05"))
+    UPSTREAM_HEDGE_BURST = float(os.environ.get("UPSTREAM_HEDGE_BURST", "10"))
+    UPSTREAM_HEDGE_THREADS = int(os.environ.get("UPSTREAM_HEDGE_THREADS", "64"))
+
+    # Extraction engine ("openai" or "local"); requests may pick one with "engine"
+    KEYWORDS_ENGINE = os.environ.get("KEYWORDS_ENGINE", "openai")
+    # More engines running other models, e.g. "openai-mini=openai:gpt-5-mini"
+    KEYWORDS_ENGINE_MODELS = os.environ.get("KEYWORDS_ENGINE_MODELS", "")
+    # The fallback engine answers when the selected engine fails or times out
+    KEYWORDS_FALLBACK_ENGINE = os.environ.get("KEYWORDS_FALLBACK_ENGINE", "")
+    # Engine that answers when a request's deadline (X-Deadline-Ms or deadline_ms)
+    # passes, or would pass going by recent upstream latency; empty answers 504
+    KEYWORDS_DEADLINE_FALLBACK_ENGINE = os.environ.get("KEYWORDS_DEADLINE_FALLBACK_ENGINE", "local")
+    LOCAL_MAX_KEYWORDS = int(os.environ.get("LOCAL_MAX_KEYWORDS", "10"))
+    LOCAL_MAX_PHRASE_WORDS = int(os.environ.get("LOCAL_MAX_PHRASE_WORDS", "3"))
+
+    # Corpus document frequencies that weight the local engine by IDF. Set
+    # CORPUS_PATH to a directory to share one memory-mapped copy between workers.
+    # Past CORPUS_MAX_WORDS words the vocabulary is pruned to its most frequent half.
+    CORPUS_ENABLED = os.environ.get("CORPUS_ENABLED", "true").lower() == "true"
+    CORPUS_PATH = os.environ.get("CORPUS_PATH", "")
+    CORPUS_FLUSH_EVERY = int(os.environ.get("CORPUS_FLUSH_EVERY", "50"))
+    CORPUS_MAX_WORDS = int(os.environ.get("CORPUS_MAX_WORDS", "100000"))
+
+    # Engine routing: a rule table (a JSON list) choosing the engine for requests
+    # that don't name one, by input tokens, key tier, quality hint and upstream
+    # health; the upstream counts as degraded while its circuit isn't closed or its
+    # error rate or median latency (seconds) reach these thresholds
+    KEYWORDS_ROUTES = os.environ.get("KEYWORDS_ROUTES", "")
+    KEYWORDS_ROUTE_DEGRADED_ERROR_RATE = float(
+        os.environ.get("KEYWORDS_ROUTE_DEGRADED_ERROR_RATE", "0.2")
+    )
+    KEYWORDS_ROUTE_DEGRADED_LATENCY = float(os.environ.get("KEYWORDS_ROUTE_DEGRADED_LATENCY", "5"))
+
+    # Preprocessing of posted text before it's charged, cached and extracted: any of
+    # "markup" (strip HTML and markdown), "normalize" (unicode and whitespace),
+    # "language" (detection) and "trim" (drop low-signal blocks such as menus,
+    # off by default since it drops text), comma-separated; empty turns it off.
+    # KEYWORDS_LANGUAGES (e.g. "en,de") refuses documents detected as another language
+    PREPROCESS_STEPS = os.environ.get("PREPROCESS_STEPS", "markup,normalize,language")
+    KEYWORDS_LANGUAGES = os.environ.get("KEYWORDS_LANGUAGES", "")
+    PREPROCESS_LANGUAGE_SAMPLE_WORDS = int(
+        os.environ.get("PREPROCESS_LANGUAGE_SAMPLE_WORDS", "200")
+    )
+    PREPROCESS_TRIM_MIN_WORDS = int(os.environ.get("PREPROCESS_TRIM_MIN_WORDS", "7"))
+    PREPROCESS_TRIM_MIN_DENSITY = float(os.environ.get("PREPROCESS_TRIM_MIN_DENSITY", "0.2"))
+
+    # JSON encoding for requests, responses and the shared cache: "orjson" (falls
+    # back to the stdlib when it isn't installed) or "stdlib"
+    JSON_BACKEND = os.environ.get("JSON_BACKEND", "orjson")
+
+    # Rate limit counters: "memory://" is per process, so share them between
+    # workers with "sqlite:///path/to/limits.db" or across hosts with "redis://host:6379"
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "memory://")
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter")
+
+    # Keyword extraction limits (batch documents count individually against the rate limit)
+    KEYWORDS_RATE_LIMIT = os.environ.get("KEYWORDS_RATE_LIMIT", "10 per hour")
+    # Optional per-API-key budget of estimated upstream input tokens, e.g.
+    # "20000 per minute; 200000 per hour" (empty disables token budgeting)
+    KEYWORDS_TOKEN_BUDGET = os.environ.get("KEYWORDS_TOKEN_BUDGET", "")
+    KEYWORDS_BATCH_MAX_ITEMS = int(os.environ.get("KEYWORDS_BATCH_MAX_ITEMS", "100"))
+    KEYWORDS_BATCH_CONCURRENCY = int(os.environ.get("KEYWORDS_BATCH_CONCURRENCY", "8"))
+
+    # Asynchronous jobs (POST /keywords/jobs) are queued in the JOBS_DB SQLite file
+    # (empty disables them) and drained by JOBS_WORKERS threads per process, which
+    # make at most JOBS_CONCURRENCY extractions at once. Failed documents are
+    # retried after JOBS_RETRY_BACKOFF, 2x, 4x... seconds, up to JOBS_MAX_ATTEMPTS runs
+    JOBS_DB = os.environ.get("JOBS_DB", "")
+    JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", "2"))
+    JOBS_CONCURRENCY = int(os.environ.get("JOBS_CONCURRENCY", "4"))
+    JOBS_MAX_DOCUMENTS = int(os.environ.get("JOBS_MAX_DOCUMENTS", "1000"))
+    JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", "3"))
+    JOBS_RETRY_BACKOFF = float(os.environ.get("JOBS_RETRY_BACKOFF", "2"))
+    # A job whose worker hasn't reported for JOBS_LEASE seconds is run again elsewhere
+    JOBS_LEASE = float(os.environ.get("JOBS_LEASE", "300"))
+    JOBS_CHECK_INTERVAL = float(os.environ.get("JOBS_CHECK_INTERVAL", "1"))
+    JOBS_RESULT_TTL = float(os.environ.get("JOBS_RESULT_TTL", "86400"))
+    JOBS_CALLBACK_TIMEOUT = float(os.environ.get("JOBS_CALLBACK_TIMEOUT", "10"))
+    # Callbacks only go to hosts resolving to public addresses, or with
+    # JOBS_CALLBACK_ALLOWED_HOSTS (e.g. "hooks.example.com,.example.org") only to those
+    JOBS_CALLBACK_ALLOWED_HOSTS = os.environ.get("JOBS_CALLBACK_ALLOWED_HOSTS", "")
+    JOBS_POLL_RATE_LIMIT = os.environ.get("JOBS_POLL_RATE_LIMIT", "600 per hour")
+
+    # Largest request body accepted (bytes); bigger requests get 413
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", str(2 * 1024 * 1024)))
+
+    # Documents estimated above LONG_DOCUMENT_TOKENS are split into CHUNK_TOKENS
+    # chunks along paragraph/sentence boundaries, extracted in parallel and merged
+    LONG_DOCUMENT_TOKENS = int(os.environ.get("LONG_DOCUMENT_TOKENS", "6000"))
+    CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "2000"))
+    CHUNK_CONCURRENCY = int(os.environ.get("CHUNK_CONCURRENCY", "4"))
+    CHUNK_MAX_KEYWORDS = int(os.environ.get("CHUNK_MAX_KEYWORDS", "20"))
+
+    # Keyword response cache ("memory://" or "sqlite:///path/to/cache.db" to share
+    # entries between gunicorn workers)
+    CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_URI = os.environ.get("CACHE_URI", "memory://")
+    CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))
+    CACHE_SHARED_MAX_ENTRIES = int(os.environ.get("CACHE_SHARED_MAX_ENTRIES", "10000"))
+
+    # Texts of at least NEAR_DUPLICATE_MIN_WORDS words whose estimated Jaccard
+    # similarity to a cached text is NEAR_DUPLICATE_THRESHOLD or more reuse its
+    # result. MinHash permutations are split into NEAR_DUPLICATE_BANDS LSH bands
+    NEAR_DUPLICATE_ENABLED = os.environ.get("NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+    NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+    NEAR_DUPLICATE_MIN_WORDS = int(os.environ.get("NEAR_DUPLICATE_MIN_WORDS", "20"))
+    NEAR_DUPLICATE_MAX_ENTRIES = int(os.environ.get("NEAR_DUPLICATE_MAX_ENTRIES", "10000"))
+    NEAR_DUPLICATE_PERMUTATIONS = int(os.environ.get("NEAR_DUPLICATE_PERMUTATIONS", "128"))
+    NEAR_DUPLICATE_BANDS = int(os.environ.get("NEAR_DUPLICATE_BANDS", "16"))
+
+    # Identical concurrent cache misses share one upstream call (across workers
+    # too when CACHE_URI is shared); waiters give up after COALESCE_TIMEOUT seconds
+    COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "true").lower() == "true"
+    COALESCE_TIMEOUT = float(os.environ.get("COALESCE_TIMEOUT", "30"))
+
+    # Prometheus metrics at /metrics. "memory://" reports the worker that answers
+    # the scrape; "sqlite:///path/to/metrics.db" sums every worker on the host
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_URI = os.environ.get("METRICS_URI", "memory://")
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+
+    # Health checks: each worker probes the upstream, limiter storage and cache
+    # in the background every HEALTH_CHECK_INTERVAL seconds (0 probes on every
+    # request). Upstream failures only fail readiness with HEALTH_REQUIRE_UPSTREAM
+    HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", "15"))
+    HEALTH_UPSTREAM_TIMEOUT = float(os.environ.get("HEALTH_UPSTREAM_TIMEOUT", "5"))
+    HEALTH_REQUIRE_UPSTREAM = os.environ.get("HEALTH_REQUIRE_UPSTREAM", "false").lower() == "true"
 
 
 # Dev environment config w verbose logging
@@ -32,6 +230,10 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     LOG_LEVEL = "DEBUG"
+    CACHE_URI = "memory://"
+    METRICS_URI = "memory://"
+    HEALTH_CHECK_INTERVAL = 0
+    JOBS_DB = ""
 
 
 # Prod environment config w less verbose logging
@@ -0,0 +1,239 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class CorpusIndex:
+    """Document frequencies for an append-only vocabulary, held in a NumPy array
+
+    Word ids are positions in the vocabulary; ``df[0]`` is the number of
+    documents and ``df[1 + id]`` the number of documents containing word ``id``.
+
+    With a ``path`` the array lives in ``df.npy`` and is memory-mapped, so all
+    workers on the host read one copy, and the vocabulary is ``vocab.txt``
+    (one word per line). Each worker buffers new documents and merges them into
+    the files under an exclusive file lock every ``flush_every`` documents.
+
+    Once the vocabulary grows past ``max_words`` it's pruned to the most
+    frequent half, leaving out words only one document contained, and the ids
+    are assigned again.
+    """
+
+    def __init__(
+        self, path=None, flush_every=50, capacity=1024, sync_interval=1.0, max_words=100000
+    ):
+        self.path = path
+        self.flush_every = flush_every
+        self.sync_interval = sync_interval
+        self.max_words = max_words
+        self.vocabulary = {}
+        self.words = []
+        self.df = np.zeros(capacity + 1, dtype=np.int64)
+        self._pending = Counter()
+        self._pending_documents = 0
+        self._lock = threading.Lock()
+        self._vocab_offset = 0
+        self._vocab_inode = None
+        self._df_inode = None
+        self._synced_at = 0.0
+        if path:
+            os.makedirs(path, exist_ok=True)
+            with self._file_lock():
+                if not os.path.exists(self._df_path):
+                    self._write_df(self.df)
+                open(self._vocab_path, "a").close()
+                self._sync()
+
+    @property
+    def _df_path(self):
+        return os.path.join(self.path, "df.npy")
+
+    @property
+    def _vocab_path(self):
+        return os.path.join(self.path, "vocab.txt")
+
+    @contextmanager
+    def _file_lock(self, operation=fcntl.LOCK_EX):
+        with open(os.path.join(self.path, "lock"), "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @property
+    def documents(self):
+        return int(self.df[0])
+
+    def add_document(self, words):
+        """Count one document containing ``words``"""
+        words = set(words)
+        with self._lock:
+            if not self.path:
+                self._apply(Counter(words), 1)
+                return
+            self._pending.update(words)
+            self._pending_documents += 1
+            if self._pending_documents >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        """Merge buffered documents into the shared files"""
+        with self._lock:
+            self._flush()
+
+    def idf(self, words):
+        """Smoothed inverse document frequency of each word, as an array"""
+        if self.path and time.monotonic() - self._synced_at >= self.sync_interval:
+            # Shared, so a pruning worker's files are never seen half replaced
+            with self._lock, self._file_lock(fcntl.LOCK_SH):
+                self._sync()
+        df = self.df
+        ids = np.fromiter(
+            (self.vocabulary.get(word, -1) for word in words), dtype=np.int64, count=len(words)
+        )
+        # Words another worker added since the last remap count as unseen
+        known = (ids >= 0) & (ids + 1 < len(df))
+        counts = np.zeros(len(ids), dtype=np.float64)
+        counts[known] = df[ids[known] + 1]
+        return np.log((1.0 + df[0]) / (1.0 + counts)) + 1.0
+
+    def _apply(self, counts, documents):
+        for word in counts:
+            if word not in self.vocabulary:
+                self.vocabulary[word] = len(self.words)
+                self.words.append(word)
+        self._reserve(len(self.words) + 1)
+        ids = np.fromiter((self.vocabulary[word] for word in counts), dtype=np.int64)
+        self.df[ids + 1] += np.fromiter(counts.values(), dtype=np.int64)
+        self.df[0] += documents
+        if len(self.words) > self.max_words:
+            self._prune()
+
+    def _prune(self):
+        end = len(self.words) + 1
+        counts = np.asarray(self.df[1:end])
+        keep = np.argsort(-counts, kind="stable")[: self.max_words // 2]
+        keep = np.sort(keep[counts[keep] > 1])
+        df = np.zeros(len(keep) + 1, dtype=np.int64)
+        df[0] = self.df[0]
+        df[1:] = counts[keep]
+        self.words = [self.words[i] for i in keep]
+        self.vocabulary = {word: i for i, word in enumerate(self.words)}
+        if not self.path:
+            self.df = df
+            return
+        tmp_path = f"{self._vocab_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(f"{word}\n" for word in self.words))
+        os.replace(tmp_path, self._vocab_path)
+        self._vocab_inode = os.stat(self._vocab_path).st_ino
+        self._vocab_offset = os.path.getsize(self._vocab_path)
+        self._write_df(df)
+        self._map_df()
+
+    def _reserve(self, size):
+        if size <= len(self.df):
+            return
+        grown = np.zeros(max(size, 2 * len(self.df)), dtype=np.int64)
+        grown[: len(self.df)] = self.df
+        if self.path:
+            self._write_df(grown)
+            self._map_df()
+        else:
+            self.df = grown
+
+    def _flush(self):
+        if not self.path or not self._pending_documents:
+            return
+        with self._file_lock():
+            self._sync()
+            new_words = [word for word in self._pending if word not in self.vocabulary]
+            if new_words:
+                with open(self._vocab_path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{word}\n" for word in new_words))
+            self._apply(self._pending, self._pending_documents)
+            self.df.flush()
+            # Our ids were assigned locally; skip past the lines we just wrote
+            self._vocab_offset = os.path.getsize(self._vocab_path)
+        self._pending.clear()
+        self._pending_documents = 0
+
+    def _sync(self):
+        """Pick up vocabulary and array growth written by other workers"""
+        vocab_inode = os.stat(self._vocab_path).st_ino
+        if vocab_inode != self._vocab_inode:
+            # Another worker pruned the vocabulary, so the ids all changed
+            self.vocabulary = {}
+            self.words = []
+            self._vocab_offset = 0
+            self._vocab_inode = vocab_inode
+        if os.stat(self._df_path).st_ino != self._df_inode:
+            self._map_df()
+        with open(self._vocab_path, "rb") as f:
+            f.seek(self._vocab_offset)
+            data = f.read()
+        # Only consume complete lines; a writer may be mid-append
+        end = data.rfind(b"\n") + 1
+        for word in data[:end].decode("utf-8").splitlines():
+            self.vocabulary[word] = len(self.words)
+            self.words.append(word)
+        self._vocab_offset += end
+        self._synced_at = time.monotonic()
+
+    def _write_df(self, array):
+        # Replace atomically so other workers keep a consistent (if stale) mapping
+        tmp_path = f"{self._df_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, self._df_path)
+
+    def _map_df(self):
+        self.df = np.load(self._df_path, mmap_mode="r+")
+        self._df_inode = os.stat(self._df_path).st_ino
+
+
+class CorpusStats:
+    """Corpus-wide document frequencies that weight the local extractor by IDF"""
+
+    def __init__(self):
+        self.enabled = False
+        self.index = None
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("CORPUS_ENABLED", True)
+        self.index = None
+        if self.enabled:
+            self.index = CorpusIndex(
+                config.get("CORPUS_PATH") or None,
+                flush_every=config.get("CORPUS_FLUSH_EVERY", 50),
+                max_words=config.get("CORPUS_MAX_WORDS", 100000),
+            )
+
+    @property
+    def documents(self):
+        return self.index.documents if self.enabled else 0
+
+    def add_document(self, words):
+        if self.enabled:
+            self.index.add_document(words)
+
+    def idf(self, words):
+        return self.index.idf(words)
+
+    def flush(self):
+        if self.enabled:
+            self.index.flush()
+
+
+# Global corpus statistics
+corpus = CorpusStats()
+# Don't lose a worker's buffered documents on shutdown
+atexit.register(corpus.flush)
@@ -0,0 +1,71 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# time.monotonic() by which the current request must be answered, or None
+_deadline = ContextVar("keywords_deadline", default=None)
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+DEADLINE_PARAM = "deadline_ms"
+
+
+class DeadlineExceeded(Exception):
+    """The client's deadline passed, or would pass, before the upstream answered"""
+
+
+def parse_deadline(value):
+    """Seconds from a deadline in milliseconds, None if absent; raises ValueError if invalid"""
+    if value is None or value == "":
+        return None
+    try:
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        milliseconds = None
+    if milliseconds is None or not 0 < milliseconds < float("inf"):
+        raise ValueError(f"{DEADLINE_PARAM} must be a positive number of milliseconds")
+    return milliseconds / 1000
+
+
+def deadline_error():
+    """Error body for a malformed deadline"""
+    return {
+        "error": "Invalid deadline",
+        "message": f"{DEADLINE_HEADER} / {DEADLINE_PARAM} must be a positive number "
+        "of milliseconds",
+    }
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Run the enclosed block with a deadline ``seconds`` from now (None: no deadline)"""
+    if seconds is None:
+        yield
+        return
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def expired():
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def upstream_timeout(default):
+    """Timeout for an upstream call: the default, cut short by the deadline"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Deadline passed before the upstream call")
+    return min(default, left)
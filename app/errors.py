@@ -1,50 +1,62 @@
 from flask import jsonify
 import logging
 
+from app.json_provider import json_codec
+
 logger = logging.getLogger(__name__)
 
 
+def static_error(error, message):
+    """Pre-serialized JSON body for an error response that never changes"""
+    return json_codec.dumps({"error": error, "message": message}) + b"\n"
+
+
+NOT_FOUND = static_error("Not found", "The requested resource was not found")
+RATE_LIMITED = static_error("Rate limit exceeded", "Too many requests. Please try again later.")
+INTERNAL_ERROR = static_error("Internal server error", "An unexpected error occurred")
+
+
 def register_error_handlers(app):
     """Register error handlers for the application"""
 
+    def error_response(body, status):
+        return app.response_class(body, status=status, mimetype="application/json")
+
     @app.errorhandler(400)
     def bad_request(error):
-        logger.warning(f"Bad request: {error}")
+        logger.warning("Bad request: %s", error)
         return jsonify({"error": "Bad request", "message": str(error)}), 400
 
     @app.errorhandler(404)
     def not_found(error):
-        logger.warning(f"Not found: {error}")
-        return (
-            jsonify({"error": "Not found", "message": "The requested resource was not found"}),
-            404,
-        )
+        logger.warning("Not found: %s", error)
+        return error_response(NOT_FOUND, 404)
 
-    @app.errorhandler(429)
-    def too_many_requests(error):
-        logger.warning(f"Rate limit exceeded: {error}")
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        logger.warning("Payload too large: %s", error)
+        limit = app.config.get("MAX_CONTENT_LENGTH")
         return (
             jsonify(
                 {
-                    "error": "Rate limit exceeded",
-                    "message": "Too many requests. Please try again later.",
+                    "error": "Payload too large",
+                    "message": f"Request body must be at most {limit} bytes.",
                 }
             ),
-            429,
+            413,
         )
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        logger.warning("Rate limit exceeded: %s", error)
+        return error_response(RATE_LIMITED, 429)
+
     @app.errorhandler(500)
     def internal_error(error):
-        logger.error(f"Internal server error: {error}")
-        return (
-            jsonify({"error": "Internal server error", "message": "An unexpected error occurred"}),
-            500,
-        )
+        logger.error("Internal server error: %s", error)
+        return error_response(INTERNAL_ERROR, 500)
 
     @app.errorhandler(Exception)
     def handle_exception(error):
-        logger.error(f"Unhandled exception: {error}")
-        return (
-            jsonify({"error": "Internal server error", "message": "An unexpected error occurred"}),
-            500,
-        )
+        logger.error("Unhandled exception: %s", error)
+        return error_response(INTERNAL_ERROR, 500)
@@ -0,0 +1,116 @@
+import copy
+
+from app.cache import make_cache_key
+
+
+class KeywordExtractor:
+    """Base class for keyword extraction backends
+
+    Subclasses set ``name`` (the value clients pass as ``engine``) plus the
+    ``model``/``prompt`` pair that identifies their output in cache keys, and
+    implement ``extract``. Async and streaming variants default to the
+    synchronous result and can be overridden by backends that do better.
+    Engines that rank by the corpus statistics set ``uses_corpus``, so the
+    documents they extract are counted in them.
+    """
+
+    name = None
+    model = ""
+    prompt = ""
+    uses_corpus = False
+
+    def init_app(self, app):
+        pass
+
+    def extract(self, text):
+        raise NotImplementedError
+
+    async def extract_async(self, text):
+        return self.extract(text)
+
+    def stream(self, text):
+        """Yield ("keyword", keyword) events followed by ("done", result)"""
+        result = self.extract(text)
+        for keyword in result.get("keywords", []):
+            yield "keyword", keyword
+        yield "done", result
+
+    def input_tokens(self, text):
+        """Estimated upstream tokens charged to the caller's budget; local engines are free"""
+        return 0
+
+    def cache_key(self, text):
+        return make_cache_key(text, self.model, self.prompt)
+
+    def with_model(self, name, model):
+        """Copy of this engine registered as ``name`` that runs ``model``"""
+        variant = copy.copy(self)
+        variant.name = name
+        variant.model = model
+        return variant
+
+
+class ExtractorRegistry:
+    """Named extraction backends with a configurable default and fallback
+
+    KEYWORDS_ENGINE_MODELS adds engines that run another model of a registered
+    engine, as ``name=engine:model`` pairs separated by commas.
+    """
+
+    def __init__(self):
+        self._extractors = {}
+        self._variants = set()
+        self.default = "openai"
+        self.fallback = None
+        self.deadline_fallback = "local"
+
+    def init_app(self, app):
+        config = app.config
+        self.default = config.get("KEYWORDS_ENGINE", "openai")
+        self.fallback = config.get("KEYWORDS_FALLBACK_ENGINE") or None
+        self.deadline_fallback = config.get("KEYWORDS_DEADLINE_FALLBACK_ENGINE", "local") or None
+        for name in self._variants:
+            del self._extractors[name]
+        self._variants = set()
+        for pair in config.get("KEYWORDS_ENGINE_MODELS", "").split(","):
+            if not pair.strip():
+                continue
+            name, _, target = pair.partition("=")
+            engine, _, model = target.partition(":")
+            name = name.strip()
+            if name in self or engine.strip() not in self or not model.strip():
+                raise ValueError(f"Invalid KEYWORDS_ENGINE_MODELS entry: {pair.strip()}")
+            self.register(self._extractors[engine.strip()].with_model(name, model.strip()))
+            self._variants.add(name)
+        for extractor in self._extractors.values():
+            extractor.init_app(app)
+
+    def register(self, extractor):
+        self._extractors[extractor.name] = extractor
+        return extractor
+
+    def get(self, name=None):
+        """Look up an extractor by engine name, or the default engine"""
+        return self._extractors[name or self.default]
+
+    def fallback_for(self, name):
+        """Extractor to use when ``name`` fails, or None"""
+        if self.fallback is None or self.fallback == name:
+            return None
+        return self._extractors.get(self.fallback)
+
+    def deadline_fallback_for(self, name):
+        """Extractor to answer with when ``name`` can't meet the deadline, or None"""
+        if self.deadline_fallback is None or self.deadline_fallback == name:
+            return None
+        return self._extractors.get(self.deadline_fallback)
+
+    def names(self):
+        return sorted(self._extractors)
+
+    def __contains__(self, name):
+        return name in self._extractors
+
+
+# Global extractor registry
+extractors = ExtractorRegistry()
@@ -1,29 +1,232 @@
 from flask import Blueprint, jsonify
 import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from app.breaker import OPEN, upstream_guard
+from app.cache import response_cache
+from app.near_duplicates import near_duplicates
+from app.clients import get_openai_client, openai_clients
+from app.keywords import MODEL
+from app.limiter import limiter
+from app.metrics import metrics
+from app.singleflight import single_flight
 
 health_bp = Blueprint("health", __name__)
 logger = logging.getLogger(__name__)
 
+# Checks that only fail readiness with HEALTH_REQUIRE_UPSTREAM
+UPSTREAM_CHECKS = ("upstream", "circuit")
+
+
+def utc_timestamp(seconds=None):
+    """ISO 8601 UTC timestamp, e.g. 2024-01-01T00:00:00Z"""
+    moment = datetime.fromtimestamp(time.time() if seconds is None else seconds, timezone.utc)
+    return moment.isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def check_upstream(timeout):
+    """Fetch the model from the OpenAI API, which costs no tokens"""
+    if not openai_clients.configured:
+        return {"status": "skipped", "message": "OPENAI_API_KEY is not configured"}
+    client = get_openai_client().with_options(timeout=timeout, max_retries=0)
+    client.models.retrieve(MODEL)
+    return {"status": "ok", "model": MODEL}
+
+
+def check_limiter(backend):
+    """Ask the rate limit storage whether it's reachable"""
+    storage = limiter.storage
+    if storage is None:
+        return {"status": "error", "backend": backend, "message": "Limiter is not initialised"}
+    if not storage.check():
+        return {"status": "error", "backend": backend, "message": "Storage is unreachable"}
+    return {"status": "ok", "backend": backend}
+
+
+def check_cache():
+    """Read from the shared cache backend, if there is one"""
+    shared = response_cache.shared
+    if shared is None:
+        return {"status": "ok", "backend": response_cache.local.name}
+    shared.ping()
+    return {"status": "ok", "backend": shared.name}
+
+
+def check_circuit():
+    """Current state of this worker's upstream circuit breaker, an error while open"""
+    if not upstream_guard.breaker_enabled:
+        return {"status": "skipped", "message": "UPSTREAM_BREAKER_ENABLED is false"}
+    stats = upstream_guard.breaker.stats()
+    return {"status": "error" if stats["state"] == OPEN else "ok", **stats}
+
+
+class HealthMonitor:
+    """Dependency checks run in the background so health probes only read cached results
+
+    A daemon thread in each worker runs the checks every HEALTH_CHECK_INTERVAL
+    seconds. Load balancer polling never waits on a dependency; an interval of
+    0 runs the checks on every probe instead. Upstream failures make the
+    service "degraded" but only fail readiness with HEALTH_REQUIRE_UPSTREAM,
+    so an OpenAI outage doesn't take every instance out of rotation at once.
+    """
+
+    def __init__(self):
+        self.interval = 15.0
+        self.upstream_timeout = 5.0
+        self.require_upstream = False
+        self.version = "1.0.0"
+        self.limiter_backend = "memory"
+        self._after_fork()
+
+    def init_app(self, app):
+        config = app.config
+        self.interval = config.get("HEALTH_CHECK_INTERVAL", 15.0)
+        self.upstream_timeout = config.get("HEALTH_UPSTREAM_TIMEOUT", 5.0)
+        self.require_upstream = config.get("HEALTH_REQUIRE_UPSTREAM", False)
+        self.version = config.get("APP_VERSION", "1.0.0")
+        # Only the scheme, so credentials in the URI aren't reported
+        uri = config.get("RATELIMIT_STORAGE_URI", "memory://")
+        self.limiter_backend = uri.partition("://")[0]
+        self._results = None
+
+    def _after_fork(self):
+        # Threads don't survive a fork, and uptime is per worker
+        self.started_at = time.time()
+        self._results = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def uptime(self):
+        return round(time.time() - self.started_at, 3)
+
+    def checks(self):
+        """Dependency name -> check function"""
+        return {
+            "upstream": lambda: check_upstream(self.upstream_timeout),
+            "limiter": lambda: check_limiter(self.limiter_backend),
+            "cache": check_cache,
+        }
+
+    def run_checks(self):
+        """Run every dependency check now and cache the results"""
+        results = {}
+        for name, check in self.checks().items():
+            started = time.perf_counter()
+            try:
+                result = check()
+            except Exception as exc:
+                logger.warning("Health check %s failed: %s", name, exc)
+                result = {"status": "error", "message": str(exc)}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            result["checked_at"] = utc_timestamp()
+            results[name] = result
+        with self._lock:
+            self._results = results
+        return results
+
+    def _run(self):
+        # The first checks run inline, in results()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if self.interval <= 0:
+                    self._thread = None
+                    return
+            self.run_checks()
+
+    def results(self):
+        """Latest cached results, checked inline only when there are none yet"""
+        if self.interval <= 0:
+            return self.run_checks()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="health-checks", daemon=True)
+                self._thread.start()
+            results = self._results
+        return results if results is not None else self.run_checks()
+
+    def current_results(self):
+        """Cached dependency checks plus the live state of the circuit breaker"""
+        results = dict(self.results())
+        results["circuit"] = {**check_circuit(), "checked_at": utc_timestamp()}
+        return results
+
+    def failing(self, results):
+        """Names of the checks that make this worker unready"""
+        return [
+            name
+            for name, result in results.items()
+            if result["status"] == "error"
+            and (name not in UPSTREAM_CHECKS or self.require_upstream)
+        ]
+
+    def report(self):
+        """(report, ready) for the detailed health endpoint"""
+        results = self.current_results()
+        failing = self.failing(results)
+        if failing:
+            status = "unhealthy"
+        elif any(result["status"] == "error" for result in results.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+        report = {
+            "status": status,
+            "message": "Service is running" if not failing else "Dependencies are failing",
+            "version": self.version,
+            "timestamp": utc_timestamp(),
+            "pid": os.getpid(),
+            "uptime_seconds": self.uptime,
+            "ready": not failing,
+            "checks": results,
+            "upstream_latency_ms": metrics.percentiles("upstream"),
+            "upstream_concurrency": upstream_guard.stats().get("concurrency"),
+            "cache": response_cache.stats(),
+            "near_duplicates": near_duplicates.stats(),
+            "coalescing": single_flight.stats(),
+        }
+        return report, not failing
+
+
+# Global health monitor
+health_monitor = HealthMonitor()
+
+# Each gunicorn worker runs its own checks and counts its own uptime
+os.register_at_fork(after_in_child=health_monitor._after_fork)
+
 
 @health_bp.route("/health", methods=["GET"])
+@limiter.exempt
 def health_check():
     """Basic health check endpoint"""
     logger.debug("Health check requested")
     return jsonify({"status": "healthy", "message": "Service is running"}), 200
 
 
+@health_bp.route("/health/live", methods=["GET"])
+@limiter.exempt
+def liveness_check():
+    """Liveness probe: the worker is up and serving requests"""
+    return jsonify({"status": "alive", "uptime_seconds": health_monitor.uptime}), 200
+
+
+@health_bp.route("/health/ready", methods=["GET"])
+@limiter.exempt
+def readiness_check():
+    """Readiness probe from the cached dependency checks"""
+    failing = health_monitor.failing(health_monitor.current_results())
+    if failing:
+        return jsonify({"status": "not ready", "failing": failing}), 503
+    return jsonify({"status": "ready"}), 200
+
+
 @health_bp.route("/health/detailed", methods=["GET"])
+@limiter.exempt
 def detailed_health_check():
-    """Detailed health check with more information"""
+    """Detailed health check with dependency status, latency percentiles and counters"""
     logger.debug("Detailed health check requested")
-    return (
-        jsonify(
-            {
-                "status": "healthy",
-                "message": "Service is running",
-                "version": "1.0.0",
-                "timestamp": "2024-01-01T00:00:00Z",
-            }
-        ),
-        200,
-    )
+    report, ready = health_monitor.report()
+    return jsonify(report), 200 if ready else 503
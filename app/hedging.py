@@ -0,0 +1,194 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+from app import deadline
+from app.metrics import HEDGED, metrics
+
+
+class LatencyTracker:
+    """Latest upstream call latencies, with quantiles refreshed every few calls"""
+
+    def __init__(self, size=1024, refresh_every=16):
+        self.refresh_every = refresh_every
+        self._samples = deque(maxlen=size)
+        self._sorted = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._pending += 1
+            if self._pending >= self.refresh_every or len(self._samples) <= self.refresh_every:
+                self._sorted = sorted(self._samples)
+                self._pending = 0
+
+    def quantile(self, q):
+        """Nearest-rank quantile (0 < q <= 1) in seconds, or None without samples"""
+        ordered = self._sorted
+        if not ordered:
+            return None
+        return ordered[min(max(int(len(ordered) * q + 0.5) - 1, 0), len(ordered) - 1)]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class HedgeBudget:
+    """Token bucket that earns ``ratio`` of a hedge per upstream call, holding at most ``burst``"""
+
+    def __init__(self, ratio=0.05, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def available(self):
+        return self.tokens >= 1
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class Hedger:
+    """Sends a duplicate upstream call when the first is slower than usual
+
+    If a call hasn't answered within the UPSTREAM_HEDGE_PERCENTILE latency of
+    recent calls, the same call is sent again and whichever answers first is
+    used. Hedges are paid for from a budget of UPSTREAM_HEDGE_BUDGET hedges per
+    call, so they add at most that share to upstream spend.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.percentile = 95
+        self.min_delay = 0.1
+        self.min_samples = 20
+        self.budget_ratio = 0.05
+        self.budget_burst = 10
+        self.threads = 64
+        self._after_fork()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("UPSTREAM_HEDGE_ENABLED", True)
+        self.percentile = config.get("UPSTREAM_HEDGE_PERCENTILE", 95)
+        self.min_delay = config.get("UPSTREAM_HEDGE_MIN_DELAY", 0.1)
+        self.min_samples = config.get("UPSTREAM_HEDGE_MIN_SAMPLES", 20)
+        self.budget_ratio = config.get("UPSTREAM_HEDGE_BUDGET", 0.05)
+        self.budget_burst = config.get("UPSTREAM_HEDGE_BURST", 10)
+        self.threads = config.get("UPSTREAM_HEDGE_THREADS", 64)
+        self._after_fork()
+
+    def _after_fork(self):
+        # Worker threads don't survive a fork, and each worker learns its own latencies
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget(self.budget_ratio, self.budget_burst)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.threads, thread_name_prefix="upstream-hedge"
+                    )
+        return self._executor
+
+    def delay(self):
+        """Seconds to give the first call before hedging, or None to not hedge this call"""
+        if not self.enabled or len(self.latency) < self.min_samples:
+            return None
+        if not self.budget.available():
+            return None
+        delay = max(self.min_delay, self.latency.quantile(self.percentile / 100))
+        left = deadline.remaining()
+        # A hedge sent at the deadline couldn't answer in time
+        if left is not None and left <= delay:
+            return None
+        return delay
+
+    def _timed(self, func):
+        started = time.perf_counter()
+        result = func()
+        self.latency.observe(time.perf_counter() - started)
+        return result
+
+    async def _timed_async(self, func):
+        started = time.perf_counter()
+        result = await func()
+        self.latency.observe(time.perf_counter() - started)
+        return result
+
+    def _won(self, winner, hedge):
+        metrics.inc(HEDGED, winner="hedge" if winner is hedge else "first")
+
+    def call(self, func):
+        """Call func(), hedging it if it's slow; returns the first successful answer"""
+        self.budget.deposit()
+        delay = self.delay()
+        if delay is None:
+            return self._timed(func)
+        # Copy the context per call, so both calls see the request's deadline
+        first = self.executor.submit(copy_context().run, self._timed, func)
+        done, _ = wait([first], timeout=delay)
+        if done or not self.budget.withdraw():
+            return first.result()
+        hedge = self.executor.submit(copy_context().run, self._timed, func)
+        pending = {first, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower call can't be interrupted and finishes in the background
+                    self._won(future, hedge)
+                    return future.result()
+            if not pending:
+                return future.result()
+
+    async def call_async(self, func):
+        """Async counterpart of call(); the slower call is cancelled"""
+        self.budget.deposit()
+        delay = self.delay()
+        if delay is None:
+            return await self._timed_async(func)
+        first = asyncio.ensure_future(self._timed_async(func))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self.budget.withdraw():
+            return await first
+        hedge = asyncio.ensure_future(self._timed_async(func))
+        pending = {first, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._won(task, hedge)
+                        return task.result()
+                if not pending:
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+# Global upstream hedger
+hedger = Hedger()
+
+# Each gunicorn worker tracks its own latencies and budget
+os.register_at_fork(after_in_child=hedger._after_fork)
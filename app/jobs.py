@@ -0,0 +1,575 @@
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from flask import Blueprint, current_app, g, jsonify, request, url_for
+
+from app.auth import require_bearer_token
+from app.cache import response_cache
+from app.extractors import extractors
+from app.health import utc_timestamp
+from app.keywords import (
+    batch_cost,
+    cache_bypassed,
+    cached_extract,
+    charge_token_budget,
+    engine_not_allowed,
+    extraction_error,
+    keywords_rate_limit,
+    keywords_rate_limit_key,
+    requested_engine,
+    requested_quality,
+    route_request,
+    unknown_engine,
+    validate_documents,
+)
+from app.limiter import limiter
+from app.metrics import metrics, timed_stage
+
+jobs_bp = Blueprint("jobs", __name__)
+logger = logging.getLogger(__name__)
+
+# Columns returned to clients; the payload (the documents' text) is only read by workers
+JOB_COLUMNS = (
+    "id, owner, status, results, attempts, callback_url, callback_status, error, "
+    "created_at, updated_at"
+)
+
+
+def load_job(row):
+    job = dict(row)
+    job["results"] = json.loads(job["results"])
+    if "payload" in job:
+        job["payload"] = json.loads(job["payload"])
+    return job
+
+
+class JobStore:
+    """Keyword jobs in a SQLite file, shared by every worker process on the host
+
+    A job is claimed by setting a lease on it in a single UPDATE, so each job
+    runs in one worker at a time, and a job whose lease runs out (its worker
+    died) is claimed again by another.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS keyword_jobs ("
+            "id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, results TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, run_after REAL NOT NULL, "
+            "lease TEXT, lease_until REAL, callback_url TEXT, callback_status TEXT, "
+            "error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS keyword_jobs_due ON keyword_jobs (status, run_after)"
+        )
+
+    def _connect(self):
+        # SQLite connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create(self, owner, documents, results, engine, use_cache, callback_url=None):
+        """Queue a job for the pending (index, id, text) documents, returning its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        payload = {"documents": documents, "engine": engine, "use_cache": use_cache}
+        self._connect().execute(
+            "INSERT INTO keyword_jobs (id, owner, status, payload, results, run_after, "
+            "callback_url, callback_status, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                owner,
+                json.dumps(payload),
+                json.dumps(results),
+                now,
+                callback_url,
+                "pending" if callback_url else None,
+                now,
+                now,
+            ),
+        )
+        return job_id
+
+    def claim(self, lease_seconds):
+        """Lease the next due job, or return None when there's nothing to do"""
+        now = time.time()
+        row = (
+            self._connect()
+            .execute(
+                "UPDATE keyword_jobs SET status = 'running', attempts = attempts + 1, "
+                "lease = ?, lease_until = ?, updated_at = ? WHERE id = ("
+                "SELECT id FROM keyword_jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_until <= ?) ORDER BY run_after LIMIT 1) "
+                "RETURNING id, payload, results, attempts, lease, callback_url",
+                (uuid.uuid4().hex, now + lease_seconds, now, now, now),
+            )
+            .fetchone()
+        )
+        return None if row is None else load_job(row)
+
+    def _update_leased(self, job, assignments, values):
+        # Only the worker holding the lease may write, in case it was presumed dead
+        cursor = self._connect().execute(
+            f"UPDATE keyword_jobs SET {assignments}, updated_at = ? WHERE id = ? AND lease = ?",
+            (*values, time.time(), job["id"], job["lease"]),
+        )
+        return cursor.rowcount == 1
+
+    def progress(self, job, results, lease_seconds):
+        """Save partial results and extend the lease"""
+        return self._update_leased(
+            job, "results = ?, lease_until = ?", (json.dumps(results), time.time() + lease_seconds)
+        )
+
+    def reschedule(self, job, results, run_after, error):
+        """Put a job back in the queue to retry its failed documents after run_after"""
+        return self._update_leased(
+            job,
+            "status = 'queued', results = ?, run_after = ?, error = ?, lease = NULL",
+            (json.dumps(results), run_after, error),
+        )
+
+    def complete(self, job, results, error=None):
+        return self._update_leased(
+            job,
+            "status = 'completed', results = ?, error = ?, lease = NULL",
+            (json.dumps(results), error),
+        )
+
+    def set_callback_status(self, job_id, status):
+        self._connect().execute(
+            "UPDATE keyword_jobs SET callback_status = ? WHERE id = ?", (status, job_id)
+        )
+
+    def get(self, job_id):
+        """A job without its payload, or None"""
+        row = (
+            self._connect()
+            .execute(f"SELECT {JOB_COLUMNS} FROM keyword_jobs WHERE id = ?", (job_id,))
+            .fetchone()
+        )
+        return None if row is None else load_job(row)
+
+    def purge(self, before):
+        """Delete completed jobs last updated before the given time"""
+        cursor = self._connect().execute(
+            "DELETE FROM keyword_jobs WHERE status = 'completed' AND updated_at < ?", (before,)
+        )
+        return cursor.rowcount
+
+
+def job_view(job):
+    """JSON body describing a job, with its results once it has completed"""
+    results = job["results"]
+    view = {
+        "id": job["id"],
+        "status": job["status"],
+        "documents": len(results),
+        "processed": sum(1 for result in results if result is not None),
+        "attempts": job["attempts"],
+        "created_at": utc_timestamp(job["created_at"]),
+        "updated_at": utc_timestamp(job["updated_at"]),
+    }
+    if job["status"] == "completed":
+        failed = sum(1 for result in results if "error" in result)
+        view.update(results=results, succeeded=len(results) - failed, failed=failed)
+    if job["error"]:
+        view["last_error"] = job["error"]
+    if job["callback_url"]:
+        view["callback"] = {"url": job["callback_url"], "status": job["callback_status"]}
+    return view
+
+
+def extract_document(payload, item):
+    """Extract one job document, returning (index, result, exception)"""
+    index, doc_id, text = item
+    try:
+        result, _, _ = cached_extract(text, payload["use_cache"], payload["engine"])
+        return index, {"id": doc_id, **result}, None
+    except Exception as exc:
+        return index, {"id": doc_id, **extraction_error(exc)}, exc
+
+
+class JobQueue:
+    """Background workers that drain the job store
+
+    Each process runs JOBS_WORKERS threads that claim due jobs from the
+    shared store, and their extractions all go through one pool of
+    JOBS_CONCURRENCY threads, which bounds the upstream calls a process makes.
+    Documents that fail are retried with exponential backoff, keeping the
+    results the job already has, up to JOBS_MAX_ATTEMPTS runs of the job.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.workers = 2
+        self.concurrency = 4
+        self.max_attempts = 3
+        self.retry_backoff = 2.0
+        self.lease = 300.0
+        self.check_interval = 1.0
+        self.result_ttl = 86400.0
+        self.callback_timeout = 10.0
+        self.callback_hosts = frozenset()
+        self._after_fork()
+
+    def init_app(self, app):
+        config = app.config
+        self.stop()
+        self.path = config.get("JOBS_DB") or None
+        self.workers = config.get("JOBS_WORKERS", 2)
+        self.concurrency = config.get("JOBS_CONCURRENCY", 4)
+        self.max_attempts = config.get("JOBS_MAX_ATTEMPTS", 3)
+        self.retry_backoff = config.get("JOBS_RETRY_BACKOFF", 2.0)
+        self.lease = config.get("JOBS_LEASE", 300.0)
+        self.check_interval = config.get("JOBS_CHECK_INTERVAL", 1.0)
+        self.result_ttl = config.get("JOBS_RESULT_TTL", 86400.0)
+        self.callback_timeout = config.get("JOBS_CALLBACK_TIMEOUT", 10.0)
+        self.callback_hosts = parse_hosts(config.get("JOBS_CALLBACK_ALLOWED_HOSTS", ""))
+        self._store = None
+        self.resume()
+
+    def resume(self):
+        """Start the workers if a previous run left a job database to pick up"""
+        if self.path and os.path.exists(self.path):
+            self.start()
+
+    def _after_fork(self):
+        # Worker threads don't survive a fork, and SQLite connections mustn't be shared
+        self._store = None
+        self._threads = []
+        self._executor = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = JobStore(self.path)
+        return self._store
+
+    def start(self):
+        """Start this process's workers, unless they're already running"""
+        store = self.store
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = stopping = threading.Event()
+            self._executor = executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="keyword-job-extract"
+            )
+            self._threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(store, executor, stopping),
+                    name=f"keyword-jobs-{number}",
+                    daemon=True,
+                )
+                for number in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the workers; jobs they were running are claimed again when their lease runs out"""
+        with self._lock:
+            threads, executor = self._threads, self._executor
+            self._threads, self._executor = [], None
+            self._stopping.set()
+            self._wake.set()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, owner, documents, results, engine, use_cache, callback_url=None):
+        """Queue a job and wake a worker for it, returning the job id"""
+        job_id = self.store.create(owner, documents, results, engine, use_cache, callback_url)
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def _work(self, store, executor, stopping):
+        purged_at = 0.0
+        while not stopping.is_set():
+            try:
+                job = store.claim(self.lease)
+                if job is None and time.monotonic() - purged_at > 60:
+                    purged_at = time.monotonic()
+                    store.purge(time.time() - self.result_ttl)
+            except sqlite3.Error as exc:
+                logger.error("Claiming a keyword job failed: %s", exc)
+                job = None
+            if job is None:
+                self._wake.wait(self.check_interval)
+                self._wake.clear()
+                continue
+            try:
+                self.run(store, executor, job)
+            except Exception:
+                logger.exception("Keyword job %s failed, it will be retried", job["id"])
+
+    def run(self, store, executor, job):
+        """Extract a claimed job's outstanding documents, then complete or reschedule it"""
+        payload, results = job["payload"], job["results"]
+        pending = [item for item in payload["documents"] if results[item[0]] is None]
+        if job["attempts"] > self.max_attempts:
+            # Its workers kept dying before they could finish it
+            for index, doc_id, _ in pending:
+                results[index] = {
+                    "id": doc_id,
+                    "error": "Failed to extract keywords",
+                    "message": "Job was abandoned",
+                }
+            self.finish(store, job, results, "Job was abandoned")
+            return
+
+        failures = {}
+        error = None
+        saved_at = time.monotonic()
+        for index, result, exc in executor.map(
+            lambda item: extract_document(payload, item), pending
+        ):
+            # Configuration errors won't go away on a retry
+            if exc is None or isinstance(exc, ValueError):
+                results[index] = result
+            else:
+                failures[index] = result
+                error = str(exc)
+            if time.monotonic() - saved_at >= 1:
+                saved_at = time.monotonic()
+                if not store.progress(job, results, self.lease):
+                    return
+
+        if failures and job["attempts"] < self.max_attempts:
+            delay = self.retry_backoff * 2 ** (job["attempts"] - 1)
+            logger.warning(
+                "Keyword job %s: %d documents failed, retrying in %ss",
+                job["id"],
+                len(failures),
+                delay,
+            )
+            store.reschedule(job, results, time.time() + delay, error)
+            return
+        for index, result in failures.items():
+            results[index] = result
+        self.finish(store, job, results, error)
+
+    def finish(self, store, job, results, error):
+        if store.complete(job, results, error) and job["callback_url"]:
+            self.deliver(store, job["id"])
+
+    def deliver(self, store, job_id):
+        """POST a completed job to its callback URL, retrying with backoff"""
+        import httpx
+
+        job = store.get(job_id)
+        # Checked again, since the host may resolve elsewhere by now
+        if not callback_allowed(job["callback_url"], self.callback_hosts):
+            logger.warning("Callback for keyword job %s refused: host not allowed", job_id)
+            store.set_callback_status(job_id, "failed")
+            return
+        body = job_view(job)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                response = httpx.post(
+                    job["callback_url"],
+                    json=body,
+                    headers={"X-Keywords-Job": job_id},
+                    timeout=self.callback_timeout,
+                )
+            except httpx.HTTPError as exc:
+                logger.warning("Callback for keyword job %s failed: %s", job_id, exc)
+                continue
+            if response.is_success:
+                store.set_callback_status(job_id, "delivered")
+                return
+            logger.warning("Callback for keyword job %s answered %s", job_id, response.status_code)
+        store.set_callback_status(job_id, "failed")
+
+
+# Global job queue
+job_queue = JobQueue()
+
+# Each gunicorn worker starts its own job workers
+os.register_at_fork(after_in_child=job_queue._after_fork)
+
+
+def jobs_poll_rate_limit():
+    return current_app.config["JOBS_POLL_RATE_LIMIT"]
+
+
+def api_key_rate_limit_key():
+    """Count polling per API key, so clients behind one address don't share a limit"""
+    return f"key:{g.api_key.id}"
+
+
+def parse_hosts(value):
+    """Lower-cased host names from a comma-separated list"""
+    return frozenset(host.strip().lower() for host in value.split(",") if host.strip())
+
+
+def public_host(host, port):
+    """Whether every address host resolves to is a public one"""
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError):
+        return False
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        # Loopback, private, link-local (cloud metadata), reserved and unspecified
+        # addresses aren't global
+        if not address.is_global or address.is_multicast:
+            return False
+    return bool(addresses)
+
+
+def callback_allowed(callback_url, allowed_hosts=frozenset()):
+    """Whether job results may be POSTed to callback_url
+
+    With allowed_hosts, only those hosts (".example.com" for its subdomains)
+    may receive callbacks; without, any host resolving only to public
+    addresses may, so callbacks can't reach the service's own network.
+    """
+    parsed = urlparse(callback_url)
+    host = (parsed.hostname or "").lower()
+    if allowed_hosts:
+        return host in allowed_hosts or any(
+            entry.startswith(".") and host.endswith(entry) for entry in allowed_hosts
+        )
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        return False
+    return public_host(host, port)
+
+
+def invalid_callback_url(callback_url):
+    """Error body for a callback URL that isn't an absolute http(s) URL of an allowed host"""
+    if callback_url is None:
+        return None
+    parsed = urlparse(callback_url) if isinstance(callback_url, str) else None
+    if parsed is None or parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return {
+            "error": "Invalid callback URL",
+            "message": "callback_url must be an absolute http or https URL",
+        }
+    if not callback_allowed(callback_url, job_queue.callback_hosts):
+        return {
+            "error": "Invalid callback URL",
+            "message": "callback_url must point to a public or allowed host",
+        }
+    return None
+
+
+def jobs_disabled():
+    return (
+        jsonify({"error": "Jobs are disabled", "message": "JOBS_DB is not configured"}),
+        503,
+    )
+
+
+@jobs_bp.route("/keywords/jobs", methods=["POST"])
+@require_bearer_token
+@timed_stage(
+    "ratelimit",
+    limiter.shared_limit(
+        keywords_rate_limit, key_func=keywords_rate_limit_key, scope="keywords", cost=batch_cost
+    ),
+)
+def submit_job():
+    # Accept the same payload as /keywords/batch, plus an optional "callback_url"
+    if not job_queue.enabled:
+        return jobs_disabled()
+    with metrics.stage("parse"):
+        data = request.get_json(silent=True)
+    documents = data.get("documents") if isinstance(data, dict) else None
+    if not isinstance(documents, list) or not documents:
+        error_msg = "No documents provided. Send JSON with a non-empty 'documents' array."
+        return jsonify({"error": error_msg}), 400
+
+    max_documents = current_app.config["JOBS_MAX_DOCUMENTS"]
+    if len(documents) > max_documents:
+        error_msg = f"Too many documents. A job may contain at most {max_documents}."
+        return jsonify({"error": error_msg}), 400
+
+    callback_url = data.get("callback_url")
+    error = invalid_callback_url(callback_url)
+    if error is not None:
+        return jsonify(error), 400
+
+    engine = requested_engine(data)
+    error = unknown_engine(engine)
+    if error is not None:
+        return jsonify(error), 400
+
+    results, pending = validate_documents(documents)
+    engine, route = route_request(
+        engine, [text for _, _, text in pending], g.api_key, requested_quality(data)
+    )
+    error = engine_not_allowed(g.api_key, engine)
+    if error is not None:
+        return jsonify(error), 403
+    extractor = extractors.get(engine)
+    error, budget_headers = charge_token_budget(
+        extractor, [text for _, _, text in pending], g.api_key
+    )
+    if error is not None:
+        return jsonify(error), 429, budget_headers
+
+    use_cache = response_cache.enabled and not cache_bypassed(
+        data, request.headers.get("Cache-Control")
+    )
+    job_id = job_queue.submit(
+        g.api_key.id, pending, results, extractor.name, use_cache, callback_url
+    )
+    location = url_for("jobs.get_job", job_id=job_id)
+    with metrics.stage("serialize"):
+        response = jsonify(
+            {"id": job_id, "status": "queued", "documents": len(documents), "url": location}
+        )
+    return response, 202, {"Location": location, "X-Route": route, **budget_headers}
+
+
+@jobs_bp.route("/keywords/jobs/<job_id>", methods=["GET"])
+@require_bearer_token
+@timed_stage("ratelimit", limiter.limit(jobs_poll_rate_limit, key_func=api_key_rate_limit_key))
+def get_job(job_id):
+    """Status of a job, with its results once it has completed"""
+    if not job_queue.enabled:
+        return jobs_disabled()
+    job = job_queue.store.get(job_id)
+    # Other clients' jobs are indistinguishable from missing ones
+    if job is None or job["owner"] != g.api_key.id:
+        return jsonify({"error": "Job not found", "message": f"No job with id {job_id}"}), 404
+    return jsonify(job_view(job)), 200
@@ -0,0 +1,91 @@
+import json
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("orjson", "stdlib")
+
+if orjson is not None:
+    # Flask's own formats for dates and dataclasses, and int keys as strings
+    ORJSON_OPTIONS = (
+        orjson.OPT_SORT_KEYS
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+
+class JSONCodec:
+    """Encodes and decodes the app's JSON with orjson, or the stdlib without it
+
+    Output matches Flask's default provider (sorted keys, compact, the same
+    formats for dates, UUIDs and dataclasses) except that non-ASCII text is
+    sent as UTF-8 rather than escaped. Anything orjson refuses (e.g. integers
+    over 64 bits) is encoded by the stdlib instead.
+    """
+
+    def __init__(self):
+        self.backend = "orjson" if orjson is not None else "stdlib"
+
+    def init_app(self, app):
+        backend = app.config.get("JSON_BACKEND", "orjson")
+        if backend not in BACKENDS:
+            raise ValueError(f"JSON_BACKEND must be one of {', '.join(BACKENDS)}")
+        if backend == "orjson" and orjson is None:
+            logger.warning("orjson is not installed, using the stdlib json module")
+            backend = "stdlib"
+        self.backend = backend
+        app.json = ORJSONProvider(app) if backend == "orjson" else DefaultJSONProvider(app)
+
+    def dumps(self, obj):
+        """Serialize obj to compact UTF-8 JSON bytes"""
+        if self.backend == "orjson":
+            try:
+                return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS)
+            except TypeError:
+                pass
+        return json.dumps(
+            obj,
+            default=DefaultJSONProvider.default,
+            separators=(",", ":"),
+            sort_keys=True,
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+    def loads(self, data):
+        """Deserialize JSON from bytes or str; raises ValueError if malformed"""
+        if self.backend == "orjson":
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson and skips the str round trip"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            # Pretty-printed in debug mode, like the default provider
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumps(obj) + b"\n", mimetype=self.mimetype)
+
+
+# Global JSON codec
+json_codec = JSONCodec()
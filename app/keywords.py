@@ -1,62 +1,881 @@
-from flask import Blueprint, jsonify, request
+import asyncio
+import codecs
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import cache
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+from flask_limiter.util import get_remote_address
 from app.limiter import limiter
 from app.auth import require_bearer_token
-from openai import OpenAI
-from pydantic import BaseModel
-import os
+from app.breaker import UpstreamUnavailable, upstream_guard
+from app.budget import estimate_tokens, token_budget
+from app.cache import response_cache
+from app.chunking import long_documents
+from app.clients import get_async_openai_client, get_openai_client, openai_clients
+from app.corpus import corpus
+from app.deadline import (
+    DEADLINE_HEADER,
+    DEADLINE_PARAM,
+    DeadlineExceeded,
+    deadline_error,
+    parse_deadline,
+    remaining,
+    request_deadline,
+)
+from app.extractors import KeywordExtractor, extractors
+from app.local_extractor import LocalExtractor, content_words
+from app.logs import upstream_headers
+from app.hedging import hedger
+from app.metrics import DEADLINE_FALLBACKS, metrics, timed_stage
+from app.near_duplicates import near_duplicates
+from app.preprocess import preprocessor
+from app.routing import engine_router
+from app.singleflight import single_flight
+from app.streaming import KeywordStreamParser, sse_event
 
 keywords_bp = Blueprint("keywords", __name__)
+logger = logging.getLogger(__name__)
 
+MODEL = "gpt-5-nano"
+SYSTEM_PROMPT = (
+    "Analyze the text and extract the best keywords to use for search engine optimization (SEO)"
+)
 
-def get_openai_client():
-    """Get OpenAI client with API key from environment"""
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    return OpenAI(api_key=api_key)
 
+@cache
+def keyword_array():
+    """Structured output model for the Responses API, defined on first use
 
-@keywords_bp.route("/keywords", methods=["POST"])
-@require_bearer_token
-@limiter.limit("10 per hour")
-def keywords():
+    pydantic is only needed to talk to the upstream, so it isn't imported by
+    workers that never do (e.g. ones only serving the local engine).
+    """
+    from pydantic import BaseModel
+
+    class KeywordArray(BaseModel):
+        keywords: list[str]
+
+    return KeywordArray
+
+
+def build_input(text):
+    """Messages sent to the Responses API for a keyword extraction"""
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT,
+        },
+        {"role": "user", "content": text},
+    ]
+
+
+def parsed_keywords(response):
+    """Turn a parsed Responses API result into a JSON serializable dict"""
+    parsed = response.output_parsed
+    # Ensure JSON serializable
+    return parsed.model_dump() if hasattr(parsed, "model_dump") else parsed
+
+
+def extract_keywords(text, model=MODEL):
+    """Extract keywords from text with the OpenAI Responses API"""
+    client = get_openai_client()
+
+    def call():
+        with upstream_guard.call():
+            return openai_clients.call_with_retries(
+                client.responses.parse,
+                model=model,
+                input=build_input(text),
+                text_format=keyword_array(),
+                extra_headers=upstream_headers(),
+            )
+
+    with metrics.stage("upstream"):
+        response = hedger.call(call)
+    metrics.record_usage(response)
+    return parsed_keywords(response)
+
+
+async def extract_keywords_async(text, model=MODEL):
+    """Extract keywords without blocking the event loop while the upstream responds"""
+    client = get_async_openai_client()
+
+    async def call():
+        with upstream_guard.call():
+            return await openai_clients.async_call_with_retries(
+                client.responses.parse,
+                model=model,
+                input=build_input(text),
+                text_format=keyword_array(),
+                extra_headers=upstream_headers(),
+            )
+
+    with metrics.stage("upstream"):
+        response = await hedger.call_async(call)
+    metrics.record_usage(response)
+    return parsed_keywords(response)
+
+
+def stream_keywords(text, model=MODEL):
+    """Yield ("keyword", keyword) as the model streams them, then ("done", result)"""
+    client = get_openai_client()
+    parser = KeywordStreamParser()
+    with (
+        metrics.stage("upstream"),
+        upstream_guard.call(timed=False),
+        client.responses.stream(
+            model=model,
+            input=build_input(text),
+            text_format=keyword_array(),
+            extra_headers=upstream_headers(),
+        ) as stream,
+    ):
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                for keyword in parser.feed(event.delta):
+                    yield "keyword", keyword
+        response = stream.get_final_response()
+    metrics.record_usage(response)
+    yield "done", parsed_keywords(response)
+
+
+class OpenAIExtractor(KeywordExtractor):
+    """Keyword extraction with the OpenAI Responses API"""
+
+    name = "openai"
+    model = MODEL
+    prompt = SYSTEM_PROMPT
+
+    def extract(self, text):
+        return extract_keywords(text, self.model)
+
+    async def extract_async(self, text):
+        return await extract_keywords_async(text, self.model)
+
+    def stream(self, text):
+        return stream_keywords(text, self.model)
+
+    def input_tokens(self, text):
+        return estimate_tokens(self.prompt) + estimate_tokens(text)
+
+
+extractors.register(OpenAIExtractor())
+extractors.register(LocalExtractor())
+
+
+def cache_bypassed(data, cache_control):
+    """Whether the client asked to skip the response cache for this request"""
+    if "no-cache" in (cache_control or ""):
+        return True
+    return data.get("cache") is False
+
+
+def keywords_rate_limit():
+    """Rate limit shared by the single and batch keyword endpoints"""
+    api_key = g.get("api_key")
+    if api_key is not None and api_key.rate_limit:
+        return api_key.rate_limit
+    return current_app.config["KEYWORDS_RATE_LIMIT"]
+
+
+def keywords_rate_limit_key():
+    """Keys with their own rate limit are counted per key, everyone else per IP address"""
+    api_key = g.get("api_key")
+    if api_key is not None and api_key.rate_limit:
+        return f"key:{api_key.id}"
+    return get_remote_address()
+
+
+def batch_cost():
+    """Charge a batch request one rate-limit hit per document"""
+    data = request.get_json(silent=True)
+    documents = data.get("documents") if isinstance(data, dict) else None
+    return max(len(documents), 1) if isinstance(documents, list) else 1
+
+
+def validate_documents(documents):
+    """Check each document of a batch, returning (results, pending)
+
+    results holds an error for each invalid document and None for the rest;
+    pending lists (index, id, text) for the documents to extract.
+    """
+    results = [None] * len(documents)
+    pending = []
+    for index, document in enumerate(documents):
+        if not isinstance(document, dict) or document.get("id") is None:
+            results[index] = {"id": None, "error": "Each document requires an 'id'"}
+            continue
+        text = document.get("text") or document.get("content")
+        if not isinstance(text, str) or not text.strip():
+            results[index] = {"id": document["id"], "error": "No text provided"}
+            continue
+        text, _, error = prepare_text(text)
+        if error is not None:
+            results[index] = {"id": document["id"], **error}
+            continue
+        pending.append((index, document["id"], text))
+    return results, pending
+
+
+def prepare_text(text):
+    """Preprocess posted text, returning (text, language, error_body)
+
+    error_body is None unless nothing is left of the text or its language
+    isn't accepted.
+    """
+    with metrics.stage("preprocess"):
+        text, language = preprocessor.process(text)
+    if not text.strip():
+        return (
+            text,
+            language,
+            {
+                "error": "No text provided",
+                "message": "Nothing is left of the text once markup is removed.",
+            },
+        )
+    if not preprocessor.language_allowed(language):
+        return (
+            text,
+            language,
+            {
+                "error": "Unsupported language",
+                "message": f"Documents must be in: {', '.join(sorted(preprocessor.languages))}",
+            },
+        )
+    return text, language, None
+
+
+def record_document(extractor, text):
+    """Count a newly seen document in the corpus statistics if the engine ranks by them
+
+    Other engines never read the statistics, so their documents aren't counted.
+    """
+    if corpus.enabled and extractor.uses_corpus:
+        corpus.add_document(content_words(text))
+
+
+def predicted_late(extractor, text):
+    """Deadline fallback engine if the upstream usually takes longer than the time left"""
+    left = remaining()
+    if left is None or not extractor.input_tokens(text):
+        return None
+    typical = hedger.latency.quantile(0.5)
+    if typical is None or left >= typical:
+        return None
+    return extractors.deadline_fallback_for(extractor.name)
+
+
+def fallback_after(extractor, exc):
+    """Engine to answer with after extractor failed with exc, or None"""
+    fallback = extractors.fallback_for(extractor.name)
+    if fallback is None and isinstance(exc, DeadlineExceeded):
+        fallback = extractors.deadline_fallback_for(extractor.name)
+        if fallback is not None:
+            metrics.inc(DEADLINE_FALLBACKS, reason="exceeded")
+    return fallback
+
+
+def extract_and_cache(extractor, text, cache_key, signature=None):
+    """Run an extraction and cache it, returning (result, engine_name, by_deadline)
+
+    If the engine fails and a fallback engine is configured, the fallback's
+    result is returned instead and isn't cached under the engine's key. The
+    deadline fallback engine answers the same way when the request's deadline
+    passes, or would pass going by the engine's usual latency; by_deadline
+    tells these answers apart. Cached results are also indexed for
+    near-duplicate lookups, under signature if the caller already computed it.
+    """
+    record_document(extractor, text)
+    fallback = predicted_late(extractor, text)
+    if fallback is not None:
+        metrics.inc(DEADLINE_FALLBACKS, reason="predicted")
+        record_document(fallback, text)
+        return fallback.extract(text), fallback.name, True
+    try:
+        if long_documents.is_long(extractor, text):
+            result = long_documents.extract(extractor, text)
+        else:
+            result = extractor.extract(text)
+    except Exception as exc:
+        fallback = fallback_after(extractor, exc)
+        if fallback is None:
+            raise
+        logger.warning(
+            "Engine %s failed (%s), falling back to %s", extractor.name, exc, fallback.name
+        )
+        record_document(fallback, text)
+        return fallback.extract(text), fallback.name, isinstance(exc, DeadlineExceeded)
+
+    # Bypassed requests still refresh the entry so the next caller gets the new result
+    if response_cache.enabled:
+        response_cache.set(cache_key, result)
+        index_near_duplicate(extractor, text, signature, result)
+    return result, extractor.name, False
+
+
+async def extract_and_cache_async(extractor, text, cache_key, signature=None):
+    """Async counterpart of extract_and_cache"""
+    record_document(extractor, text)
+    fallback = predicted_late(extractor, text)
+    if fallback is not None:
+        metrics.inc(DEADLINE_FALLBACKS, reason="predicted")
+        record_document(fallback, text)
+        return await fallback.extract_async(text), fallback.name, True
+    try:
+        if long_documents.is_long(extractor, text):
+            result = await long_documents.extract_async(extractor, text)
+        else:
+            result = await extractor.extract_async(text)
+    except Exception as exc:
+        fallback = fallback_after(extractor, exc)
+        if fallback is None:
+            raise
+        logger.warning(
+            "Engine %s failed (%s), falling back to %s", extractor.name, exc, fallback.name
+        )
+        record_document(fallback, text)
+        return (
+            await fallback.extract_async(text),
+            fallback.name,
+            isinstance(exc, DeadlineExceeded),
+        )
+
+    if response_cache.enabled:
+        response_cache.set(cache_key, result)
+        index_near_duplicate(extractor, text, signature, result)
+    return result, extractor.name, False
+
+
+def index_near_duplicate(extractor, text, signature, result):
+    if signature is None:
+        signature = near_duplicates.signature(text)
+    near_duplicates.add(extractor.name, signature, result)
+
+
+def near_duplicate_result(extractor, signature):
+    """Cached result of an almost identical text, with its similarity, or None"""
+    match = near_duplicates.lookup(extractor.name, signature)
+    if match is None:
+        return None
+    result, score = match
+    return {**result, "similarity": score}
+
+
+def published_result(extractor):
+    """Lookup for a result another worker has written to the shared cache"""
+
+    def lookup(cache_key):
+        result = response_cache.shared.get(cache_key)
+        return None if result is None else (result, extractor.name, False)
+
+    return lookup
+
+
+def not_by_deadline(outcome):
+    """Whether an extract_and_cache outcome may be reused by requests with other deadlines"""
+    return not outcome[2]
+
+
+def coalesced_deadline_fallback(extractor, exc):
+    """Engine to answer with once the deadline passed waiting on another request's call
+
+    Re-raises exc if no fallback engine is configured.
+    """
+    fallback = fallback_after(extractor, exc)
+    if fallback is None:
+        raise exc
+    return fallback
+
+
+def cached_extract(text, use_cache=True, engine=None):
+    """Extract keywords through the response cache
+
+    Returns (result, cache_status, engine_name). Concurrent misses for the
+    same text share a single extraction and report "COALESCED"; a text almost
+    identical to one already extracted gets its result, with a "similarity"
+    field, and reports "NEAR".
+    """
+    extractor = extractors.get(engine)
+    cache_key = extractor.cache_key(text)
+    if not use_cache:
+        result, engine_name, _ = extract_and_cache(extractor, text, cache_key)
+        return result, "BYPASS", engine_name
+
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, "HIT", extractor.name
+    signature = near_duplicates.signature(text)
+    near = near_duplicate_result(extractor, signature)
+    if near is not None:
+        return near, "NEAR", extractor.name
+    try:
+        (result, engine_name, _), coalesced = single_flight.do(
+            cache_key,
+            lambda: extract_and_cache(extractor, text, cache_key, signature),
+            published_result(extractor),
+            shareable=not_by_deadline,
+        )
+    except DeadlineExceeded as exc:
+        fallback = coalesced_deadline_fallback(extractor, exc)
+        return fallback.extract(text), "MISS", fallback.name
+    return result, "COALESCED" if coalesced else "MISS", engine_name
+
+
+async def cached_extract_async(text, use_cache=True, engine=None):
+    """Async counterpart of cached_extract used by the ASGI serving mode"""
+    extractor = extractors.get(engine)
+    cache_key = extractor.cache_key(text)
+    if not use_cache:
+        result, engine_name, _ = await extract_and_cache_async(extractor, text, cache_key)
+        return result, "BYPASS", engine_name
+
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, "HIT", extractor.name
+    # Hashing a large text takes long enough to stall every other request
+    loop = asyncio.get_running_loop()
+    signature = await loop.run_in_executor(None, near_duplicates.signature, text)
+    near = near_duplicate_result(extractor, signature)
+    if near is not None:
+        return near, "NEAR", extractor.name
+    try:
+        (result, engine_name, _), coalesced = await single_flight.do_async(
+            cache_key,
+            lambda: extract_and_cache_async(extractor, text, cache_key, signature),
+            published_result(extractor),
+            shareable=not_by_deadline,
+        )
+    except DeadlineExceeded as exc:
+        fallback = coalesced_deadline_fallback(extractor, exc)
+        return await fallback.extract_async(text), "MISS", fallback.name
+    return result, "COALESCED" if coalesced else "MISS", engine_name
+
+
+def unknown_engine(engine):
+    """Error body for an engine name that isn't registered, or None if it's valid"""
+    if engine is None or (isinstance(engine, str) and engine in extractors):
+        return None
+    return {
+        "error": "Unknown engine",
+        "message": f"Engine must be one of: {', '.join(extractors.names())}",
+    }
+
+
+def engine_not_allowed(api_key, engine):
+    """Error body if the caller's API key may not use the engine, or None"""
+    if api_key.allows_engine(extractors.get(engine).name):
+        return None
+    return {
+        "error": "Engine not allowed",
+        "message": f"This API key may use: {', '.join(sorted(api_key.engines))}",
+    }
+
+
+def budget_limits(api_key):
+    """The API key's own token budget if it has one, otherwise the configured one"""
+    return api_key.token_budget if api_key.token_budget is not None else token_budget.limits
+
+
+def charge_token_budget(extractor, texts, api_key):
+    """Charge the caller's token budget for texts, returning (error_body, headers)
+
+    error_body is None when the request fits in the caller's remaining budget.
+    The API key's own budget, if it has one, replaces the configured one.
+    """
+    limits = budget_limits(api_key)
+    if not limits:
+        return None, {}
+    tokens = sum(extractor.input_tokens(text) for text in texts)
+    allowed, headers = token_budget.charge(api_key.id, tokens, limits)
+    if allowed:
+        # Refunds only go back to the windows these tokens were charged to
+        g.token_budget_windows = token_budget.windows(api_key.id, limits)
+        return None, headers
+    remaining = headers["X-TokenBudget-Remaining"]
+    return {
+        "error": "Token budget exceeded",
+        "message": f"Request needs about {tokens} tokens but {remaining} remain. "
+        "Please try again later.",
+    }, headers
+
+
+def refund_token_budget(extractor, texts, api_key, budget_headers):
+    """Give back what charge_token_budget charged for texts no upstream call answered
+
+    Returns budget_headers updated to the remaining budget and the cost that's left.
+    """
+    if not budget_headers:
+        return budget_headers
+    limits = budget_limits(api_key)
+    tokens = sum(extractor.input_tokens(text) for text in texts)
+    if tokens:
+        token_budget.refund(api_key.id, tokens, g.token_budget_windows, limits)
+    cost = int(budget_headers["X-TokenBudget-Cost"]) - tokens
+    return token_budget.headers(api_key.id, cost, limits=limits)
+
+
+def upstream_called(extractor, cache_status, engine):
+    """Whether a cached_extract answer came from a call to extractor, which is charged for"""
+    return cache_status in ("MISS", "BYPASS") and engine == extractor.name
+
+
+def extraction_error(exc):
+    """Map an extraction failure to the JSON error body returned to clients"""
+    if isinstance(exc, ValueError):
+        return {"error": "Configuration error", "message": str(exc)}
+    if isinstance(exc, UpstreamUnavailable):
+        return {"error": "Upstream unavailable", "message": f"{exc}. Please try again later."}
+    if isinstance(exc, DeadlineExceeded):
+        return {"error": "Deadline exceeded", "message": str(exc)}
+    return {"error": "Failed to extract keywords", "message": str(exc)}
+
+
+def extraction_failure(exc):
+    """Status and extra headers for a failed extraction"""
+    if isinstance(exc, UpstreamUnavailable):
+        return 503, {"Retry-After": str(exc.retry_after)}
+    if isinstance(exc, DeadlineExceeded):
+        return 504, {}
+    return 500, {}
+
+
+def read_text_body(block_size=64 * 1024):
+    """Decode the raw request body as it's read, without keeping a bytes copy around"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts = []
+    while block := request.stream.read(block_size):
+        parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def read_posted_text():
+    """Read the text to analyze from the request, returning (posted_text, json_data)"""
     # Accept either JSON payload {"text": "..."} / {"content": "..."}
     # or raw text body
-    posted_text = None
     if request.is_json:
-        data = request.get_json(silent=True) or {}
-        posted_text = data.get("text") or data.get("content")
-    else:
-        posted_text = request.get_data(as_text=True)
+        return json_posted_text(request.get_json(silent=True))
+    return read_text_body(), {}
+
+
+def json_posted_text(data):
+    """(posted_text, json_data) of a JSON body; only an object with a string text has one"""
+    if not isinstance(data, dict):
+        return None, {}
+    posted_text = data.get("text") or data.get("content")
+    return (posted_text if isinstance(posted_text, str) else None), data
+
+
+def requested_engine(data):
+    """Engine named in the JSON body or query string, or None for the default"""
+    return data.get("engine") or request.args.get("engine")
+
+
+def requested_quality(data):
+    """Quality hint in the JSON body or query string, which routing rules may match
+
+    Hints that aren't strings can't match a rule and are ignored.
+    """
+    quality = data.get("quality") or request.args.get("quality")
+    return quality if isinstance(quality, str) else None
+
 
+def route_request(engine, texts, api_key, quality):
+    """Engine for a request, routed by its longest text, and the route that chose it"""
+    tokens = max((estimate_tokens(text) for text in texts), default=0)
+    return engine_router.route(engine, tokens, api_key, quality)
+
+
+def requested_deadline(data):
+    """Seconds the client gives the request, from the header, JSON body or query string
+
+    Returns None without a deadline and raises ValueError for a malformed one.
+    """
+    return parse_deadline(
+        request.headers.get(DEADLINE_HEADER)
+        or data.get(DEADLINE_PARAM)
+        or request.args.get(DEADLINE_PARAM)
+    )
+
+
+class KeywordsRequest:
+    """A POST /keywords request that was validated, routed and charged, ready to extract"""
+
+    def __init__(self, text, language, engine, route, deadline, use_cache, budget_headers):
+        self.text = text
+        self.language = language
+        self.engine = engine
+        self.route = route
+        self.deadline = deadline
+        self.use_cache = use_cache
+        self.extractor = extractors.get(engine)
+        self.budget_headers = budget_headers
+
+
+def prepare_keywords_request():
+    """Read and check the POST /keywords request being handled
+
+    Returns a KeywordsRequest, or the error response to send. The Flask view
+    and the ASGI front end both go through this and only differ in how they
+    run the extraction.
+    """
+    with metrics.stage("parse"):
+        posted_text, data = read_posted_text()
     if not posted_text or not posted_text.strip():
         error_msg = "No text provided. Send raw text or JSON with 'text' or 'content'."
         return jsonify({"error": error_msg}), 400
+    posted_text, language, error = prepare_text(posted_text)
+    if error is not None:
+        return jsonify(error), 400
 
-    class KeywordArray(BaseModel):
-        keywords: list[str]
+    engine = requested_engine(data)
+    error = unknown_engine(engine)
+    if error is not None:
+        return jsonify(error), 400
+    engine, route = route_request(engine, [posted_text], g.api_key, requested_quality(data))
+    error = engine_not_allowed(g.api_key, engine)
+    if error is not None:
+        return jsonify(error), 403
+    try:
+        deadline = requested_deadline(data)
+    except ValueError:
+        return jsonify(deadline_error()), 400
+
+    # Charged up front so requests over budget are refused before any work, and
+    # refunded once extracted if no upstream call answered
+    error, budget_headers = charge_token_budget(extractors.get(engine), [posted_text], g.api_key)
+    if error is not None:
+        return jsonify(error), 429, budget_headers
 
+    use_cache = response_cache.enabled and not cache_bypassed(
+        data, request.headers.get("Cache-Control")
+    )
+    return KeywordsRequest(
+        posted_text, language, engine, route, deadline, use_cache, budget_headers
+    )
+
+
+def keywords_answered(prepared, result, cache_status, engine):
+    """Response to a KeywordsRequest from what cached_extract returned for it"""
+    budget_headers = prepared.budget_headers
+    if not upstream_called(prepared.extractor, cache_status, engine):
+        budget_headers = refund_token_budget(
+            prepared.extractor, [prepared.text], g.api_key, budget_headers
+        )
+    with metrics.stage("serialize"):
+        response = jsonify(result)
+    headers = {
+        "X-Cache": cache_status,
+        "X-Engine": engine,
+        "X-Route": prepared.route,
+        **budget_headers,
+    }
+    if prepared.language is not None:
+        headers["X-Language"] = prepared.language
+    return response, 200, headers
+
+
+def keywords_failed(prepared, exc):
+    """Error response to a KeywordsRequest whose extraction raised exc"""
+    budget_headers = refund_token_budget(
+        prepared.extractor, [prepared.text], g.api_key, prepared.budget_headers
+    )
+    status, headers = extraction_failure(exc)
+    return jsonify(extraction_error(exc)), status, {**headers, **budget_headers}
+
+
+@keywords_bp.route("/keywords", methods=["POST"])
+@require_bearer_token
+@timed_stage(
+    "ratelimit",
+    limiter.shared_limit(keywords_rate_limit, key_func=keywords_rate_limit_key, scope="keywords"),
+)
+def keywords():
+    prepared = prepare_keywords_request()
+    if not isinstance(prepared, KeywordsRequest):
+        return prepared
     try:
-        client = get_openai_client()
-        system_content = (
-            "Analyze the text and extract the best keywords to use for "
-            "search engine optimization (SEO)"
-        )
-        response = client.responses.parse(
-            model="gpt-5-nano",
-            input=[
-                {
-                    "role": "system",
-                    "content": system_content,
-                },
-                {"role": "user", "content": posted_text},
-            ],
-            text_format=KeywordArray,
-        )
-        parsed = response.output_parsed
-        # Ensure JSON serializable
-        return jsonify(parsed.model_dump() if hasattr(parsed, "model_dump") else parsed), 200
-    except ValueError as e:
-        return jsonify({"error": "Configuration error", "message": str(e)}), 500
-    except Exception as exc:  # pragma: no cover
-        return jsonify({"error": "Failed to extract keywords", "message": str(exc)}), 500
+        with request_deadline(prepared.deadline):
+            outcome = cached_extract(prepared.text, prepared.use_cache, prepared.engine)
+    except Exception as exc:
+        return keywords_failed(prepared, exc)
+    return keywords_answered(prepared, *outcome)
+
+
+@require_bearer_token
+@timed_stage(
+    "ratelimit",
+    limiter.shared_limit(keywords_rate_limit, key_func=keywords_rate_limit_key, scope="keywords"),
+)
+def admit_keywords_request():
+    """prepare_keywords_request behind the /keywords view's authentication and rate limit
+
+    For the ASGI front end, which awaits the extraction itself.
+    """
+    return prepare_keywords_request()
+
+
+@keywords_bp.route("/keywords/stream", methods=["POST"])
+@require_bearer_token
+@timed_stage(
+    "ratelimit",
+    limiter.shared_limit(keywords_rate_limit, key_func=keywords_rate_limit_key, scope="keywords"),
+)
+def keywords_stream():
+    """Stream keywords as Server-Sent Events while the model produces them"""
+    with metrics.stage("parse"):
+        posted_text, data = read_posted_text()
+    if not posted_text or not posted_text.strip():
+        error_msg = "No text provided. Send raw text or JSON with 'text' or 'content'."
+        return jsonify({"error": error_msg}), 400
+    posted_text, language, error = prepare_text(posted_text)
+    if error is not None:
+        return jsonify(error), 400
+
+    engine = requested_engine(data)
+    error = unknown_engine(engine)
+    if error is not None:
+        return jsonify(error), 400
+    engine, route = route_request(engine, [posted_text], g.api_key, requested_quality(data))
+    error = engine_not_allowed(g.api_key, engine)
+    if error is not None:
+        return jsonify(error), 403
+
+    extractor = extractors.get(engine)
+    error, budget_headers = charge_token_budget(extractor, [posted_text], g.api_key)
+    if error is not None:
+        return jsonify(error), 429, budget_headers
+
+    use_cache = response_cache.enabled and not cache_bypassed(
+        data, request.headers.get("Cache-Control")
+    )
+    cache_key = extractor.cache_key(posted_text)
+    cached = response_cache.get(cache_key) if use_cache else None
+    signature = None
+    if cached is not None:
+        cache_status = "HIT"
+    elif use_cache:
+        signature = near_duplicates.signature(posted_text)
+        cached = near_duplicate_result(extractor, signature)
+        cache_status = "MISS" if cached is None else "NEAR"
+    else:
+        cache_status = "BYPASS"
+    if cached is not None:
+        budget_headers = refund_token_budget(extractor, [posted_text], g.api_key, budget_headers)
+
+    def generate():
+        if cached is not None:
+            for keyword in cached.get("keywords", []):
+                yield sse_event("keyword", keyword)
+            yield sse_event("done", cached)
+            return
+        record_document(extractor, posted_text)
+        if long_documents.is_long(extractor, posted_text):
+            events = long_documents.stream(extractor, posted_text)
+        else:
+            events = extractor.stream(posted_text)
+        try:
+            for event, payload in events:
+                if event == "done" and response_cache.enabled:
+                    response_cache.set(cache_key, payload)
+                    index_near_duplicate(extractor, posted_text, signature, payload)
+                yield sse_event(event, payload)
+        except Exception as exc:
+            refund_token_budget(extractor, [posted_text], g.api_key, budget_headers)
+            yield sse_event("error", extraction_error(exc))
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "X-Cache": cache_status,
+        "X-Engine": extractor.name,
+        "X-Route": route,
+        **budget_headers,
+    }
+    if language is not None:
+        headers["X-Language"] = language
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+
+@keywords_bp.route("/keywords/batch", methods=["POST"])
+@require_bearer_token
+@timed_stage(
+    "ratelimit",
+    limiter.shared_limit(
+        keywords_rate_limit, key_func=keywords_rate_limit_key, scope="keywords", cost=batch_cost
+    ),
+)
+def keywords_batch():
+    # Accept JSON payload {"documents": [{"id": "...", "text": "..."}, ...]}
+    with metrics.stage("parse"):
+        data = request.get_json(silent=True)
+    documents = data.get("documents") if isinstance(data, dict) else None
+    if not isinstance(documents, list) or not documents:
+        error_msg = "No documents provided. Send JSON with a non-empty 'documents' array."
+        return jsonify({"error": error_msg}), 400
+
+    engine = requested_engine(data)
+    error = unknown_engine(engine)
+    if error is not None:
+        return jsonify(error), 400
+
+    max_items = current_app.config["KEYWORDS_BATCH_MAX_ITEMS"]
+    if len(documents) > max_items:
+        error_msg = f"Too many documents. A batch may contain at most {max_items}."
+        return jsonify({"error": error_msg}), 400
+
+    # Validate every document up front; invalid ones fail on their own
+    results, pending = validate_documents(documents)
+    engine, route = route_request(
+        engine, [text for _, _, text in pending], g.api_key, requested_quality(data)
+    )
+    error = engine_not_allowed(g.api_key, engine)
+    if error is not None:
+        return jsonify(error), 403
+
+    # The whole batch is charged up front, so it's accepted or throttled as one;
+    # documents no upstream call answered are refunded below
+    extractor = extractors.get(engine)
+    error, budget_headers = charge_token_budget(
+        extractor,
+        [text for _, _, text in pending],
+        g.api_key,
+    )
+    if error is not None:
+        return jsonify(error), 429, budget_headers
+
+    use_cache = response_cache.enabled and not cache_bypassed(
+        data, request.headers.get("Cache-Control")
+    )
+
+    def run(item):
+        """(index, result, upstream_called) for one document"""
+        index, doc_id, text = item
+        try:
+            result, cache_status, engine_name = cached_extract(text, use_cache, engine)
+            called = upstream_called(extractor, cache_status, engine_name)
+            return index, {"id": doc_id, **result}, called
+        except Exception as exc:
+            return index, {"id": doc_id, **extraction_error(exc)}, False
+
+    refunded = []
+    if pending:
+        concurrency = min(current_app.config["KEYWORDS_BATCH_CONCURRENCY"], len(pending))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Copies of the request's context, so the documents' logs carry its request ID
+            futures = [executor.submit(copy_context().run, run, item) for item in pending]
+            for item, future in zip(pending, futures):
+                index, item_result, called = future.result()
+                results[index] = item_result
+                if not called:
+                    refunded.append(item[2])
+    if refunded:
+        budget_headers = refund_token_budget(extractor, refunded, g.api_key, budget_headers)
+
+    failed = sum(1 for result in results if "error" in result)
+    with metrics.stage("serialize"):
+        response = jsonify(
+            {"results": results, "succeeded": len(results) - failed, "failed": failed}
+        )
+    return response, 200, {"X-Route": route, **budget_headers}
@@ -0,0 +1,116 @@
+import re
+
+import numpy as np
+
+from app.corpus import corpus
+from app.extractors import KeywordExtractor
+
+STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are as at be because been before
+    being below between both but by can could did do does doing down during each either else
+    etc even ever every few for from further get gets got had has have having he her here hers
+    herself him himself his how however i if in into is it its itself just least less let like
+    may me might more most much must my myself neither no nor not now of off often on once one
+    only or other others our ours ourselves out over own per quite rather really said same say
+    says she should since so some such than that the their theirs them themselves then there
+    these they this those though through thus to too under until up upon us use used using very
+    via was we well were what when where whether which while who whom whose why will with within
+    without would yet you your yours yourself yourselves
+    """.split())
+
+# Punctuation that always ends a candidate phrase
+PHRASE_DELIMITERS = re.compile(r"[.,;:!?()\[\]{}\"“”‘’|/\\<>*#=+\n\r\t]+")
+# Words start with a letter and may contain digits, apostrophes or hyphens
+WORD = re.compile(r"[^\W\d_][\w'-]*")
+
+
+def candidate_phrases(text, max_words=3):
+    """Yield runs of content words split on stopwords and punctuation"""
+    for fragment in PHRASE_DELIMITERS.split(text.lower()):
+        phrase = []
+        for token in WORD.findall(fragment):
+            token = token.strip("'-")
+            if len(token) < 2 or token in STOPWORDS:
+                if phrase:
+                    yield tuple(phrase)
+                    phrase = []
+                continue
+            phrase.append(token)
+            if len(phrase) == max_words:
+                yield tuple(phrase)
+                phrase = []
+        if phrase:
+            yield tuple(phrase)
+
+
+def content_words(text):
+    """Distinct content words of a document, as counted by the corpus index"""
+    return {word for phrase in candidate_phrases(text) for word in phrase}
+
+
+def rank_phrases(phrases, word_weight=None):
+    """Rank phrases RAKE-style: words score degree/frequency, phrases the sum of their words
+
+    Phrases are weighted by how often they occur, and ties keep document order
+    so the ranking is deterministic. ``word_weight`` optionally maps the list of
+    distinct words to an array of per-word multipliers (e.g. IDF).
+    """
+    phrases = list(phrases)
+    if not phrases:
+        return []
+    word_ids = {}
+    phrase_ids = {}
+    tokens = np.fromiter(
+        (word_ids.setdefault(word, len(word_ids)) for phrase in phrases for word in phrase),
+        dtype=np.int64,
+    )
+    occurrences = np.fromiter(
+        (phrase_ids.setdefault(phrase, len(phrase_ids)) for phrase in phrases), dtype=np.int64
+    )
+    lengths = np.fromiter((len(phrase) for phrase in phrases), dtype=np.int64)
+
+    frequency = np.bincount(tokens, minlength=len(word_ids))
+    degree = np.bincount(tokens, weights=np.repeat(lengths, lengths), minlength=len(word_ids))
+    word_scores = degree / frequency
+    if word_weight is not None:
+        word_scores = word_scores * word_weight(list(word_ids))
+
+    starts = np.cumsum(lengths) - lengths
+    occurrence_scores = np.add.reduceat(word_scores[tokens], starts)
+    # Rounding keeps float noise from reordering phrases that tie exactly
+    scores = np.round(np.bincount(occurrences, weights=occurrence_scores), 9)
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    unique_phrases = list(phrase_ids)
+    return [unique_phrases[i] for i in order]
+
+
+class LocalExtractor(KeywordExtractor):
+    """Offline, deterministic keyword extraction with no network round-trip"""
+
+    name = "local"
+
+    def __init__(self, max_keywords=10, max_words=3, use_idf=False):
+        self.max_keywords = max_keywords
+        self.max_words = max_words
+        self.use_idf = use_idf
+        self.model = self._model_id()
+
+    def init_app(self, app):
+        self.max_keywords = app.config.get("LOCAL_MAX_KEYWORDS", 10)
+        self.max_words = app.config.get("LOCAL_MAX_PHRASE_WORDS", 3)
+        self.use_idf = app.config.get("CORPUS_ENABLED", True)
+        self.model = self._model_id()
+
+    @property
+    def uses_corpus(self):
+        return self.use_idf
+
+    def _model_id(self):
+        # Settings that change the output are part of the cache key
+        weighting = "idf" if self.use_idf else "raw"
+        return f"local-rake-v1:{self.max_keywords}:{self.max_words}:{weighting}"
+
+    def extract(self, text):
+        word_weight = corpus.idf if self.use_idf and corpus.enabled else None
+        ranked = rank_phrases(candidate_phrases(text, self.max_words), word_weight)
+        return {"keywords": [" ".join(phrase) for phrase in ranked[: self.max_keywords]]}
@@ -0,0 +1,270 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request
+
+from app.metrics import LOG_RECORDS_DROPPED, LOG_RECORDS_SUPPRESSED, metrics
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# IDs sent by clients are only kept if they look like one, so they can't forge log lines
+VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+FORMATS = ("json", "text")
+# Attributes every LogRecord has; anything else on a record was passed in `extra`
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+MAX_REPEAT_KEYS = 1024
+
+access_logger = logging.getLogger("app.access")
+
+# ID of the request being handled, which follows it into hedged and chunked calls
+_request_id = ContextVar("keywords_request_id", default=None)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def request_id_for(incoming):
+    """The client's request ID if it looks like one, otherwise a new one"""
+    if incoming and VALID_REQUEST_ID.fullmatch(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+def upstream_headers():
+    """Headers passing the current request ID on to the upstream API, or None"""
+    request_id = _request_id.get()
+    return {REQUEST_ID_HEADER: request_id} if request_id is not None else None
+
+
+def parse_sample_rates(value):
+    """{endpoint: rate} from "endpoint=rate" pairs, e.g. "/health=0.01,/metrics=0" """
+    rates = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        endpoint, separator, rate = pair.rpartition("=")
+        if not separator or not endpoint:
+            raise ValueError(f"LOG_SAMPLE_RATES entries must be endpoint=rate, got {pair!r}")
+        rates[endpoint] = float(rate)
+    return rates
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request ID and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """Lets a warning or error through once per ``interval`` seconds per message
+
+    Messages are told apart by logger, level and unformatted template, so
+    "Rate limit exceeded: %s" repeats whichever address it's logged for. The
+    next record let through carries how many were held back meanwhile in a
+    ``suppressed`` field.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.interval:
+                seen[1] += 1
+                suppressed = None
+            else:
+                if len(self._seen) >= MAX_REPEAT_KEYS:
+                    self._seen.clear()
+                suppressed = seen[1] if seen is not None else 0
+                self._seen[key] = [now, 0]
+        if suppressed is None:
+            metrics.inc(LOG_RECORDS_SUPPRESSED)
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class BackgroundHandler(QueueHandler):
+    """Queues records for the listener thread, which formats and writes them
+
+    Unlike QueueHandler, records are only stamped with the request ID here,
+    not formatted, and a full queue drops (and counts) the record instead of
+    raising, so a logging call never waits on I/O.
+    """
+
+    def prepare(self, record):
+        record.request_id = _request_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc(LOG_RECORDS_DROPPED)
+
+
+class RequestLogging:
+    """Logging set up so request threads never format or write log records
+
+    Records go through a bounded queue to a background thread that writes
+    them to stderr, as JSON (LOG_FORMAT=json) or text. Each carries the ID of
+    the request it was logged for, taken from X-Request-ID or generated, which
+    is also sent to the upstream API and returned to the client. Repeated
+    warnings are written once per LOG_DEDUP_INTERVAL seconds, and every
+    request gets a line in the app.access log, sampled per endpoint by
+    LOG_SAMPLE_RATES, except server errors, which are always written.
+    """
+
+    def __init__(self):
+        self.format = "json"
+        self.queue_size = 10000
+        self.sample_rate = 1.0
+        self.sample_rates = {}
+        self.handler = None
+        self.output = None
+        self.listener = None
+
+    def init_app(self, app):
+        config = app.config
+        self.format = config.get("LOG_FORMAT", "json")
+        if self.format not in FORMATS:
+            raise ValueError(f"LOG_FORMAT must be one of {', '.join(FORMATS)}")
+        self.queue_size = config.get("LOG_QUEUE_SIZE", 10000)
+        self.sample_rate = config.get("LOG_SAMPLE_RATE", 1.0)
+        self.sample_rates = parse_sample_rates(config.get("LOG_SAMPLE_RATES", ""))
+
+        self.stop()
+        root = logging.getLogger()
+        root.setLevel(getattr(logging, config["LOG_LEVEL"]))
+        if self.handler is not None:
+            root.removeHandler(self.handler)
+        self.output = logging.StreamHandler()
+        self.output.setFormatter(
+            JSONFormatter() if self.format == "json" else logging.Formatter(TEXT_FORMAT)
+        )
+        self.handler = BackgroundHandler(queue.Queue(self.queue_size))
+        self.handler.addFilter(RepeatFilter(config.get("LOG_DEDUP_INTERVAL", 10.0)))
+        root.addHandler(self.handler)
+        self.start()
+
+        app.before_request(start_request)
+        app.after_request(finish_request)
+        app.teardown_request(end_request)
+
+    def start(self):
+        self.listener = QueueListener(self.handler.queue, self.output)
+        self.listener.start()
+
+    def stop(self):
+        """Write out the queued records and stop the listener thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _after_fork(self):
+        # The listener thread doesn't survive a fork, and the queue's lock may
+        # have been held when it happened; the parent writes what it queued
+        if self.handler is not None:
+            self.handler.queue = queue.Queue(self.queue_size)
+            self.start()
+
+    def sample_rate_for(self, endpoint, status):
+        if status >= 500:
+            return 1.0
+        return self.sample_rates.get(endpoint, self.sample_rate)
+
+    def log_access(self, method, path, endpoint, status, seconds, **fields):
+        """Write a sampled access log line for a finished request"""
+        rate = self.sample_rate_for(endpoint, status)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return
+        if rate < 1:
+            fields["sample_rate"] = rate
+        access_logger.info(
+            "%s %s %s",
+            method,
+            path,
+            status,
+            extra={
+                "method": method,
+                "path": path,
+                "endpoint": endpoint,
+                "status": status,
+                "duration_ms": round(seconds * 1000, 3),
+                **fields,
+            },
+        )
+
+
+def start_request():
+    g.request_id = request_id_for(request.headers.get(REQUEST_ID_HEADER))
+    _request_id.set(g.request_id)
+    g.log_started = time.perf_counter()
+
+
+def finish_request(response):
+    started = g.pop("log_started", None)
+    if started is None:
+        return response
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    api_key = g.get("api_key")
+    request_logging.log_access(
+        request.method,
+        request.path,
+        request.url_rule.rule if request.url_rule else "unmatched",
+        response.status_code,
+        time.perf_counter() - started,
+        remote_addr=request.remote_addr,
+        key=api_key.id if api_key is not None else None,
+        engine=response.headers.get("X-Engine"),
+        cache=response.headers.get("X-Cache"),
+    )
+    return response
+
+
+def end_request(exc):
+    # Streamed responses may end in another context than the one that set it
+    _request_id.set(None)
+
+
+# Global request logging
+request_logging = RequestLogging()
+
+# Each gunicorn worker writes its own records; queued ones are written at exit
+os.register_at_fork(after_in_child=request_logging._after_fork)
+atexit.register(request_logging.stop)
@@ -0,0 +1,429 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+from flask import Blueprint, Response, abort, g, request
+
+from app.limiter import limiter
+
+metrics_bp = Blueprint("metrics", __name__)
+
+REQUESTS = "keywords_http_requests_total"
+ERRORS = "keywords_http_errors_total"
+REQUEST_SECONDS = "keywords_http_request_duration_seconds"
+STAGE_SECONDS = "keywords_stage_duration_seconds"
+UPSTREAM_TOKENS = "keywords_upstream_tokens_total"
+UPSTREAM_REJECTED = "keywords_upstream_rejected_total"
+CIRCUIT_STATE = "keywords_upstream_circuit_state"
+CONCURRENCY_LIMIT = "keywords_upstream_concurrency_limit"
+INFLIGHT = "keywords_upstream_inflight"
+HEDGED = "keywords_upstream_hedged_total"
+DEADLINE_FALLBACKS = "keywords_deadline_fallbacks_total"
+PREPROCESS_TOKENS = "keywords_preprocess_tokens_total"
+ROUTE_DECISIONS = "keywords_route_decisions_total"
+LOG_RECORDS_DROPPED = "keywords_log_records_dropped_total"
+LOG_RECORDS_SUPPRESSED = "keywords_log_records_suppressed_total"
+
+# name -> (type, help), in the order they are exported
+FAMILIES = {
+    REQUESTS: ("counter", "HTTP responses by endpoint, method and status"),
+    ERRORS: ("counter", "HTTP error responses (status 400 and above) by endpoint and status"),
+    REQUEST_SECONDS: ("histogram", "Time to produce the response headers, by endpoint"),
+    STAGE_SECONDS: ("histogram", "Time spent in each stage of a keyword request"),
+    UPSTREAM_TOKENS: ("counter", "Tokens reported by the upstream API, by direction"),
+    UPSTREAM_REJECTED: ("counter", "Upstream calls shed without being made, by reason"),
+    CIRCUIT_STATE: ("gauge", "Workers whose upstream circuit breaker is in each state"),
+    CONCURRENCY_LIMIT: (
+        "gauge",
+        "Adaptive limit on concurrent upstream calls, summed over workers",
+    ),
+    INFLIGHT: ("gauge", "Upstream calls in progress"),
+    HEDGED: ("counter", "Slow upstream calls sent a second time, by which answered first"),
+    DEADLINE_FALLBACKS: ("counter", "Requests answered by the deadline fallback engine, by reason"),
+    PREPROCESS_TOKENS: (
+        "counter",
+        "Estimated input tokens of posted documents before and after preprocessing",
+    ),
+    ROUTE_DECISIONS: ("counter", "Engines chosen for keyword requests, by routing rule"),
+    LOG_RECORDS_DROPPED: ("counter", "Log records dropped because the log queue was full"),
+    LOG_RECORDS_SUPPRESSED: ("counter", "Repeated warnings and errors held back from the log"),
+}
+GAUGES = tuple(family for family, (kind, _) in FAMILIES.items() if kind == "gauge")
+
+# Upper bounds in seconds: local stages take microseconds, upstream calls seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+# Latest stage timings kept per worker for percentiles
+RECENT_SAMPLES = 1024
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(pairs):
+    """Render label pairs as they appear between the braces of a sample"""
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+@lru_cache(maxsize=1024)
+def _bucket_labels(labels, buckets):
+    prefix = f"{labels}," if labels else ""
+    bounds = [repr(float(bound)) for bound in buckets] + ["+Inf"]
+    return tuple(f'{prefix}le="{bound}"' for bound in bounds)
+
+
+class SQLiteMetricsStore:
+    """Per-process metric totals in a SQLite file, summed over processes when scraped"""
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS metric_samples ("
+            "process TEXT NOT NULL, family TEXT NOT NULL, suffix TEXT NOT NULL, "
+            "labels TEXT NOT NULL, value REAL NOT NULL, "
+            "PRIMARY KEY (process, family, suffix, labels))"
+        )
+
+    def _connect(self):
+        # SQLite connections can't be shared between threads, so keep one per thread,
+        # and not with a forked worker either (a preloaded app opens them in the master)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def write(self, process, samples):
+        """Store a process's current totals for the given samples"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO metric_samples (process, family, suffix, labels, value) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (process, family, suffix, labels) "
+                "DO UPDATE SET value = excluded.value",
+                [(process, *key, value) for key, value in samples.items()],
+            )
+
+    def retire(self, process, gauges=()):
+        """Fold a process that has exited into the "retired" totals
+
+        Its gauges are dropped: they describe a worker that no longer exists.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO metric_samples (process, family, suffix, labels, value) "
+                "SELECT 'retired', family, suffix, labels, value FROM metric_samples "
+                f"WHERE process = ? AND family NOT IN ({', '.join('?' * len(gauges))}) "
+                "ON CONFLICT (process, family, suffix, labels) "
+                "DO UPDATE SET value = value + excluded.value",
+                (process, *gauges),
+            )
+            conn.execute("DELETE FROM metric_samples WHERE process = ?", (process,))
+
+    def processes(self):
+        rows = self._connect().execute("SELECT DISTINCT process FROM metric_samples")
+        return [process for (process,) in rows]
+
+    def totals(self):
+        """Every sample summed over all processes, in first-recorded order"""
+        rows = self._connect().execute(
+            "SELECT family, suffix, labels, SUM(value) FROM metric_samples "
+            "GROUP BY family, suffix, labels ORDER BY MIN(rowid)"
+        )
+        return {(family, suffix, labels): value for family, suffix, labels, value in rows}
+
+
+def store_from_uri(uri):
+    """Create a shared metrics store from a URI, or None for per-process metrics"""
+    if not uri or uri == "memory://":
+        return None
+    if uri.startswith("sqlite:///"):
+        return SQLiteMetricsStore(uri.removeprefix("sqlite:///"))
+    raise ValueError(f"Unsupported metrics URI: {uri}")
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """Counters and latency histograms exported in the Prometheus text format
+
+    Each worker records into memory. With a shared METRICS_URI, workers write
+    their totals to a SQLite file at most every METRICS_FLUSH_INTERVAL seconds
+    and /metrics sums the totals of every worker, so a scrape answered by any
+    one worker reports the whole server.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.buckets = LATENCY_BUCKETS
+        self.flush_interval = 1.0
+        self.store = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("METRICS_ENABLED", True)
+        self.flush_interval = config.get("METRICS_FLUSH_INTERVAL", 1.0)
+        self.store = store_from_uri(config.get("METRICS_URI", "memory://"))
+        self._reset()
+        if "metrics" not in app.extensions:
+            app.extensions["metrics"] = self
+            app.before_request(start_request)
+            app.after_request(record_response)
+
+    def _reset(self):
+        self._samples = {}
+        self._recent = {}
+        self._dirty = set()
+        self._pid = os.getpid()
+        # Unique even if the pid is reused by a later worker
+        self.process = f"{self._pid}-{time.time_ns()}"
+        self._flushed_at = time.monotonic()
+
+    def _add(self, key, amount):
+        self._samples[key] = self._samples.get(key, 0) + amount
+        self._dirty.add(key)
+
+    def _check_fork(self):
+        # A forked worker starts from the parent's samples, which aren't its own
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def inc(self, family, amount=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (family, "", format_labels(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self._add(key, amount)
+
+    def set(self, family, value, **labels):
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        key = (family, "", format_labels(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            if self._samples.get(key) != value:
+                self._samples[key] = value
+                self._dirty.add(key)
+
+    def observe(self, family, seconds, **labels):
+        """Record one observation in a histogram"""
+        if not self.enabled:
+            return
+        labels = format_labels(sorted(labels.items()))
+        bucket_labels = _bucket_labels(labels, self.buckets)
+        with self._lock:
+            self._check_fork()
+            for bound, bucket in zip(self.buckets, bucket_labels):
+                self._add((family, "_bucket", bucket), 1 if seconds <= bound else 0)
+            self._add((family, "_bucket", bucket_labels[-1]), 1)
+            self._add((family, "_sum", labels), seconds)
+            self._add((family, "_count", labels), 1)
+
+    def observe_stage(self, name, seconds):
+        """Record how long a stage of a request took"""
+        self.observe(STAGE_SECONDS, seconds, stage=name)
+        if self.enabled:
+            with self._lock:
+                if name not in self._recent:
+                    self._recent[name] = deque(maxlen=RECENT_SAMPLES)
+                self._recent[name].append(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as a stage of the current request"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - started)
+
+    def percentiles(self, name, points=(50, 95, 99)):
+        """Nearest-rank percentiles in ms over this worker's latest timings of a stage"""
+        with self._lock:
+            recent = sorted(self._recent.get(name, ()))
+        summary = {"samples": len(recent)}
+        for point in points:
+            if recent:
+                rank = max(int(len(recent) * point / 100 + 0.5) - 1, 0)
+                summary[f"p{point}"] = round(recent[min(rank, len(recent) - 1)] * 1000, 3)
+            else:
+                summary[f"p{point}"] = None
+        return summary
+
+    def record_request(self, endpoint, method, status, seconds):
+        """Count a response and its latency"""
+        self.inc(REQUESTS, endpoint=endpoint, method=method, status=status)
+        if status >= 400:
+            self.inc(ERRORS, endpoint=endpoint, status=status)
+        self.observe(REQUEST_SECONDS, seconds, endpoint=endpoint)
+        if self.store is not None and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def record_usage(self, response):
+        """Count the tokens an upstream response reports having used"""
+        usage = getattr(response, "usage", None)
+        for direction in ("input", "output"):
+            tokens = getattr(usage, f"{direction}_tokens", None)
+            if isinstance(tokens, int):
+                self.inc(UPSTREAM_TOKENS, tokens, direction=direction)
+
+    def flush(self):
+        """Write this worker's changed totals to the shared store"""
+        if self.store is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                self._check_fork()
+                changed = {key: self._samples[key] for key in self._dirty}
+                self._dirty = set()
+                self._flushed_at = time.monotonic()
+            if changed:
+                self.store.write(self.process, changed)
+
+    def retire_exited(self):
+        """Fold the totals of workers that have exited, so the store doesn't grow"""
+        for process in self.store.processes():
+            pid = process.partition("-")[0]
+            if pid.isdigit() and not process_alive(int(pid)):
+                self.store.retire(process, GAUGES)
+
+    def collect(self):
+        """Every sample as {(family, suffix, labels): value}, summed over workers"""
+        if self.store is None:
+            with self._lock:
+                self._check_fork()
+                return dict(self._samples)
+        self.flush()
+        self.retire_exited()
+        return self.store.totals()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        samples = {}
+        for (family, suffix, labels), value in self.collect().items():
+            samples.setdefault(family, []).append((suffix, labels, value))
+        lines = []
+        for family, (kind, help_text) in FAMILIES.items():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for suffix, labels, value in samples.get(family, []):
+                name = f"{family}{suffix}{{{labels}}}" if labels else f"{family}{suffix}"
+                lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+
+
+def record_response(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        # Label by route pattern, not path, so unknown URLs don't add series
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.record_request(
+            endpoint, request.method, response.status_code, time.perf_counter() - started
+        )
+    return response
+
+
+def _finish_stage(name):
+    started = g.pop(f"metrics_{name}_started", None)
+    if started is not None:
+        metrics.observe_stage(name, time.perf_counter() - started)
+
+
+def timed_stage(name, decorator):
+    """Apply a view decorator, timing the work it does before the view runs as a stage
+
+    Flask-Limiter checks limits inside its decorator, so this is how the rate
+    limit check gets its own latency histogram.
+    """
+
+    def apply(view):
+        @wraps(view)
+        def view_entered(*args, **kwargs):
+            _finish_stage(name)
+            return view(*args, **kwargs)
+
+        decorated = decorator(view_entered)
+
+        @wraps(view)
+        def stage_started(*args, **kwargs):
+            setattr(g, f"metrics_{name}_started", time.perf_counter())
+            try:
+                return decorated(*args, **kwargs)
+            finally:
+                # Still set if the decorator rejected the request
+                _finish_stage(name)
+
+        return stage_started
+
+    return apply
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+@limiter.exempt
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Global metrics registry
+metrics = Metrics()
@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# MinHash permutations are (a * x + b) mod a Mersenne prime over 32-bit shingle hashes
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+TOKEN = re.compile(r"\w+")
+
+
+def shingles(words, size=3):
+    """Distinct 32-bit hashes of the n-grams of a list of words"""
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}  # noqa: E203
+    return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64)
+
+
+class MinHasher:
+    """MinHash signatures, whose agreement estimates the Jaccard similarity of two texts
+
+    Shingles are hashed ``block_size`` at a time so memory stays bounded, and
+    texts with more than ``max_shingles`` distinct shingles are sampled down
+    to the ones with the smallest hashes, which picks the same shingles out of
+    any two texts that share them.
+    """
+
+    def __init__(self, permutations=128, seed=1, block_size=1024, max_shingles=20000):
+        rng = np.random.default_rng(seed)
+        # Small enough that a * x + b can't overflow 64 bits for 32-bit x
+        self.a = rng.integers(1, 1 << 31, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, size=permutations, dtype=np.uint64)
+        self.block_size = block_size
+        self.max_shingles = max_shingles
+
+    def signature(self, words):
+        hashes = shingles(words)
+        if not len(hashes):
+            return None
+        if len(hashes) > self.max_shingles:
+            hashes = np.partition(hashes, self.max_shingles - 1)[: self.max_shingles]
+        signature = np.full(len(self.a), MERSENNE_PRIME, dtype=np.uint64)
+        for start in range(0, len(hashes), self.block_size):
+            block = hashes[start : start + self.block_size]  # noqa: E203
+            permuted = (block[:, None] * self.a + self.b) % MERSENNE_PRIME
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+class NearDuplicateIndex:
+    """Finds stored results for texts that are almost the same as one already extracted
+
+    Each text is fingerprinted with a MinHash signature over its word 3-grams,
+    split into ``bands`` bands that are indexed in hash buckets (LSH): texts
+    sharing any band are candidates, and the candidate whose signature agrees
+    most, if at least ``threshold``, is a match. Entries are per worker
+    process, expire with the response cache TTL and are evicted least recently
+    used beyond ``max_entries``.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 0.9
+        self.min_words = 20
+        self.max_entries = 10000
+        self.ttl = 3600
+        self.bands = 16
+        self.hasher = MinHasher()
+        self._reset()
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("NEAR_DUPLICATE_ENABLED", True)
+        self.threshold = config.get("NEAR_DUPLICATE_THRESHOLD", 0.9)
+        self.min_words = config.get("NEAR_DUPLICATE_MIN_WORDS", 20)
+        self.max_entries = config.get("NEAR_DUPLICATE_MAX_ENTRIES", 10000)
+        self.ttl = config.get("CACHE_TTL", 3600)
+        permutations = config.get("NEAR_DUPLICATE_PERMUTATIONS", 128)
+        self.bands = config.get("NEAR_DUPLICATE_BANDS", 16)
+        if permutations % self.bands:
+            raise ValueError(
+                "NEAR_DUPLICATE_PERMUTATIONS must be a multiple of NEAR_DUPLICATE_BANDS"
+            )
+        self.hasher = MinHasher(permutations)
+        self._reset()
+
+    def _reset(self):
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _band_keys(self, namespace, signature):
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            start = band * rows
+            yield namespace, band, signature[start : start + rows].tobytes()  # noqa: E203
+
+    def signature(self, text):
+        """MinHash signature of text, or None if it's too short to match safely"""
+        if not self.enabled:
+            return None
+        words = TOKEN.findall(text.lower())
+        if len(words) < self.min_words:
+            return None
+        return self.hasher.signature(words)
+
+    def lookup(self, namespace, signature):
+        """Stored (result, similarity) for the closest text at least threshold similar, or None"""
+        if signature is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(namespace, signature):
+                candidates.update(self._buckets.get(key, ()))
+            best, best_similarity = None, self.threshold
+            for entry_id in candidates:
+                entry_signature, result, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = similarity(signature, entry_signature)
+                if score >= best_similarity:
+                    best, best_similarity = entry_id, score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][1], round(best_similarity, 3)
+
+    def add(self, namespace, signature, result):
+        """Index a result under its text's signature"""
+        if signature is None:
+            return
+        with self._lock:
+            # A re-extraction of the same text replaces its entry
+            keys = self._band_keys(namespace, signature)
+            for entry_id in list(self._buckets.get(next(keys), ())):
+                if np.array_equal(self._entries[entry_id][0], signature):
+                    self._remove(entry_id)
+            entry_id = (namespace, self._next_id)
+            self._next_id += 1
+            self._entries[entry_id] = (signature, result, time.monotonic() + self.ttl)
+            for key in self._band_keys(namespace, signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, entry_id):
+        signature, _, _ = self._entries.pop(entry_id)
+        for key in self._band_keys(entry_id[0], signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        """Entry and hit counters for this worker process"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global near-duplicate index
+near_duplicates = NearDuplicateIndex()
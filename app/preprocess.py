@@ -0,0 +1,295 @@
+import html
+import re
+import unicodedata
+from itertools import chain
+
+from app.budget import estimate_tokens
+from app.local_extractor import STOPWORDS, WORD
+from app.metrics import PREPROCESS_TOKENS, metrics
+
+STEPS = ("markup", "normalize", "language", "trim")
+# Trimming drops text, so it's only run when asked for
+DEFAULT_STEPS = ("markup", "normalize", "language")
+
+# Elements whose content is never part of the document, including page chrome
+HTML_HIDDEN = re.compile(
+    r"<(script|style|noscript|template|svg|head|nav|footer|aside|form)\b.*?</\1\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+# Block-level elements end a paragraph; list items and line breaks end a line of one
+HTML_BLOCK = re.compile(
+    r"</?(?:p|div|ul|ol|dl|h[1-6]|tr|td|th|table|section|article|header|main|"
+    r"blockquote|pre|hr|figure|figcaption)\b[^>]*>",
+    re.IGNORECASE,
+)
+HTML_LINE = re.compile(r"<(?:br|li|dt|dd)\b[^>]*>", re.IGNORECASE)
+HTML_TAG = re.compile(r"</?[a-zA-Z][^>]*>|<![^>]*>")
+# Only text with a closing or void HTML element, a doctype or a comment is taken
+# for HTML, so List<String> or a<b and c>d in plain text keeps its words
+HTML_DOCUMENT = re.compile(
+    r"</(?:html|head|body|title|p|div|span|a|b|i|em|strong|u|s|code|ul|ol|li|dl|dt|dd|"
+    r"h[1-6]|table|tr|td|th|section|article|header|footer|nav|main|aside|blockquote|pre|"
+    r"figure|figcaption|script|style|noscript|template|svg|form)\s*>"
+    r"|<(?:br|hr|img)\b[^<>]*>|<!doctype\s+html|<!--",
+    re.IGNORECASE,
+)
+ORDERED_LIST_ITEM = re.compile(r"^ {0,3}\d{1,9}[.)] +", re.MULTILINE)
+# (substrings without which the rule can't match, pattern, replacement)
+MARKDOWN = (
+    # Code fences (their content is kept), horizontal rules
+    (
+        ("```", "~~~", "---", "***", "___", "- -", "* *", "_ _"),
+        re.compile(r"^ {0,3}(?:```|~~~).*$|^ {0,3}(?:[-*_] *){3,}$", re.MULTILINE),
+        "",
+    ),
+    # Images and links keep their text
+    (("](",), re.compile(r"!?\[([^\]\n]*)\]\([^)\n]*\)"), r"\1"),
+    # Heading, quote and bullet list markers
+    ((), re.compile(r"^ {0,3}(?:#{1,6}|>+|[-*+]) +", re.MULTILINE), ""),
+    # Numbered list markers, only in runs of two or more items, so a line
+    # starting "1984. The year" keeps its number
+    (
+        (".", ")"),
+        re.compile(r"(?:^ {0,3}\d{1,9}[.)] +.*(?:\n|$)){2,}", re.MULTILINE),
+        lambda match: ORDERED_LIST_ITEM.sub("", match.group()),
+    ),
+    # Emphasis and code spans, only with whitespace, punctuation or the string's
+    # ends outside the delimiters (2*3*4 and src/**/*.js stay); the same goes for
+    # underscores (snake_case stays)
+    (
+        ("*", "~~", "`"),
+        re.compile(r"(?<![\w*~`])(\*\*|\*|~~|`)(?![\s*~`])([^\n]+?)(?<![\s*~`])\1(?![\w*~`])"),
+        r"\2",
+    ),
+    (("_",), re.compile(r"(?<!\w)(__|_)(?=\S)([^\n]+?)(?<=\S)\1(?!\w)"), r"\2"),
+)
+# Control and zero-width characters, soft hyphens
+INVISIBLE = dict.fromkeys(
+    [c for c in range(32) if c not in (9, 10, 13)]
+    + [0x7F, 0xAD, 0x200B, 0x200C, 0x200D, 0x2060, 0xFEFF]
+)
+
+# Most common function words, used to tell languages apart
+LANGUAGE_STOPWORDS = {
+    language: frozenset(words.split())
+    for language, words in {
+        "en": "the and of to in is that it for was on are with as be this by not or have from "
+        "but at an they which you were has",
+        "de": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als "
+        "auch es an werden aus er hat dass",
+        "fr": "le la les de des et un une du en est que qui dans pour pas sur au avec ce il sont "
+        "par plus ne se",
+        "es": "el la de que y en los se del las un por con no una su para es al lo como más pero "
+        "sus le",
+        "it": "il di che la e le un per non in una sono del della con si da gli al è dei anche "
+        "come nel",
+        "nl": "de het een en van in is dat op te zijn met voor niet die aan er om ook als bij "
+        "wordt",
+        "pt": "o a de que e do da em um para com não uma os no se na por mais as dos como mas "
+        "foi",
+    }.items()
+}
+
+
+PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n")
+
+
+def split_blocks(text):
+    """Yield the non-blank paragraphs of text"""
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        if paragraph.strip():
+            yield paragraph
+
+
+def strip_markup(text):
+    """Remove HTML tags and markdown syntax, yielding blocks of plain text"""
+    if "<" in text and HTML_DOCUMENT.search(text):
+        text = HTML_HIDDEN.sub(" ", HTML_COMMENT.sub(" ", text))
+        # Line breaks in HTML source are just whitespace; block elements break paragraphs
+        text = " ".join(text.split())
+        text = HTML_LINE.sub("\n", HTML_BLOCK.sub("\n\n", text))
+        text = HTML_TAG.sub(" ", text)
+        text = html.unescape(text)
+    for triggers, pattern, replacement in MARKDOWN:
+        if not triggers or any(trigger in text for trigger in triggers):
+            text = pattern.sub(replacement, text)
+    return split_blocks(text)
+
+
+def normalize(blocks):
+    """NFKC-normalize blocks, drop invisible characters and collapse whitespace
+
+    Line breaks inside a block are kept, since they separate phrases.
+    """
+    for block in blocks:
+        block = unicodedata.normalize("NFKC", block).translate(INVISIBLE)
+        lines = (" ".join(line.split()) for line in block.splitlines())
+        block = "\n".join(line for line in lines if line)
+        if block:
+            yield block
+
+
+# word -> languages it is a common word of
+LANGUAGES_OF = {}
+for _language, _stopwords in LANGUAGE_STOPWORDS.items():
+    for _word in _stopwords:
+        LANGUAGES_OF.setdefault(_word, []).append(_language)
+
+
+def words(block):
+    return WORD.findall(block.lower())
+
+
+def detect_language(sample, min_hits=3):
+    """Language whose common words occur most in sample, or None if unclear"""
+    hits = dict.fromkeys(LANGUAGE_STOPWORDS, 0)
+    for word in sample:
+        for language in LANGUAGES_OF.get(word, ()):
+            hits[language] += 1
+    ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)
+    (best, best_hits), (_, runner_up) = ranked[0], ranked[1]
+    if best_hits < min_hits or best_hits < runner_up * 1.25:
+        return None
+    return best
+
+
+def stopwords_for(language):
+    return STOPWORDS if language == "en" else LANGUAGE_STOPWORDS.get(language)
+
+
+class Preprocessor:
+    """Cleans posted text before it is charged, cached and extracted
+
+    The steps are generators chained over blocks (paragraphs) of text, so they
+    work a block at a time instead of on copies of the whole document, holding
+    back only the language sample and, in ``trim``, the blocks before the first
+    prose block:
+
+    - ``markup`` strips HTML (dropping scripts, styles and page chrome such as
+      nav and footer) and markdown syntax, keeping the text
+    - ``normalize`` applies NFKC, drops control and zero-width characters and
+      collapses whitespace
+    - ``language`` detects the language from the stopwords in the first
+      ``sample_words`` words; with KEYWORDS_LANGUAGES set, other languages are
+      refused
+    - ``trim`` (which implies ``language``, and isn't run by default) drops
+      low-signal blocks of a detected language: blocks with no content words,
+      repeated short blocks, and short blocks (menus, share links, captions)
+      between prose blocks, ones with at least ``trim_min_words`` words and
+      ``trim_min_density`` stopwords. Short blocks that head a prose block,
+      lists following prose and the blocks after the last prose block are kept
+    """
+
+    def __init__(self):
+        self.steps = DEFAULT_STEPS
+        self.languages = None
+        self.sample_words = 200
+        self.trim_min_words = 7
+        self.trim_min_density = 0.2
+
+    def init_app(self, app):
+        config = app.config
+        steps = config.get("PREPROCESS_STEPS", ",".join(DEFAULT_STEPS))
+        steps = tuple(step.strip() for step in steps.split(",") if step.strip())
+        unknown = set(steps) - set(STEPS)
+        if unknown:
+            raise ValueError(f"Unknown PREPROCESS_STEPS: {', '.join(sorted(unknown))}")
+        self.steps = steps
+        languages = [code.strip() for code in config.get("KEYWORDS_LANGUAGES", "").split(",")]
+        self.languages = frozenset(code for code in languages if code) or None
+        self.sample_words = config.get("PREPROCESS_LANGUAGE_SAMPLE_WORDS", 200)
+        self.trim_min_words = config.get("PREPROCESS_TRIM_MIN_WORDS", 7)
+        self.trim_min_density = config.get("PREPROCESS_TRIM_MIN_DENSITY", 0.2)
+
+    def process(self, text):
+        """Run the configured steps over text, returning (cleaned_text, language)
+
+        language is None when it wasn't detected, or the language step is off.
+        """
+        if not self.steps:
+            return text, None
+        state = {"language": None}
+        blocks = strip_markup(text) if "markup" in self.steps else split_blocks(text)
+        if "normalize" in self.steps:
+            blocks = normalize(blocks)
+        if "language" in self.steps or "trim" in self.steps:
+            blocks = self._detect(blocks, state)
+        if "trim" in self.steps:
+            blocks = self._trim(blocks, state)
+        cleaned = "\n\n".join(blocks)
+        metrics.inc(PREPROCESS_TOKENS, estimate_tokens(text), text="posted")
+        metrics.inc(PREPROCESS_TOKENS, estimate_tokens(cleaned), text="cleaned")
+        return cleaned, state["language"]
+
+    def language_allowed(self, language):
+        """Whether documents in language may be extracted (undetected ones always may)"""
+        return self.languages is None or language is None or language in self.languages
+
+    def _detect(self, blocks, state):
+        # Hold back the blocks of the sample until the language is known
+        held, sample = [], []
+        for block in blocks:
+            held.append(block)
+            sample.extend(words(block))
+            if len(sample) >= self.sample_words:
+                break
+        state["language"] = detect_language(sample[: self.sample_words])
+        yield from held
+        yield from blocks
+
+    def _trim(self, blocks, state):
+        # The language is known once the first block has come through detection
+        first = next(blocks, None)
+        if first is None:
+            return
+        blocks = chain([first], blocks)
+        stopwords = stopwords_for(state["language"])
+        if stopwords is None:
+            yield from blocks
+            return
+        # Until the first prose block, blocks are held back: without prose nothing is dropped
+        original, kept = [], []
+        prose_seen = False
+        # Short blocks since the last block let through, None for repeats
+        pending = []
+        seen = set()
+        for block in blocks:
+            if not prose_seen:
+                original.append(block)
+            block_words = words(block)
+            content = sum(1 for word in block_words if word not in stopwords)
+            if not content:
+                continue
+            heading = pending[-1] if pending else None
+            if len(block_words) < self.trim_min_words:
+                if prose_seen and "\n" in block and len(pending) <= 1:
+                    # A list following prose, under its heading if it has one
+                    yield from filter(None, [heading, block])
+                    pending.clear()
+                    continue
+                key = " ".join(block_words)
+                pending.append(None if key in seen else block)
+                seen.add(key)
+                continue
+            prose = len(block_words) - content >= self.trim_min_density * len(block_words)
+            headed = prose or "\n" in block
+            trimmed = [heading, block] if headed and heading is not None else [block]
+            pending.clear()
+            if prose_seen:
+                yield from trimmed
+            elif prose:
+                prose_seen = True
+                yield from kept
+                yield from trimmed
+            else:
+                kept.extend(trimmed)
+        if not prose_seen:
+            yield from original
+        else:
+            # What follows the last prose block ends the document (a price, a byline)
+            yield from filter(None, pending)
+
+
+# Global text preprocessor
+preprocessor = Preprocessor()
@@ -0,0 +1,132 @@
+import json
+
+from app.breaker import CLOSED, upstream_guard
+from app.extractors import extractors
+from app.hedging import hedger
+from app.metrics import ROUTE_DECISIONS, metrics
+
+UPSTREAM_STATES = ("healthy", "degraded")
+
+
+def as_set(value):
+    return frozenset([value] if isinstance(value, str) else value)
+
+
+class Route:
+    """One rule of the routing table: the engine to use when all its conditions hold
+
+    Conditions left out always hold:
+
+    - ``min_tokens`` / ``max_tokens``: bounds on the estimated input tokens
+    - ``tiers``: tiers of the caller's API key
+    - ``quality``: values of the request's quality hint
+    - ``upstream``: ``"degraded"`` while the upstream circuit isn't closed or
+      its error rate or median latency is over the router's thresholds,
+      ``"healthy"`` otherwise
+    """
+
+    FIELDS = ("name", "engine", "min_tokens", "max_tokens", "tiers", "quality", "upstream")
+
+    def __init__(
+        self,
+        engine,
+        name,
+        min_tokens=None,
+        max_tokens=None,
+        tiers=None,
+        quality=None,
+        upstream=None,
+    ):
+        self.engine = engine
+        self.name = name
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.tiers = as_set(tiers) if tiers is not None else None
+        self.quality = as_set(quality) if quality is not None else None
+        self.upstream = upstream
+
+    @classmethod
+    def from_config(cls, rule, position):
+        unknown = set(rule) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown KEYWORDS_ROUTES fields: {', '.join(sorted(unknown))}")
+        if rule.get("engine") not in extractors:
+            raise ValueError(
+                f"Unknown engine in KEYWORDS_ROUTES rule {position}: {rule.get('engine')}"
+            )
+        if rule.get("upstream", "healthy") not in UPSTREAM_STATES:
+            raise ValueError("KEYWORDS_ROUTES upstream must be 'healthy' or 'degraded'")
+        return cls(**{"name": f"rule-{position}", **rule})
+
+    def matches(self, tokens, tier, quality, upstream):
+        if self.min_tokens is not None and tokens < self.min_tokens:
+            return False
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return False
+        if self.tiers is not None and tier not in self.tiers:
+            return False
+        if self.quality is not None and quality not in self.quality:
+            return False
+        return self.upstream is None or self.upstream == upstream
+
+
+class EngineRouter:
+    """Picks the engine for requests that don't name one, from a rule table
+
+    Rules (KEYWORDS_ROUTES, a JSON list) are tried in order and the first
+    whose conditions hold and whose engine the caller's key may use wins;
+    without a match the default engine (KEYWORDS_ENGINE) is used. Each
+    decision is counted by engine and rule, and timed as the ``route`` stage.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self._watch_upstream = False
+        self.degraded_error_rate = 0.2
+        self.degraded_latency = 5.0
+
+    def init_app(self, app):
+        config = app.config
+        rules = config.get("KEYWORDS_ROUTES", "")
+        if isinstance(rules, str):
+            rules = json.loads(rules) if rules.strip() else []
+        self.routes = [Route.from_config(rule, position) for position, rule in enumerate(rules)]
+        self._watch_upstream = any(route.upstream is not None for route in self.routes)
+        self.degraded_error_rate = config.get("KEYWORDS_ROUTE_DEGRADED_ERROR_RATE", 0.2)
+        self.degraded_latency = config.get("KEYWORDS_ROUTE_DEGRADED_LATENCY", 5.0)
+
+    def upstream_state(self):
+        """ "degraded" or "healthy", going by this worker's recent upstream calls"""
+        if upstream_guard.breaker_enabled:
+            circuit = upstream_guard.breaker.stats()
+            if circuit["state"] != CLOSED or circuit["error_rate"] >= self.degraded_error_rate:
+                return "degraded"
+        typical = hedger.latency.quantile(0.5)
+        if typical is not None and typical >= self.degraded_latency:
+            return "degraded"
+        return "healthy"
+
+    def route(self, engine, tokens, api_key, quality=None):
+        """Engine name for a request (None for the default) and the name of the rule that chose it
+
+        An engine the client asked for is always kept, as route "requested".
+        """
+        with metrics.stage("route"):
+            engine, name = self._choose(engine, tokens, api_key, quality)
+        metrics.inc(ROUTE_DECISIONS, engine=extractors.get(engine).name, route=name)
+        return engine, name
+
+    def _choose(self, engine, tokens, api_key, quality):
+        if engine is not None:
+            return engine, "requested"
+        upstream = self.upstream_state() if self._watch_upstream else None
+        for route in self.routes:
+            if route.matches(tokens, api_key.tier, quality, upstream) and api_key.allows_engine(
+                route.engine
+            ):
+                return route.engine, route.name
+        return None, "default"
+
+
+# Global engine router
+engine_router = EngineRouter()
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import threading
+import time
+
+from app.cache import response_cache
+from app.deadline import DeadlineExceeded, remaining
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls so only one of them does the work
+
+    Within a process, callers with the same key wait for the first caller's
+    result. When the response cache has a shared backend, the first worker
+    also claims the key there, and other workers poll the shared cache for
+    its result instead of calling the upstream themselves.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.timeout = 30.0
+        self.poll_interval = 0.05
+        self.claims = None
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("COALESCE_ENABLED", True)
+        self.timeout = config.get("COALESCE_TIMEOUT", 30.0)
+        shared = response_cache.shared
+        self.claims = shared if hasattr(shared, "claim") else None
+        self._flights = {}
+        self._async_flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+
+    @property
+    def owner(self):
+        # Claims are per process; threads in a process coalesce in memory
+        return f"pid-{os.getpid()}"
+
+    def do(self, key, fn, lookup=None, shareable=None):
+        """Run fn once for all concurrent callers with this key
+
+        Returns (result, shared) where shared is True if another caller's
+        result was reused. ``lookup(key)`` reads a result another worker
+        published, and is only used when a shared claim store is configured.
+        Callers wait at most until their own deadline, then raise
+        DeadlineExceeded, and at most ``timeout`` seconds, then make their own
+        call so a hung first caller doesn't hold them up. A DeadlineExceeded or
+        a result ``shareable(result)`` rejects came from the first caller's
+        deadline, so the callers that waited for it make their own call instead.
+        """
+        if not self.enabled:
+            return fn(), False
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            wait, by_deadline = self._wait()
+            if not flight.done.wait(wait):
+                if by_deadline:
+                    raise DeadlineExceeded("Deadline passed while waiting for a coalesced call")
+                return fn(), False
+            if isinstance(flight.error, DeadlineExceeded) or (
+                flight.error is None and shareable is not None and not shareable(flight.result)
+            ):
+                return self.do(key, fn, lookup, shareable)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, shared = self._run_claimed(key, fn, lookup)
+            return flight.result, shared
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key, fn, lookup=None, shareable=None):
+        """Async counterpart of do, for coroutine functions on one event loop"""
+        if not self.enabled:
+            return await fn(), False
+        future = self._async_flights.get(key)
+        if future is not None and future.get_loop() is asyncio.get_running_loop():
+            self.coalesced += 1
+            wait, by_deadline = self._wait()
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), wait)
+            except asyncio.TimeoutError:
+                if by_deadline:
+                    raise DeadlineExceeded(
+                        "Deadline passed while waiting for a coalesced call"
+                    ) from None
+                return await fn(), False
+            except DeadlineExceeded:
+                return await self.do_async(key, fn, lookup, shareable)
+            if shareable is not None and not shareable(result):
+                return await self.do_async(key, fn, lookup, shareable)
+            return result, True
+
+        future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        try:
+            result, shared = await self._run_claimed_async(key, fn, lookup)
+            future.set_result(result)
+            return result, shared
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark retrieved so a flight without followers doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            if self._async_flights.get(key) is future:
+                del self._async_flights[key]
+
+    def _wait(self):
+        # Another caller is waited on until the timeout or the deadline, whichever
+        # comes first; returns (seconds, whether the deadline is the limit)
+        left = remaining()
+        if left is None or left > self.timeout:
+            return self.timeout, False
+        return left, True
+
+    def _give_up_at(self):
+        return time.monotonic() + self._wait()[0]
+
+    def _run_claimed(self, key, fn, lookup):
+        if self.claims is None or lookup is None:
+            return fn(), False
+        give_up = self._give_up_at()
+        while not self.claims.claim(key, self.owner, self.timeout):
+            result = lookup(key)
+            if result is not None:
+                self.coalesced_remote += 1
+                return result, True
+            if time.monotonic() >= give_up:
+                return fn(), False
+            time.sleep(self.poll_interval)
+        try:
+            # The previous owner may have finished between our miss and the claim
+            result = lookup(key)
+            if result is not None:
+                self.coalesced_remote += 1
+                return result, True
+            return fn(), False
+        finally:
+            self.claims.release(key, self.owner)
+
+    async def _run_claimed_async(self, key, fn, lookup):
+        if self.claims is None or lookup is None:
+            return await fn(), False
+        give_up = self._give_up_at()
+        while not self.claims.claim(key, self.owner, self.timeout):
+            result = lookup(key)
+            if result is not None:
+                self.coalesced_remote += 1
+                return result, True
+            if time.monotonic() >= give_up:
+                return await fn(), False
+            await asyncio.sleep(self.poll_interval)
+        try:
+            result = lookup(key)
+            if result is not None:
+                self.coalesced_remote += 1
+                return result, True
+            return await fn(), False
+        finally:
+            self.claims.release(key, self.owner)
+
+    def stats(self):
+        """Coalescing counters for this worker process"""
+        return {
+            "enabled": self.enabled,
+            "shared": self.claims is not None,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_remote": self.coalesced_remote,
+            "in_flight": len(self._flights) + len(self._async_flights),
+        }
+
+
+# Global request coalescer
+single_flight = SingleFlight()
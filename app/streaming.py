@@ -0,0 +1,49 @@
+import json
+
+from app.json_provider import json_codec
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json_codec.dumps(data).decode()}\n\n"
+
+
+class KeywordStreamParser:
+    """Incrementally pull completed keywords out of a streamed KeywordArray JSON document
+
+    The model streams ``{"keywords": ["a", "b", ...]}`` in arbitrary text
+    deltas; every string that closes inside the array is a finished keyword,
+    so it can be sent on before the rest of the document has arrived.
+    """
+
+    def __init__(self):
+        self.keywords = []
+        self._in_array = False
+        self._in_string = False
+        self._escaped = False
+        self._current = []
+
+    def feed(self, delta):
+        """Consume a text delta, returning the keywords it completed"""
+        completed = []
+        for char in delta:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._in_array:
+                        completed.append(json.loads('"' + "".join(self._current) + '"'))
+                    continue
+                self._current.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._current = []
+            elif char == "[":
+                self._in_array = True
+            elif char == "]":
+                self._in_array = False
+        self.keywords.extend(completed)
+        return completed
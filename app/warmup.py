@@ -0,0 +1,42 @@
+import logging
+import time
+
+from app.clients import openai_clients
+from app.extractors import extractors
+from app.json_provider import json_codec
+from app.keywords import keyword_array
+from app.near_duplicates import near_duplicates
+from app.preprocess import detect_language, normalize, strip_markup, words
+
+logger = logging.getLogger(__name__)
+
+SAMPLE = (
+    "<article><h1>Warming up</h1><p>The keyword service cleans the posted text, detects "
+    "its language and ranks the phrases that say the most about it, so a search engine "
+    "can tell what the page is about.</p><p>It is **only** a *sample* of "
+    "[markdown](https://example.com) &amp; HTML.</p></article>"
+)
+
+
+def warmup(app):
+    """Do the one-off work of a worker's first requests up front
+
+    Called from gunicorn.conf.py in the master once the preloaded app is built,
+    so forked workers inherit the imported modules, the response model, the
+    compiled templates and the loaded corpus as copy-on-write memory instead of
+    each loading them again. Nothing here is counted in metrics, the corpus or
+    the caches.
+    """
+    started = time.perf_counter()
+    openai_clients.warmup()
+    keyword_array()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    text = "\n\n".join(normalize(strip_markup(SAMPLE)))
+    sample = words(text)
+    detect_language(sample)
+    near_duplicates.hasher.signature(sample)
+    with app.app_context():
+        json_codec.dumps(extractors.get("local").extract(text))
+    logger.info("Warmed up in %.0f ms", (time.perf_counter() - started) * 1000)
@@ -0,0 +1,6 @@
+from app.asgi import create_asgi_app
+import os
+
+# Get configuration from environment
+config_name = os.environ.get("FLASK_ENV", "development")
+app = create_asgi_app(config_name)
@@ -0,0 +1,79 @@
+"""Measure API key authentication cost as the number of keys grows
+
+Writes key files of increasing size, loads each into the key store and times
+``authenticate`` for valid and invalid tokens, so the auth step can be checked
+to stay in the microseconds with a large multi-tenant key file.
+
+Usage:
+    python benchmarks/auth_lookup.py --keys 1 1000 100000 --lookups 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.auth import KeyStore, hash_key  # noqa: E402
+
+
+def build_store(path, count):
+    entries = [
+        {"sha256": hash_key(f"client-key-{i:08d}"), "name": f"client {i}", "tier": "free"}
+        for i in range(count)
+    ]
+    with open(path, "w") as f:
+        json.dump({"tiers": {"free": {"rate_limit": "100 per hour"}}, "keys": entries}, f)
+    store = KeyStore()
+    store.path = path
+    started = time.perf_counter()
+    store.load()
+    return store, time.perf_counter() - started
+
+
+def time_lookups(store, headers):
+    started = time.perf_counter()
+    for header in headers:
+        store.authenticate(header)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, nargs="+", default=[1, 1000, 100000])
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.keys:
+            store, load_seconds = build_store(os.path.join(tmp, f"keys-{count}.json"), count)
+            valid = [f"Bearer client-key-{i % count:08d}" for i in range(args.lookups)]
+            invalid = [f"Bearer unknown-key-{i:08d}" for i in range(args.lookups)]
+            results.append(
+                {
+                    "keys": count,
+                    "load_ms": round(load_seconds * 1000, 1),
+                    "valid_us": round(time_lookups(store, valid) / args.lookups * 1e6, 2),
+                    "invalid_us": round(time_lookups(store, invalid) / args.lookups * 1e6, 2),
+                }
+            )
+
+    print(f"{'keys':>8}{'load ms':>10}{'valid us':>10}{'invalid us':>12}")
+    for result in results:
+        print(
+            f"{result['keys']:>8}{result['load_ms']:>10}"
+            f"{result['valid_us']:>10}{result['invalid_us']:>12}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"lookups": args.lookups, "results": results}, f)
+
+
+if __name__ == "__main__":
+    main()
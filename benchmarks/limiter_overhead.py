@@ -0,0 +1,96 @@
+"""Measure the per-request cost of rate limiting for each storage and strategy
+
+Times ``hit`` on the limits strategies Flask-Limiter uses, single threaded and
+with several processes sharing one storage, so the overhead a storage adds to
+every POST /keywords is visible next to the upstream latency it guards.
+
+Usage:
+    python benchmarks/limiter_overhead.py --hits 5000 --processes 4
+    python benchmarks/limiter_overhead.py --redis-url redis://localhost:6379
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app.limiter  # noqa: E402,F401  registers the sqlite:// storage
+
+LIMIT = parse("1000000000 per hour")
+
+
+def time_hits(uri, strategy, hits, identifier):
+    limiter_strategy = STRATEGIES[strategy](storage_from_string(uri))
+    started = time.perf_counter()
+    for _ in range(hits):
+        limiter_strategy.hit(LIMIT, "benchmark", identifier)
+    return time.perf_counter() - started
+
+
+def contended_worker(uri, strategy, hits, results):
+    # Every process charges the same key, like workers serving one client
+    results.put(time_hits(uri, strategy, hits, "shared"))
+
+
+def measure(uri, strategy, hits, processes):
+    single = time_hits(uri, strategy, hits, "single")
+    result = {"per_hit_us": round(single / hits * 1e6, 1)}
+    if processes > 1 and not uri.startswith("memory://"):
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [
+            context.Process(target=contended_worker, args=(uri, strategy, hits, results))
+            for _ in range(processes)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        result["contended_hits_per_s"] = round(processes * hits / elapsed)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hits", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--redis-url", help="also measure a Redis storage at this URL")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storages = {"memory": "memory://", "sqlite": f"sqlite:///{tmp}/limits.db"}
+        if args.redis_url:
+            storages["redis"] = args.redis_url
+        results = []
+        for name, uri in storages.items():
+            for strategy in ("fixed-window", "sliding-window-counter"):
+                measured = measure(uri, strategy, args.hits, args.processes)
+                results.append({"storage": name, "strategy": strategy, **measured})
+
+    print(f"{'storage':<8}{'strategy':<24}{'us/hit':>10}{'contended hits/s':>18}")
+    for result in results:
+        contended = result.get("contended_hits_per_s", "-")
+        print(
+            f"{result['storage']:<8}{result['strategy']:<24}"
+            f"{result['per_hit_us']:>10}{contended:>18}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"hits": args.hits, "processes": args.processes, "results": results}, f)
+
+
+if __name__ == "__main__":
+    main()
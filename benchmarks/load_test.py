@@ -0,0 +1,309 @@
+"""Benchmark /keywords under concurrent load in each gunicorn serving mode
+
+Starts a local mock of the OpenAI Responses API with a fixed latency (and,
+optionally, a rate of injected upstream errors), boots the app with the sync,
+gthread and async (ASGI) worker classes and fires concurrent POST /keywords
+requests. Reports requests per second, p50/p95/p99 latency and the memory of
+each worker, and can save the results as JSON and compare them to a baseline.
+
+Usage:
+    python benchmarks/load_test.py --requests 400 --concurrency 200 --latency 1.0
+    python benchmarks/load_test.py --output results.json --baseline previous.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tests.mock_openai import MockOpenAIServer  # noqa: E402
+
+API_KEY = "load-test-api-key"
+CLIENT_POOL_SIZE = 10
+
+MODES = {
+    "sync": ["gunicorn", "--workers", "{workers}", "--bind", "127.0.0.1:{port}", "run:app"],
+    "gthread": [
+        "gunicorn",
+        "--workers",
+        "{workers}",
+        "--worker-class",
+        "gthread",
+        "--threads",
+        "{threads}",
+        "--bind",
+        "127.0.0.1:{port}",
+        "run:app",
+    ],
+    "async": [
+        "gunicorn",
+        "--workers",
+        "{async_workers}",
+        "--worker-class",
+        "uvicorn.workers.UvicornWorker",
+        "--bind",
+        "127.0.0.1:{port}",
+        "asgi:app",
+    ],
+}
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def worker_pids(master_pid):
+    """Pids of the workers a gunicorn master has forked (Linux only)"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, the fields after it don't
+        if int(stat.rsplit(")", 1)[1].split()[1]) == master_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def memory_mb(pid, field):
+    """A memory field of /proc/<pid>/status (e.g. VmRSS) in MiB"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker_memory(master_pid):
+    """Mean current and largest peak RSS of the workers, or None off Linux"""
+    if not os.path.isdir("/proc"):
+        return None
+    pids = worker_pids(master_pid)
+    try:
+        rss = [memory_mb(pid, "VmRSS") for pid in pids]
+        peak = [memory_mb(pid, "VmHWM") for pid in pids]
+    except OSError:
+        return None
+    if not pids:
+        return None
+    return {
+        "workers": len(pids),
+        "rss_mb": round(sum(rss) / len(rss), 1),
+        "peak_rss_mb": round(max(peak), 1),
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def drive(port, total, concurrency, offset=0):
+    """Fire ``total`` requests with at most ``concurrency`` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    # httpcore scans every pooled connection on each request, which turns one
+    # big pool into the bottleneck; spread the load over small pools instead
+    clients = [
+        httpx.AsyncClient(limits=httpx.Limits(max_connections=CLIENT_POOL_SIZE), timeout=120.0)
+        for _ in range(max(1, concurrency // CLIENT_POOL_SIZE))
+    ]
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await clients[i % len(clients)].post(
+                    f"http://127.0.0.1:{port}/keywords",
+                    # Distinct texts, so coalescing doesn't merge requests
+                    json={"text": f"Load test document number {offset + i}"},
+                    headers={"Authorization": f"Bearer {API_KEY}"},
+                )
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError:
+                statuses["error"] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        await client.aclose()
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": total - statuses["200"],
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def run_mode(mode, args, upstream_url):
+    port = free_port()
+    command = [
+        part.format(
+            port=port,
+            workers=args.workers,
+            threads=args.threads,
+            async_workers=args.async_workers,
+        )
+        for part in MODES[mode]
+    ]
+    env = {
+        **os.environ,
+        "FLASK_ENV": "testing",
+        "API_KEY": API_KEY,
+        "OPENAI_API_KEY": "mock-openai-key",
+        "OPENAI_BASE_URL": upstream_url,
+        "OPENAI_MAX_CONNECTIONS": "20",
+        "OPENAI_MAX_KEEPALIVE_CONNECTIONS": "20",
+        "OPENAI_ASYNC_CLIENTS": str(max(1, args.concurrency // 20)),
+        "OPENAI_RETRY_BACKOFF": "0.05",
+        "KEYWORDS_RATE_LIMIT": "1000000 per hour",
+        # Measure the serving modes, not load shedding
+        "UPSTREAM_CONCURRENCY_INITIAL": str(args.concurrency),
+        "CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(port)
+        if args.warmup:
+            asyncio.run(drive(port, args.warmup, args.concurrency, offset=args.requests))
+        result = asyncio.run(drive(port, args.requests, args.concurrency))
+        memory = worker_memory(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"mode": mode, "command": " ".join(command), **result, "memory": memory}
+
+
+def git_commit():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def regressions(results, baseline, tolerance):
+    """Describe each mode whose throughput or latency is worse than the baseline's"""
+    previous = {result["mode"]: result for result in baseline["results"]}
+    found = []
+    for result in results:
+        before = previous.get(result["mode"])
+        if before is None:
+            continue
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            found.append(f"{result['mode']}: rps {before['rps']} -> {result['rps']}")
+        for key in LATENCY_KEYS:
+            if result[key] > before[key] * (1 + tolerance):
+                found.append(f"{result['mode']}: {key} {before[key]} -> {result[key]}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests first")
+    parser.add_argument("--latency", type=float, default=1.0, help="mock upstream latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected upstream errors")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4, help="sync and gthread workers")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gthread worker")
+    parser.add_argument("--async-workers", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="fail if results are worse than this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed regression")
+    args = parser.parse_args()
+
+    results = []
+    with MockOpenAIServer(
+        latency=args.latency, error_rate=args.error_rate, error_status=args.error_status, seed=0
+    ) as upstream:
+        for mode in args.modes:
+            results.append(run_mode(mode, args, upstream.base_url))
+
+    print(
+        f"{'mode':<8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'errors':>8}{'rss MB':>8}"
+    )
+    for result in results:
+        memory = result["memory"]
+        print(
+            f"{result['mode']:<8}{result['rps']:>10}{result['p50_ms']:>10}"
+            f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}"
+            f"{memory['rss_mb'] if memory else '-':>8}"
+        )
+    if args.output:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {
+                key: value for key, value in vars(args).items() if key not in ("output", "baseline")
+            },
+            "latency_s": args.latency,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
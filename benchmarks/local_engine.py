@@ -0,0 +1,82 @@
+"""Measure the per-document cost of the local keyword extraction engine
+
+Runs the offline extractor over synthetic documents of several sizes and
+reports the mean time per document, for comparison with the upstream
+round-trip of the OpenAI engine.
+
+Usage:
+    python benchmarks/local_engine.py --sizes 100 1000 10000 --iterations 200
+    python benchmarks/local_engine.py --corpus-docs 5000   # with IDF weighting
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.corpus import CorpusIndex, corpus  # noqa: E402
+from app.local_extractor import STOPWORDS, LocalExtractor, content_words  # noqa: E402
+
+VOCABULARY = [
+    "search", "engine", "optimization", "keyword", "research", "content", "ranking", "page",
+    "website", "traffic", "backlink", "metadata", "crawler", "index", "query", "snippet",
+    "audience", "conversion", "analytics", "strategy", "marketing", "domain", "authority",
+]  # fmt: skip
+
+
+def synthetic_document(words, seed=0):
+    """Text of roughly ``words`` words mixing content words, stopwords and punctuation"""
+    rng = random.Random(seed)
+    stopwords = sorted(STOPWORDS)
+    tokens = []
+    for i in range(words):
+        tokens.append(rng.choice(VOCABULARY) if rng.random() < 0.6 else rng.choice(stopwords))
+        if i % 12 == 11:
+            tokens[-1] += "."
+    return " ".join(tokens)
+
+
+def measure(extractor, text, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        extractor.extract(text)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--corpus-docs", type=int, default=0, help="weight by IDF over this many documents"
+    )
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    extractor = LocalExtractor(use_idf=args.corpus_docs > 0)
+    if args.corpus_docs:
+        corpus.enabled = True
+        corpus.index = CorpusIndex()
+        for seed in range(args.corpus_docs):
+            corpus.add_document(content_words(synthetic_document(200, seed)))
+    results = []
+    for size in args.sizes:
+        text = synthetic_document(size)
+        seconds = measure(extractor, text, args.iterations)
+        results.append({"words": size, "mean_us": round(seconds * 1e6, 1)})
+
+    print(f"{'words':>8}{'mean us':>12}")
+    for result in results:
+        print(f"{result['words']:>8}{result['mean_us']:>12}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"engine": extractor.model, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
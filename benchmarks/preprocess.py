@@ -0,0 +1,119 @@
+"""Measure the input token reduction and cost of the preprocessing pipeline
+
+Runs the preprocessor over synthetic HTML pages (article text wrapped in
+navigation, scripts, share links and a footer), markdown and plain text, or
+over your own files, and reports estimated input tokens before and after and
+the time per document.
+
+Usage:
+    python benchmarks/preprocess.py --words 800 --iterations 200
+    python benchmarks/preprocess.py --files page1.html page2.md
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.budget import estimate_tokens  # noqa: E402
+from app.preprocess import Preprocessor  # noqa: E402
+from benchmarks.local_engine import synthetic_document  # noqa: E402
+
+PROSE = (
+    "The search engine ranks each page by how well its content answers the query, and "
+    "the strategy that works for one audience is rarely the one that works for another."
+)
+
+
+def paragraphs(words, size=80):
+    tokens = synthetic_document(words).split()
+    chunks = (tokens[start : start + size] for start in range(0, len(tokens), size))  # noqa: E203
+    return [f"{PROSE} {' '.join(chunk)}" for chunk in chunks]
+
+
+def html_page(words):
+    links = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(30))
+    body = "".join(
+        f"<h2>Part {i}</h2><p>{paragraph}</p>"
+        f'<p><a href="#">Share on Twitter</a> <a href="#">Share on Facebook</a></p>'
+        for i, paragraph in enumerate(paragraphs(words))
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Article</title>"
+        "<style>body { font-family: sans-serif; margin: 0 auto; max-width: 40em }</style>"
+        '<script src="/analytics.js"></script></head><body>'
+        f'<nav><ul class="menu">{links}</ul></nav>'
+        f'<main><article class="post"><h1>Article title</h1>{body}</article></main>'
+        '<aside><h3>Related</h3><ul><li><a href="/a">Related article</a></li></ul></aside>'
+        "<footer><p>Copyright 2024 Example Publishing. All rights reserved.</p></footer>"
+        "<script>window.dataLayer = window.dataLayer || []; dataLayer.push({page: 1});</script>"
+        "</body></html>"
+    )
+
+
+def markdown_page(words):
+    sections = "\n\n".join(
+        f"## Part {i}\n\n{paragraph} See [the guide](https://example.com/guide/{i}) "
+        "for **more** details.\n\n- first point\n- second point"
+        for i, paragraph in enumerate(paragraphs(words))
+    )
+    return f"# Article title\n\n{sections}\n"
+
+
+def measure(pipeline, text, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        cleaned, language = pipeline.process(text)
+    seconds = (time.perf_counter() - started) / iterations
+    posted, kept = estimate_tokens(text), estimate_tokens(cleaned)
+    return {
+        "posted_tokens": posted,
+        "cleaned_tokens": kept,
+        "reduction_pct": round(100 * (1 - kept / posted), 1) if posted else 0.0,
+        "language": language,
+        "mean_us": round(seconds * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=800, help="article words per document")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--files", nargs="+", help="measure these documents instead")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.files:
+        documents = {}
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                documents[os.path.basename(path)] = f.read()
+    else:
+        documents = {
+            "html": html_page(args.words),
+            "markdown": markdown_page(args.words),
+            "plain": "\n\n".join(paragraphs(args.words)),
+        }
+    pipeline = Preprocessor()
+    results = [
+        {"document": name, **measure(pipeline, text, args.iterations)}
+        for name, text in documents.items()
+    ]
+
+    print(f"{'document':<16}{'posted':>10}{'cleaned':>10}{'saved %':>10}{'lang':>6}{'us/doc':>10}")
+    for r in results:
+        print(
+            f"{r['document']:<16}{r['posted_tokens']:>10}{r['cleaned_tokens']:>10}"
+            f"{r['reduction_pct']:>10}{r['language'] or '-':>6}{r['mean_us']:>10}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"words": args.words, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Measure app startup time and per-worker memory with and without preloading
+
+For each setting of GUNICORN_PRELOAD, boots gunicorn (reading gunicorn.conf.py)
+with a number of sync workers, serves some local-engine requests and reports:
+the time until the first response, how long a killed worker takes to be
+replaced and answering again (with a single worker, so nothing else answers
+meanwhile), and each worker's RSS, PSS (shared pages split between the
+processes sharing them) and USS (pages only it has). Also times importing and
+building the app in a fresh interpreter, which is what every non-preloaded
+worker pays.
+
+Linux only (reads /proc).
+
+Usage:
+    python benchmarks/startup.py --workers 4 --restarts 5
+    python benchmarks/startup.py --output startup.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.load_test import free_port, wait_until_up, worker_pids  # noqa: E402
+from benchmarks.local_engine import synthetic_document  # noqa: E402
+
+API_KEY = "startup-benchmark-api-key"
+
+
+def import_seconds():
+    """Seconds to import and build the app in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import run; print(time.perf_counter() - t)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=server_env(True), capture_output=True
+    )
+    return float(output.stdout.split()[-1])
+
+
+def server_env(preload):
+    return {
+        **os.environ,
+        "FLASK_ENV": "testing",
+        "API_KEY": API_KEY,
+        "OPENAI_API_KEY": "unused-openai-key",
+        "KEYWORDS_RATE_LIMIT": "1000000 per hour",
+        "LOG_LEVEL": "WARNING",
+        "GUNICORN_PRELOAD": "true" if preload else "false",
+    }
+
+
+def start(preload, workers):
+    port = free_port()
+    command = ["gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "run:app"]
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=ROOT,
+        env=server_env(preload),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_until_up(port, timeout=60.0)
+    return process, port, time.perf_counter() - started
+
+
+def stop(process):
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def memory_kb(pid):
+    """Rss, Pss and private (USS) kB of a process from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def serve(port, requests):
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", headers=headers) as client:
+        for i in range(requests):
+            text = synthetic_document(300, seed=i)
+            client.post("/keywords", json={"text": text, "engine": "local"})
+            client.get("/health")
+
+
+def measure_memory(preload, workers, requests):
+    process, port, boot = start(preload, workers)
+    try:
+        serve(port, requests)
+        pids = worker_pids(process.pid)
+        samples = [memory_kb(pid) for pid in pids]
+    finally:
+        stop(process)
+    return boot, {
+        name: round(sum(sample[name] for sample in samples) / len(samples) / 1024, 1)
+        for name in ("rss", "pss", "uss")
+    }
+
+
+def measure_restarts(preload, restarts):
+    """Mean seconds from killing the only worker until a new one answers"""
+    process, port, _ = start(preload, 1)
+    times = []
+    try:
+        for _ in range(restarts):
+            (pid,) = worker_pids(process.pid)
+            killed = time.perf_counter()
+            os.kill(pid, signal.SIGKILL)
+            while worker_pids(process.pid) in ([pid], []):
+                time.sleep(0.005)
+            wait_until_up(port, timeout=60.0)
+            times.append(time.perf_counter() - killed)
+    finally:
+        stop(process)
+    return sum(times) / len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="requests served first")
+    parser.add_argument("--restarts", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for preload in (False, True):
+        boot, memory = measure_memory(preload, args.workers, args.requests)
+        results.append(
+            {
+                "preload": preload,
+                "boot_s": round(boot, 3),
+                "worker_restart_s": round(measure_restarts(preload, args.restarts), 3),
+                **{f"worker_{name}_mb": value for name, value in memory.items()},
+            }
+        )
+    cold_import = round(import_seconds(), 3)
+
+    print(f"app import and build in a fresh interpreter: {cold_import}s")
+    print(
+        f"{'preload':<10}{'boot s':>10}{'restart s':>12}{'rss MB':>10}{'pss MB':>10}{'uss MB':>10}"
+    )
+    for r in results:
+        print(
+            f"{str(r['preload']):<10}{r['boot_s']:>10}{r['worker_restart_s']:>12}"
+            f"{r['worker_rss_mb']:>10}{r['worker_pss_mb']:>10}{r['worker_uss_mb']:>10}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"workers": args.workers, "import_s": cold_import, "results": results}, f, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
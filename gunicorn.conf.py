@@ -0,0 +1,40 @@
+"""Gunicorn settings, read automatically when gunicorn starts in this directory
+
+The app is built once in the master and warmed up (see app/warmup.py) before
+the workers are forked from it, so they share its memory copy-on-write and a
+restarted or added worker is serving as soon as it's forked. Set
+GUNICORN_PRELOAD=false to have every worker import and build the app itself,
+e.g. to pick up code changes with a HUP.
+"""
+
+import gc
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def loaded_app(server):
+    # asgi:app wraps the Flask app
+    application = server.app.wsgi()
+    return getattr(application, "flask_app", application)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from app.jobs import job_queue
+    from app.warmup import warmup
+
+    warmup(loaded_app(server))
+    # Queued jobs are run by the workers, not the master
+    job_queue.stop()
+    # Move everything built so far out of the collector's reach: collections in
+    # the workers would otherwise write to (and so copy) every page holding it
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app.jobs import job_queue
+
+        job_queue.resume()
@@ -1,5 +1,33 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import httpx
+import openai
 import pytest
 from app import create_app
+from app.auth import hash_key, key_store
+from app.clients import openai_clients
+from tests.mock_openai import MockOpenAIServer
+
+
+def parsed(keywords):
+    """Parsed Responses API result holding the given keywords"""
+    return SimpleNamespace(
+        output_parsed={"keywords": keywords},
+        usage=SimpleNamespace(input_tokens=10, output_tokens=5),
+    )
+
+
+def openai_client(keywords):
+    """Build a mocked OpenAI client returning the given keywords"""
+    client = MagicMock()
+    client.responses.parse.return_value = parsed(keywords)
+    return client
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://upstream/v1"))
 
 
 @pytest.fixture
@@ -19,3 +47,111 @@ def client(app):
 def runner(app):
     """A test runner for the app's Click commands."""
     return app.test_cli_runner()
+
+
+@pytest.fixture
+def mock_openai():
+    """Patch the OpenAI client used for extraction with a mocked one"""
+    with patch("app.keywords.get_openai_client") as mock_get_client:
+        mock_get_client.return_value = openai_client(["mock", "keywords"])
+        yield mock_get_client
+
+
+@pytest.fixture
+def upstream(app):
+    """Point the pooled OpenAI client at a local stub server"""
+    with MockOpenAIServer() as server:
+        app.config["OPENAI_API_KEY"] = "test-openai-key"
+        app.config["OPENAI_BASE_URL"] = server.base_url
+        app.config["OPENAI_RETRY_BACKOFF"] = 0
+        openai_clients.init_app(app)
+        yield server
+        openai_clients.reset()
+
+
+ARTICLE = (
+    "Heat pumps move heat from the air or the ground into a house instead of burning fuel "
+    "to make it, which is why they use a third of the energy of a gas boiler. They work "
+    "best in well insulated homes with large radiators or underfloor heating, and the "
+    "running costs depend on the price of electricity compared with the price of gas. "
+    "Air source pumps are cheaper to install and fit on a wall outside, while ground source "
+    "pumps need a trench or a borehole in the garden but keep working efficiently through "
+    "the coldest weeks of winter. Most installers size the pump from a heat loss survey of "
+    "every room, and grants in many countries cover a large part of the installation cost."
+)
+# The same article after a typo fix and with a byline
+REVISED = ARTICLE.replace("underfloor", "under-floor") + " By Jane Doe."
+
+BEARER_TOKEN = "Bearer dev-api-key-change-in-production"
+
+
+async def call(app, method, path, body=b"", headers=None):
+    """Send one request through an ASGI app and collect the response"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 12345),
+        "http_version": "1.1",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    status = sent[0]["status"]
+    response_headers = {k.decode(): v.decode() for k, v in sent[0]["headers"]}
+    payload = b"".join(m.get("body", b"") for m in sent[1:])
+    return status, response_headers, payload
+
+
+def post_keywords(app, payload, headers=None):
+    """POST a JSON body to /keywords on the ASGI app"""
+    headers = {"Authorization": BEARER_TOKEN, "Content-Type": "application/json", **(headers or {})}
+    return call(app, "POST", "/keywords", json.dumps(payload).encode(), headers)
+
+
+def samples(text):
+    """Parse an exposition into {sample: value}, skipping comments"""
+    lines = [line for line in text.splitlines() if line and not line.startswith("#")]
+    return {name: float(value) for name, value in (line.rsplit(" ", 1) for line in lines)}
+
+
+def write_keys(path, keys, tiers=None):
+    """Write a key file with the given keys stored as digests"""
+    entries = [{"sha256": hash_key(key), **settings} for key, settings in keys.items()]
+    path.write_text(json.dumps({"tiers": tiers or {}, "keys": entries}))
+
+
+@pytest.fixture
+def key_file(app, tmp_path):
+    """Key file with a free-tier key limited to the local engine and a pro key"""
+    path = tmp_path / "keys.json"
+    write_keys(
+        path,
+        {
+            "free-key": {"name": "free client", "tier": "free", "engines": ["local"]},
+            "pro-key": {"name": "pro client", "tier": "pro"},
+        },
+        tiers={
+            "free": {"rate_limit": "2 per hour", "token_budget": "100000 per hour"},
+            "pro": {"rate_limit": "1000 per hour"},
+        },
+    )
+    app.config["API_KEYS_FILE"] = str(path)
+    app.config["API_KEYS_RELOAD_INTERVAL"] = 0
+    key_store.init_app(app)
+    yield path
+    app.config["API_KEYS_FILE"] = ""
+    key_store.init_app(app)
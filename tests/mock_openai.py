@@ -0,0 +1,219 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def response_body(keywords, model="gpt-5-nano"):
+    """Minimal Responses API payload whose output text parses as a KeywordArray"""
+    return {
+        "id": "resp_mock",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [
+            {
+                "type": "message",
+                "id": "msg_mock",
+                "status": "completed",
+                "role": "assistant",
+                "content": [
+                    {
+                        "type": "output_text",
+                        "text": json.dumps({"keywords": keywords}),
+                        "annotations": [],
+                    }
+                ],
+            }
+        ],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": 10,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 5,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": 15,
+        },
+    }
+
+
+def stream_events(keywords, model="gpt-5-nano"):
+    """Responses API streaming events that spell out a KeywordArray one keyword at a time"""
+    final = response_body(keywords, model)
+    message = final["output"][0]
+    text = message["content"][0]["text"]
+    deltas = ['{"keywords": [']
+    deltas += [
+        json.dumps(k) + (", " if i < len(keywords) - 1 else "") for i, k in enumerate(keywords)
+    ]
+    deltas.append("]}")
+    started = {**final, "status": "in_progress", "output": []}
+    empty_message = {**message, "status": "in_progress", "content": []}
+    part = {"type": "output_text", "text": "", "annotations": []}
+    position = {"item_id": message["id"], "output_index": 0, "content_index": 0}
+    events = [
+        {"type": "response.created", "response": started},
+        {"type": "response.output_item.added", "output_index": 0, "item": empty_message},
+        {"type": "response.content_part.added", **position, "part": part},
+    ]
+    events += [
+        {"type": "response.output_text.delta", **position, "delta": delta, "logprobs": []}
+        for delta in deltas
+    ]
+    events += [
+        {"type": "response.output_text.done", **position, "text": text, "logprobs": []},
+        {"type": "response.output_item.done", "output_index": 0, "item": message},
+        {"type": "response.completed", "response": final},
+    ]
+    for sequence_number, event in enumerate(events):
+        event["sequence_number"] = sequence_number
+    return events
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+class MockOpenAIServer:
+    """Local stand-in for the OpenAI Responses API
+
+    Records every request and the client port it arrived on, so tests can check
+    connection reuse. ``latency`` delays each response and ``failures`` is a
+    list of HTTP status codes returned (in order) before requests succeed;
+    after that, ``error_rate`` of the requests get ``error_status`` at random.
+    Streaming requests get one text delta per keyword, ``token_delay`` apart.
+    Model lookups (GET) are recorded separately in ``probes``.
+    """
+
+    def __init__(
+        self,
+        keywords=None,
+        latency=0.0,
+        failures=None,
+        token_delay=0.0,
+        error_rate=0.0,
+        error_status=500,
+        seed=None,
+    ):
+        self.keywords = keywords or ["mock", "keywords"]
+        self.latency = latency
+        self.token_delay = token_delay
+        self.failures = list(failures or [])
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.requests = []
+        self.probes = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def next_status(self):
+        """Status for the next completion request (call with the lock held)"""
+        if self.failures:
+            return self.failures.pop(0)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self.error_status
+        return 200
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; avoid Nagle + delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                # Model lookups, as made by the health checks
+                with server._lock:
+                    server.probes.append(self.path)
+                    status = server.failures.pop(0) if server.failures else 200
+                if server.latency:
+                    time.sleep(server.latency)
+                model = self.path.rsplit("/", 1)[-1]
+                if status == 200:
+                    body = {"id": model, "object": "model", "created": 0, "owned_by": "openai"}
+                else:
+                    body = {"error": {"message": "Injected failure", "type": "server_error"}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests.append(
+                        {
+                            "path": self.path,
+                            "json": payload,
+                            "request_id": self.headers.get("X-Request-ID"),
+                        }
+                    )
+                    server.connections.add(self.client_address)
+                    status = server.next_status()
+                if server.latency:
+                    time.sleep(server.latency)
+                if status == 200 and payload.get("stream"):
+                    self.stream(payload)
+                    return
+                if status == 200:
+                    body = response_body(server.keywords, payload.get("model", "gpt-5-nano"))
+                else:
+                    body = {"error": {"message": "Injected failure", "type": "server_error"}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def stream(self, payload):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for event in stream_events(server.keywords, payload.get("model", "gpt-5-nano")):
+                    if event["type"] == "response.output_text.delta" and server.token_delay:
+                        time.sleep(server.token_delay)
+                    data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                    self.wfile.write(data.encode("utf-8"))
+                    self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.asgi import create_asgi_app
+from app.clients import openai_clients
+from app.near_duplicates import near_duplicates
+from tests.mock_openai import MockOpenAIServer
+from tests.conftest import ARTICLE, BEARER_TOKEN, REVISED, call, post_keywords
+
+
+@pytest.fixture
+def asgi_app():
+    """ASGI app pointed at a local mock upstream"""
+    with MockOpenAIServer(keywords=["async", "keywords"], latency=0.2) as server:
+        app = create_asgi_app("testing")
+        app.flask_app.config["OPENAI_API_KEY"] = "test-openai-key"
+        app.flask_app.config["OPENAI_BASE_URL"] = server.base_url
+        app.flask_app.config["KEYWORDS_RATE_LIMIT"] = "1000 per hour"
+        openai_clients.init_app(app.flask_app)
+        app.upstream = server
+        yield app
+        openai_clients.reset()
+
+
+class TestAsyncKeywords:
+    """Test suite for the async ASGI serving mode"""
+
+    def test_keywords_async(self, asgi_app):
+        """Test that /keywords is served by the async handler"""
+        status, headers, body = asyncio.run(post_keywords(asgi_app, {"text": "async text"}))
+        assert status == 200
+        assert json.loads(body) == {"keywords": ["async", "keywords"]}
+        assert headers["x-cache"] == "MISS"
+
+    def test_raw_text_and_cache(self, asgi_app):
+        """Test raw text bodies and that repeats are served from the shared cache"""
+
+        async def scenario():
+            headers = {"Authorization": BEARER_TOKEN, "Content-Type": "text/plain"}
+            first = await call(asgi_app, "POST", "/keywords", b"plain body", headers)
+            second = await call(asgi_app, "POST", "/keywords", b"plain  body", headers)
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first[0] == 200
+        assert second[1]["x-cache"] == "HIT"
+        assert len(asgi_app.upstream.requests) == 1
+
+    def test_near_duplicate(self, asgi_app):
+        """Test that an almost identical text reuses the cached result"""
+
+        async def scenario():
+            first = await post_keywords(asgi_app, {"text": ARTICLE})
+            second = await post_keywords(asgi_app, {"text": REVISED})
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first[1]["x-cache"] == "MISS"
+        assert second[1]["x-cache"] == "NEAR"
+        assert json.loads(second[2])["similarity"] >= 0.9
+        assert len(asgi_app.upstream.requests) == 1
+
+    def test_signature_is_hashed_off_the_event_loop(self, asgi_app):
+        """Test that MinHash signatures are computed in a worker thread"""
+        threads = []
+        signature = near_duplicates.signature
+
+        def record_thread(text):
+            threads.append(threading.current_thread())
+            return signature(text)
+
+        with patch.object(near_duplicates, "signature", side_effect=record_thread):
+            status, headers, _ = asyncio.run(post_keywords(asgi_app, {"text": ARTICLE}))
+        assert status == 200
+        assert threads and threading.main_thread() not in threads
+
+    def test_upstream_calls_run_concurrently(self, asgi_app):
+        """Test that one process keeps many upstream calls in flight at once"""
+
+        async def scenario():
+            requests = [post_keywords(asgi_app, {"text": f"document {i}"}) for i in range(20)]
+            return await asyncio.gather(*requests)
+
+        started = time.perf_counter()
+        responses = asyncio.run(scenario())
+        elapsed = time.perf_counter() - started
+
+        assert all(status == 200 for status, _, _ in responses)
+        # 20 sequential calls at 0.2s each would take 4s
+        assert elapsed < 2.0
+
+    def test_identical_requests_are_coalesced(self, asgi_app):
+        """Test that identical concurrent requests share one upstream call"""
+
+        async def scenario():
+            requests = [post_keywords(asgi_app, {"text": "same document"}) for _ in range(5)]
+            return await asyncio.gather(*requests)
+
+        responses = asyncio.run(scenario())
+        assert sorted(headers["x-cache"] for _, headers, _ in responses) == [
+            "COALESCED",
+            "COALESCED",
+            "COALESCED",
+            "COALESCED",
+            "MISS",
+        ]
+        assert len(asgi_app.upstream.requests) == 1
+
+    def test_auth_required(self, asgi_app):
+        """Test that the async handler enforces bearer token auth"""
+        status, _, body = asyncio.run(
+            call(asgi_app, "POST", "/keywords", b"text", {"Content-Type": "text/plain"})
+        )
+        assert status == 401
+        assert json.loads(body)["error"] == "Authentication required"
+
+    def test_missing_text(self, asgi_app):
+        """Test validation of empty payloads"""
+        status, _, body = asyncio.run(post_keywords(asgi_app, {"text": "   "}))
+        assert status == 400
+        assert "No text provided" in json.loads(body)["error"]
+
+    def test_deadline(self, asgi_app):
+        """Test that a deadline is validated and cuts the upstream call short"""
+        status, _, body = asyncio.run(
+            post_keywords(asgi_app, {"text": "late"}, {"X-Deadline-Ms": "never"})
+        )
+        assert status == 400
+        assert json.loads(body)["error"] == "Invalid deadline"
+        # The mock upstream takes 200ms, so a 50ms deadline falls back to the local engine
+        status, headers, _ = asyncio.run(
+            post_keywords(asgi_app, {"text": "Tidal power stations", "deadline_ms": 50})
+        )
+        assert status == 200
+        assert headers["x-engine"] == "local"
+
+    def test_invalid_json(self, asgi_app):
+        """Test that malformed JSON is treated as a missing text"""
+        headers = {"Authorization": BEARER_TOKEN, "Content-Type": "application/json"}
+        status, _, _ = asyncio.run(call(asgi_app, "POST", "/keywords", b"{oops", headers))
+        assert status == 400
+
+    def test_json_without_text(self, asgi_app):
+        """Test that JSON bodies that aren't an object with a string text are a 400"""
+        for payload in ("str", [1, 2], {"text": 5}):
+            status, _, body = asyncio.run(post_keywords(asgi_app, payload))
+            assert status == 400
+            assert "No text provided" in json.loads(body)["error"]
+
+    def test_rate_limited(self, asgi_app):
+        """Test that the keywords rate limit applies in async mode"""
+        asgi_app.flask_app.config["KEYWORDS_RATE_LIMIT"] = "1 per hour"
+
+        async def scenario():
+            await post_keywords(asgi_app, {"text": "one"})
+            return await post_keywords(asgi_app, {"text": "two"})
+
+        status, _, body = asyncio.run(scenario())
+        assert status == 429
+        assert json.loads(body)["error"] == "Rate limit exceeded"
+
+    def test_rate_limit_is_shared_with_flask_routes(self, asgi_app):
+        """Test that async /keywords and the Flask keyword routes count against one limit"""
+        asgi_app.flask_app.config["KEYWORDS_RATE_LIMIT"] = "2 per hour"
+        batch = json.dumps({"documents": [{"id": "a", "text": "Wind"}], "engine": "local"})
+        headers = {
+            "Authorization": BEARER_TOKEN,
+            "Content-Type": "application/json",
+            "Content-Length": str(len(batch)),
+        }
+
+        async def scenario():
+            first = await post_keywords(asgi_app, {"text": "one", "engine": "local"})
+            second = await call(asgi_app, "POST", "/keywords/batch", batch.encode(), headers)
+            third = await post_keywords(asgi_app, {"text": "three", "engine": "local"})
+            fourth = await call(asgi_app, "POST", "/keywords/batch", batch.encode(), headers)
+            return [first[0], second[0], third[0], fourth[0]]
+
+        assert asyncio.run(scenario()) == [200, 200, 429, 429]
+
+    def test_upstream_failure(self, asgi_app):
+        """Test that upstream errors are returned as JSON"""
+        asgi_app.flask_app.config["OPENAI_MAX_RETRIES"] = 0
+        openai_clients.init_app(asgi_app.flask_app)
+        asgi_app.upstream.failures = [500]
+        status, _, body = asyncio.run(post_keywords(asgi_app, {"text": "fails"}))
+        assert status == 500
+        assert json.loads(body)["error"] == "Failed to extract keywords"
+
+    def test_local_engine(self, asgi_app):
+        """Test that the engine can be chosen per request in async mode"""
+        status, headers, body = asyncio.run(
+            post_keywords(asgi_app, {"text": "Async keyword extraction", "engine": "local"})
+        )
+        assert status == 200
+        assert headers["x-engine"] == "local"
+        assert json.loads(body) == {"keywords": ["async keyword extraction"]}
+        assert asgi_app.upstream.requests == []
+
+    def test_unknown_engine(self, asgi_app):
+        """Test that unknown engines are rejected in async mode"""
+        for engine in ("nope", ["local"]):
+            status, _, body = asyncio.run(post_keywords(asgi_app, {"text": "t", "engine": engine}))
+            assert status == 400
+            assert json.loads(body)["error"] == "Unknown engine"
+
+    def test_security_headers(self, asgi_app):
+        """Test that async /keywords responses get the security headers Flask responses get"""
+        _, headers, _ = asyncio.run(post_keywords(asgi_app, {"text": "t", "engine": "local"}))
+        flask_headers = asgi_app.flask_app.test_client().get("/").headers
+        for name in ("Content-Security-Policy", "X-Frame-Options", "X-Content-Type-Options"):
+            assert headers[name.lower()] == flask_headers[name]
+
+    def test_https_is_forced_in_production(self):
+        """Test that production redirects plain HTTP /keywords requests to HTTPS"""
+        app = create_asgi_app("production")
+        payload = {"text": "Secure transport", "engine": "local"}
+        status, headers, _ = asyncio.run(post_keywords(app, payload))
+        assert status == 302
+        assert headers["location"] == "https://testserver/keywords"
+
+        status, headers, _ = asyncio.run(
+            post_keywords(app, payload, {"X-Forwarded-Proto": "https"})
+        )
+        assert status == 200
+        assert "strict-transport-security" in headers
+
+    def test_other_routes_fall_through_to_flask(self, asgi_app):
+        """Test that non-keyword routes are served by the Flask app"""
+        status, _, body = asyncio.run(call(asgi_app, "GET", "/health"))
+        assert status == 200
+        assert json.loads(body)["status"] == "healthy"
+
+    def test_lifespan(self, asgi_app):
+        """Test that lifespan events are acknowledged"""
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(asgi_app({"type": "lifespan"}, receive, send))
+        assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
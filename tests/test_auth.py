@@ -1,5 +1,12 @@
+import asyncio
+import json
+import time
 from unittest.mock import patch, MagicMock
 
+from app.asgi import create_asgi_app
+from app.auth import caller_identity, key_store
+from tests.conftest import post_keywords, write_keys
+
 
 class TestBearerTokenAuthentication:
     """Test suite for bearer token authentication"""
@@ -51,6 +58,8 @@ class TestBearerTokenAuthentication:
             # Temporarily remove the API_KEY from config
             original_api_key = app.config.get("API_KEY")
             app.config["API_KEY"] = None
+            # Keys are loaded once, so reload them after changing the config
+            key_store.init_app(app)
 
             try:
                 response = client.post(
@@ -66,6 +75,7 @@ class TestBearerTokenAuthentication:
             finally:
                 # Restore the original API_KEY
                 app.config["API_KEY"] = original_api_key
+                key_store.init_app(app)
 
     def test_valid_token_success(self, client):
         """Test that requests with valid token proceed to the endpoint"""
@@ -118,3 +128,121 @@ class TestBearerTokenAuthentication:
             headers={"Authorization": "Bearer invalid-token"},
         )
         assert response.status_code == 401
+
+
+class TestKeyStore:
+    """Test suite for the hashed, multi-tenant API key store"""
+
+    def test_keys_and_tiers(self, key_file):
+        """Test that keys are found by digest and inherit their tier's settings"""
+        free = key_store.lookup("free-key")
+        assert free.name == "free client"
+        assert free.rate_limit == "2 per hour"
+        assert [str(limit) for limit in free.token_budget] == ["100000 per 1 hour"]
+        assert free.engines == {"local"}
+        assert key_store.lookup("pro-key").engines is None
+        assert key_store.lookup("default-key") is None
+        # The single API_KEY keeps working next to the file
+        assert key_store.lookup("dev-api-key-change-in-production").name == "default"
+        assert len(key_store) == 3
+
+    def test_only_digests_are_kept(self, key_file):
+        """Test that plain keys never need to be stored"""
+        assert "free-key" not in key_file.read_text()
+        assert key_store.lookup("free-key").id == caller_identity("Bearer free-key")
+
+    def test_reload_on_change(self, key_file):
+        """Test that an edited key file is picked up without a restart"""
+        write_keys(key_file, {"new-key": {"name": "new client"}})
+        key_store.maybe_reload()
+        assert key_store.lookup("new-key").name == "new client"
+        assert key_store.lookup("free-key") is None
+
+    def test_broken_reload_keeps_keys(self, key_file):
+        """Test that a half-written key file doesn't lock clients out"""
+        key_file.write_text('{"keys": [')
+        key_store.maybe_reload()
+        assert key_store.lookup("free-key") is not None
+
+    def test_reload_interval(self, app, key_file):
+        """Test that the file is checked at most once per interval"""
+        app.config["API_KEYS_RELOAD_INTERVAL"] = 60
+        key_store.init_app(app)
+        write_keys(key_file, {"new-key": {}})
+        key_store.maybe_reload()
+        assert key_store.lookup("new-key") is None
+
+    def test_authenticate_many_keys(self, app, tmp_path):
+        """Test that lookups stay fast with a large key file"""
+        path = tmp_path / "keys.json"
+        write_keys(path, {f"key-{i}": {} for i in range(20000)})
+        app.config["API_KEYS_FILE"] = str(path)
+        try:
+            key_store.init_app(app)
+            started = time.perf_counter()
+            for i in range(1000):
+                api_key, error = key_store.authenticate(f"Bearer key-{i}")
+                assert error is None
+            assert (time.perf_counter() - started) / 1000 < 0.001
+        finally:
+            app.config["API_KEYS_FILE"] = ""
+            key_store.init_app(app)
+
+
+class TestPerKeyLimits:
+    """Test suite for the limits carried by each API key"""
+
+    def test_engine_not_allowed(self, client, key_file):
+        """Test that keys limited to some engines can't use the others"""
+        response = client.post(
+            "/keywords", json={"text": "text"}, headers={"Authorization": "Bearer free-key"}
+        )
+        assert response.status_code == 403
+        assert response.get_json()["error"] == "Engine not allowed"
+
+        response = client.post(
+            "/keywords",
+            json={"text": "Allowed local extraction", "engine": "local"},
+            headers={"Authorization": "Bearer free-key"},
+        )
+        assert response.status_code == 200
+
+    def test_rate_limit_tier(self, client, key_file):
+        """Test that each key is limited by its tier, counted per key"""
+
+        def post(key):
+            return client.post(
+                "/keywords",
+                json={"text": "Tiered rate limits", "engine": "local"},
+                headers={"Authorization": f"Bearer {key}"},
+            ).status_code
+
+        assert [post("free-key") for _ in range(3)] == [200, 200, 429]
+        assert post("pro-key") == 200
+
+    def test_token_budget_per_key(self, client, key_file):
+        """Test that a key's own token budget applies without a global budget"""
+        response = client.post(
+            "/keywords",
+            json={"text": "Budgeted", "engine": "local"},
+            headers={"Authorization": "Bearer free-key"},
+        )
+        assert response.headers["X-TokenBudget-Limit"] == "100000"
+
+        response = client.post(
+            "/keywords",
+            json={"text": "Unbudgeted", "engine": "local"},
+            headers={"Authorization": "Bearer pro-key"},
+        )
+        assert "X-TokenBudget-Limit" not in response.headers
+
+    def test_async_engine_not_allowed(self, key_file):
+        """Test that the ASGI handler applies the same per-key checks"""
+        asgi_app = create_asgi_app("testing")
+        asgi_app.flask_app.config["API_KEYS_FILE"] = str(key_file)
+        key_store.init_app(asgi_app.flask_app)
+        status, _, body = asyncio.run(
+            post_keywords(asgi_app, {"text": "text"}, {"Authorization": "Bearer free-key"})
+        )
+        assert status == 403
+        assert json.loads(body)["error"] == "Engine not allowed"
@@ -0,0 +1,169 @@
+import json
+from unittest.mock import patch
+
+from app.cli import load_checkpoint, save_checkpoint
+from app.keywords import cached_extract
+from tests.conftest import openai_client
+
+DOCUMENTS = [
+    "Solar panels convert sunlight into electricity for homes.",
+    "Wind turbines generate power on coastal farms.",
+    "Battery storage smooths the output of renewable plants.",
+]
+
+
+def write_jsonl(path, documents):
+    with open(path, "w") as f:
+        for number, text in enumerate(documents):
+            f.write(json.dumps({"id": f"doc-{number}", "text": text}) + "\n")
+    return str(path)
+
+
+def read_output(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def extract(runner, *args, input=None):
+    return runner.invoke(args=["keywords", "extract", "--engine", "local", *args], input=input)
+
+
+class TestExtractCommand:
+    """Test suite for the flask keywords extract command"""
+
+    def test_jsonl_file(self, runner, tmp_path):
+        """Test that each record gets a result line under its id, in input order"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS * 10)
+        output = tmp_path / "out.jsonl"
+        result = extract(runner, source, "-o", str(output), "--workers", "2")
+        assert result.exit_code == 0, result.output
+        lines = read_output(output)
+        assert [line["id"] for line in lines] == [f"doc-{n}" for n in range(30)]
+        assert "sunlight" in lines[0]["keywords"]
+        assert "Extracted 30 records (0 failed)" in result.stderr
+
+    def test_csv_and_text(self, runner, tmp_path):
+        """Test that CSV rows and plain-text lines are records too"""
+        csv_file = tmp_path / "in.csv"
+        csv_file.write_text(f'id,text\na,"{DOCUMENTS[0]}"\nb,"{DOCUMENTS[1]}"\n')
+        text_file = tmp_path / "in.txt"
+        text_file.write_text(f"{DOCUMENTS[2]}\n\n{DOCUMENTS[0]}\n")
+        output = tmp_path / "out.jsonl"
+        result = extract(runner, str(csv_file), str(text_file), "-o", str(output))
+        assert result.exit_code == 0, result.output
+        ids = [line["id"] for line in read_output(output)]
+        assert ids == ["a", "b", f"{text_file}:1", f"{text_file}:3"]
+
+    def test_stdin_to_stdout(self, runner):
+        """Test that JSONL is read from stdin and results written to stdout"""
+        result = extract(runner, input=json.dumps({"text": DOCUMENTS[1]}) + "\n")
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.stdout)["id"] == "-:1"
+
+    def test_invalid_records(self, runner, tmp_path):
+        """Test that bad records get error lines and don't stop the run"""
+        source = tmp_path / "in.jsonl"
+        source.write_text('not json\n{"id": "empty", "text": " "}\n[1]\n')
+        output = tmp_path / "out.jsonl"
+        result = extract(runner, str(source), "-o", str(output))
+        assert result.exit_code == 0, result.output
+        lines = read_output(output)
+        assert [line["error"] for line in lines] == [
+            "Invalid record",
+            "No text provided",
+            "Invalid record",
+        ]
+        assert "(3 failed)" in result.stderr
+
+    def test_extraction_failures(self, runner, tmp_path):
+        """Test that records whose extraction fails get the endpoint's error body"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS[:1])
+        output = tmp_path / "out.jsonl"
+        with patch("app.keywords.get_openai_client") as mock_get_client:
+            mock_get_client.return_value.responses.parse.side_effect = RuntimeError("boom")
+            result = runner.invoke(
+                args=["keywords", "extract", source, "-o", str(output), "--engine", "openai"]
+            )
+        assert result.exit_code == 0, result.output
+        assert read_output(output)[0]["error"] == "Failed to extract keywords"
+
+    def test_upstream_engine(self, runner, tmp_path):
+        """Test that the default engine is used without --engine"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS[:1])
+        output = tmp_path / "out.jsonl"
+        with patch("app.keywords.get_openai_client") as mock_get_client:
+            mock_get_client.return_value = openai_client(["solar"])
+            result = runner.invoke(args=["keywords", "extract", source, "-o", str(output)])
+        assert result.exit_code == 0, result.output
+        assert read_output(output) == [{"id": "doc-0", "keywords": ["solar"]}]
+
+    def test_processes(self, runner, tmp_path):
+        """Test that worker processes give the same output as threads"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS)
+        threads, processes = tmp_path / "threads.jsonl", tmp_path / "processes.jsonl"
+        assert extract(runner, source, "-o", str(threads)).exit_code == 0
+        result = extract(runner, source, "-o", str(processes), "--processes", "--workers", "2")
+        assert result.exit_code == 0, result.output
+        assert processes.read_bytes() == threads.read_bytes()
+
+    def test_usage_errors(self, runner, tmp_path):
+        """Test that an unknown engine, a CSV without text or a stdout checkpoint are refused"""
+        result = runner.invoke(args=["keywords", "extract", "--engine", "missing"])
+        assert result.exit_code == 2
+        csv_file = tmp_path / "in.csv"
+        csv_file.write_text("id,body\na,b\n")
+        result = extract(runner, str(csv_file), "-o", str(tmp_path / "out.jsonl"))
+        assert result.exit_code == 1
+        assert "no 'text' or 'content' column" in result.stderr
+        result = extract(runner, "--checkpoint", str(tmp_path / "progress"), input="")
+        assert result.exit_code == 2
+
+
+class TestResume:
+    """Test suite for carrying on an interrupted extract run"""
+
+    def test_resume_after_interruption(self, runner, tmp_path):
+        """Test that checkpointed records are skipped and later output is rewritten"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS * 2)
+        output = tmp_path / "out.jsonl"
+        checkpoint = f"{output}.checkpoint"
+        assert extract(runner, source, "-o", str(output)).exit_code == 0
+        complete = output.read_bytes()
+        first_two = sum(len(line) for line in complete.splitlines(keepends=True)[:2])
+
+        # A run killed after checkpointing two records but writing part of a third
+        output.write_bytes(complete[: first_two + 10])
+        save_checkpoint(checkpoint, [source], 2, first_two)
+        with patch("app.cli.cached_extract", wraps=cached_extract) as spy:
+            result = extract(runner, source, "-o", str(output), "--checkpoint-every", "1")
+        assert result.exit_code == 0, result.output
+        assert spy.call_count == 4
+        assert output.read_bytes() == complete
+        assert load_checkpoint(checkpoint, [source]) == (6, len(complete))
+
+        # Nothing is left to do
+        result = extract(runner, source, "-o", str(output))
+        assert "Extracted 0 records" in result.stderr
+        assert output.read_bytes() == complete
+
+    def test_restart(self, runner, tmp_path):
+        """Test that --restart ignores the checkpoint"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS)
+        output = tmp_path / "out.jsonl"
+        save_checkpoint(f"{output}.checkpoint", [source], 3, 0)
+        result = extract(runner, source, "-o", str(output), "--restart")
+        assert "Extracted 3 records" in result.stderr
+        assert len(read_output(output)) == 3
+
+    def test_checkpoint_for_other_inputs(self, runner, tmp_path):
+        """Test that a checkpoint isn't applied to different inputs or a missing output"""
+        source = write_jsonl(tmp_path / "in.jsonl", DOCUMENTS)
+        output = tmp_path / "out.jsonl"
+        save_checkpoint(f"{output}.checkpoint", ["other.jsonl"], 1, 10)
+        result = extract(runner, source, "-o", str(output))
+        assert result.exit_code == 1
+        assert "--restart" in result.stderr
+        save_checkpoint(f"{output}.checkpoint", [source], 1, 10)
+        result = extract(runner, source, "-o", str(output))
+        assert result.exit_code == 1
+        assert "is missing" in result.stderr
@@ -0,0 +1,97 @@
+import os
+import runpy
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.cache import SQLiteCacheBackend, response_cache
+from app.limiter import SQLiteStorage
+from app.metrics import SQLiteMetricsStore, metrics
+from app.near_duplicates import near_duplicates
+from app.warmup import warmup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("openai", "pydantic", "httpx")
+
+
+class TestLazyImports:
+    """Test suite for keeping upstream client libraries out of app startup"""
+
+    def test_startup_and_light_routes(self):
+        """Test that building the app and serving / and /health doesn't import them"""
+        code = (
+            "import sys, run\n"
+            "client = run.app.test_client()\n"
+            "assert client.get('/').status_code == 200\n"
+            "assert client.get('/health').status_code == 200\n"
+            f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+        )
+        env = {**os.environ, "FLASK_ENV": "testing", "LOG_LEVEL": "WARNING"}
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        assert output.returncode == 0, output.stderr
+        assert output.stdout.strip() == "[]"
+
+
+class TestWarmup:
+    """Test suite for warming the app up before gunicorn forks workers"""
+
+    def test_warmup_leaves_no_trace(self, app):
+        """Test that warming up doesn't count in metrics or fill the caches"""
+        app.config["OPENAI_API_KEY"] = "test-openai-key"
+        before = metrics.render()
+        warmup(app)
+        assert "openai.resources.responses" in sys.modules
+        assert metrics.render() == before
+        assert response_cache.stats()["size"] == 0
+        assert near_duplicates.stats()["entries"] == 0
+
+    def test_gunicorn_hooks(self, app):
+        """Test that the master warms up and stops job workers, and forked workers resume them"""
+        settings = runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+        assert settings["preload_app"] is True
+        server = SimpleNamespace(
+            cfg=SimpleNamespace(preload_app=True), app=SimpleNamespace(wsgi=lambda: app)
+        )
+        with (
+            patch("app.warmup.warmup") as mock_warmup,
+            patch("app.jobs.job_queue.stop") as stop,
+            patch("gc.freeze") as freeze,
+        ):
+            settings["when_ready"](server)
+        mock_warmup.assert_called_once_with(app)
+        stop.assert_called_once()
+        freeze.assert_called_once()
+        with patch("app.jobs.job_queue.resume") as resume:
+            settings["post_fork"](server, None)
+        resume.assert_called_once()
+
+        server.cfg.preload_app = False
+        with patch("app.warmup.warmup") as mock_warmup:
+            settings["when_ready"](server)
+        mock_warmup.assert_not_called()
+
+
+class TestForkSafety:
+    """Test suite for SQLite connections opened before a fork"""
+
+    @pytest.mark.parametrize(
+        "module, build",
+        [
+            ("cache", lambda path: SQLiteCacheBackend(path)),
+            ("metrics", lambda path: SQLiteMetricsStore(path)),
+            ("limiter", lambda path: SQLiteStorage(f"sqlite:///{path}")),
+        ],
+    )
+    def test_forked_worker_opens_its_own_connection(self, tmp_path, module, build):
+        """Test that a process doesn't reuse the connection its parent opened"""
+        store = build(str(tmp_path / "shared.db"))
+        parent = store._connect()
+        assert store._connect() is parent
+        with patch(f"app.{module}.os.getpid", return_value=os.getpid() + 1):
+            child = store._connect()
+        assert child is not parent